@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measure the GraphiteHandler against a local sink in a child process: one
+write per metric (batch = 1, the old default) and writes coalesced by
+batch_bytes, with the metrics/sec, the writes/sec and the CPU time the
+handler spends per 100k metrics. The line formatting alone is timed too,
+building the format string on each call as before and from LINE_FORMATS.
+
+    ./benchmarks/bench_graphite.py [-n metrics]
+"""
+
+import configobj
+import optparse
+import os
+import resource
+import socket
+import sys
+import time
+import timeit
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.handler.graphite import GraphiteHandler
+from diamond.metric import Metric
+
+
+def sink():
+    """
+    Read from one connection until it is closed, in a child process so its
+    CPU time is not counted. Returns the listening port and the child's pid.
+    """
+    server = socket.socket()
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+    pid = os.fork()
+    if pid == 0:
+        connection, _ = server.accept()
+        while connection.recv(65536):
+            pass
+        os._exit(0)
+    server.close()
+    return port, pid
+
+
+def cpu():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run(metrics, **options):
+    port, pid = sink()
+    config = configobj.ConfigObj()
+    config['host'] = '127.0.0.1'
+    config['port'] = port
+    # Every write a sendall() of its own, so writes are system calls
+    config['transport'] = 'blocking'
+    config['max_latency'] = 0
+    config.update(options)
+
+    handler = GraphiteHandler(config)
+    writes = [0]
+    send_data = handler._send_data
+
+    def counted(data):
+        writes[0] += 1
+        return send_data(data)
+    handler._send_data = counted
+
+    start = time.time()
+    start_cpu = cpu()
+    for metric in metrics:
+        handler.process(metric)
+    handler.flush()
+    handler._close()
+    os.waitpid(pid, 0)
+    elapsed = time.time() - start
+    used = cpu() - start_cpu
+    return (len(metrics) / elapsed, writes[0] / elapsed,
+            used * 100000 / len(metrics))
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=100000,
+                      help='number of metrics to send')
+    (options, args) = parser.parse_args()
+
+    metrics = [Metric('servers.host.cpu.cpu%d.user' % (i % 64), i,
+                      timestamp=1234567, host='host', precision=2)
+               for i in xrange(options.metrics)]
+
+    print '%-24s %12s %12s %14s' % ('', 'metrics/sec', 'writes/sec',
+                                    'CPU/100k (s)')
+    for name, config in (
+            ('batch 1', {'batch': 1, 'batch_bytes': 0}),
+            ('batch 1000', {'batch': 1000, 'batch_bytes': 0}),
+            ('batch_bytes 16384', {'batch': 1000, 'batch_bytes': 16384})):
+        print '%-24s %12d %12d %14.3f' % ((name,) + run(metrics, **config))
+
+    setup = ('from diamond.metric import LINE_FORMATS, Metric; '
+             'metric = Metric("servers.host.cpu.cpu0.user", 1.5, '
+             'timestamp=1234567, host="host", precision=2); str(metric)')
+    number = options.metrics
+    per_call = min(timeit.repeat(
+        '("%%s %%0.%if %%i\\n" % metric.precision) % '
+        '(metric.path, metric.value, metric.timestamp)',
+        setup, number=number, repeat=5))
+    cached = min(timeit.repeat(
+        'LINE_FORMATS[metric.precision] % '
+        '(metric.path, metric.value, metric.timestamp)',
+        setup, number=number, repeat=5))
+    print
+    print 'format per call          %12d lines/sec' % (number / per_call)
+    print 'format from LINE_FORMATS %12d lines/sec' % (number / cached)
+
+
+if __name__ == '__main__':
+    socket.setdefaulttimeout(30)
+    main()
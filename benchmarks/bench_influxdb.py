@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measure the InfluxDB handler's line protocol encoder: points encoded per
+second and bytes held per buffered point, against buffering [time, value]
+lists per path and building one point dict each (the previous 0.9 path, up to
+the client's own conversion), and end to end throughput against a local fake
+/write endpoint with and without gzip.
+
+    ./benchmarks/bench_influxdb.py [-n metrics]
+"""
+
+import BaseHTTPServer
+import configobj
+import gzip
+import optparse
+import os
+import SocketServer
+import sys
+import threading
+import time
+from cStringIO import StringIO
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.handler.influxdbHandler import InfluxdbHandler
+from diamond.handler.influxline import encode
+from diamond.metric import Metric
+
+received = [0]
+
+
+class WriteHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Write the response in one go, or Nagle delays every request
+    wbufsize = -1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        received[0] += body.count('\n')
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def deep_size(obj, seen=None):
+    """
+    Bytes held by obj and everything it references, counting shared objects
+    once
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen) + deep_size(v, seen)
+                    for k, v in obj.iteritems())
+    elif isinstance(obj, (list, tuple)) or hasattr(obj, 'popleft'):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+
+def encode_dicts(metrics):
+    batch = {}
+    for metric in metrics:
+        batch.setdefault(metric.path, []).append([metric.timestamp,
+                                                  metric.value])
+    points = []
+    for path, values in batch.iteritems():
+        for timestamp, value in values:
+            points.append({'measurement': path, 'precision': 's',
+                           'time': timestamp,
+                           'fields': {'value': float(value)}})
+    return batch
+
+
+def encode_lines(metrics):
+    lines = [encode(m.path, m.value, m.timestamp) for m in metrics]
+    ''.join(lines)
+    return lines
+
+
+def run(port, metrics, **options):
+    config = configobj.ConfigObj()
+    config['port'] = port
+    config['influxdb_version'] = '0.9'
+    # Buffer everything and write it in one go, MAX_LINES points a request
+    config['batch_size'] = len(metrics)
+    config['cache_size'] = len(metrics)
+    config.update(options)
+
+    received[0] = 0
+    handler = InfluxdbHandler(config)
+    handler.batch_timestamp = 0
+    start = time.time()
+    for metric in metrics:
+        handler.process(metric)
+    while received[0] < len(metrics):
+        time.sleep(0.001)
+    elapsed = time.time() - start
+    handler._close()
+    return len(metrics) / elapsed
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=100000,
+                      help='number of metrics to send')
+    (options, args) = parser.parse_args()
+
+    metrics = [Metric('servers.host.cpu.cpu%d.user' % (i % 64), i,
+                      timestamp=1234567 + i / 64, host='host')
+               for i in xrange(options.metrics)]
+
+    for name, func in (('dicts per path', encode_dicts),
+                       ('line protocol', encode_lines)):
+        start = time.time()
+        buffered = func(metrics)
+        elapsed = time.time() - start
+        # Count only what the buffer adds, not the metric paths themselves
+        size = deep_size(buffered, set(id(m.path) for m in metrics))
+        print '%-16s %10d points/sec %8.1f bytes/point' % (
+            name, len(metrics) / elapsed, float(size) / len(metrics))
+
+    server = ThreadedHTTPServer(('127.0.0.1', 0), WriteHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    port = server.server_address[1]
+
+    for name, config in (('/write', {}),
+                         ('/write, gzip', {'compression': True})):
+        print '%-16s %10d metrics/sec' % (name, run(port, metrics, **config))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Compare the size and encode/decode time of a batch of metrics sent between
+processes as a pickled list of Metric objects and as a columnar MetricBatch.
+
+    ./benchmarks/bench_metricbatch.py [-n metrics] [-r rounds]
+"""
+
+import cPickle as pickle
+import optparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.metric import Metric
+from diamond.metric import MetricBatch
+
+
+def make_metrics(count):
+    return [Metric('servers.host.cpu.cpu%d.%s' % (i % 64, 'user'), i * 0.5,
+                   raw_value=i, timestamp=1234567, precision=2, host='host',
+                   metric_type='GAUGE')
+            for i in xrange(count)]
+
+
+def timed(func, rounds):
+    start = time.time()
+    for _ in xrange(rounds):
+        result = func()
+    return (time.time() - start) / rounds, result
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=1024,
+                      help='metrics per batch')
+    parser.add_option('-r', '--rounds', type='int', default=200,
+                      help='number of rounds to average over')
+    (options, args) = parser.parse_args()
+
+    metrics = make_metrics(options.metrics)
+
+    def list_encode():
+        return pickle.dumps(metrics, pickle.HIGHEST_PROTOCOL)
+
+    def batch_encode():
+        return pickle.dumps(MetricBatch(metrics), pickle.HIGHEST_PROTOCOL)
+
+    for name, encode in (('list of Metric', list_encode),
+                         ('MetricBatch', batch_encode)):
+        encode_time, data = timed(encode, options.rounds)
+        decode_time, _ = timed(lambda: list(pickle.loads(data)),
+                               options.rounds)
+        print '%-15s %8d bytes  encode %7.2f ms  decode %7.2f ms' % (
+            name, len(data), encode_time * 1000, decode_time * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measure metrics/sec through Collector.publish and publish_counter, with the
+metric path, hostname and TTL resolved once per config load (cached) and
+resolved again for every metric (uncached, as publish used to do).
+
+    ./benchmarks/bench_publish.py [-n metrics]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+import configobj
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.collector import Collector
+
+
+class BenchCollector(Collector):
+
+    def __init__(self, cached, *args, **kwargs):
+        self.cached = cached
+        Collector.__init__(self, *args, **kwargs)
+
+    def get_metric_path(self, name, instance=None):
+        if not self.cached:
+            self._metric_path_parts = None
+            self._metric_paths = {}
+            self._metric_ttl = None
+        return Collector.get_metric_path(self, name, instance=instance)
+
+    def publish_metric(self, metric):
+        pass
+
+
+def get_collector(cached):
+    config = configobj.ConfigObj()
+    config['collectors'] = {}
+    config['collectors']['default'] = {
+        'hostname_method': 'uname_short',
+    }
+    return BenchCollector(cached, config, [])
+
+
+def bench(collector, names, publish):
+    start = time.time()
+    for name in names:
+        publish(name, 42)
+    return len(names) / (time.time() - start)
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=200000,
+                      help='metrics to publish')
+    (options, args) = parser.parse_args()
+
+    names = ['cpu.cpu%d.user' % (i % 256) for i in xrange(options.metrics)]
+
+    for cached in (False, True):
+        collector = get_collector(cached)
+        label = cached and 'cached' or 'uncached'
+        print '%-16s %-8s %10.0f metrics/sec' % (
+            'publish', label, bench(collector, names, collector.publish))
+        print '%-16s %-8s %10.0f metrics/sec' % (
+            'publish_counter', label,
+            bench(collector, names, collector.publish_counter))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measure SentryHandler rule matching: every rule's regular expression tried
+against every metric path (the old behaviour) against the combined
+RuleMatcher, on its first pass over the paths and on a second pass served
+from its cache.
+
+    ./benchmarks/bench_sentry.py [-r rules] [-n paths]
+"""
+
+import optparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.handler.sentry import Rule, RuleMatcher
+
+
+def make_rules(count):
+    rules = []
+    for i in xrange(count):
+        if i % 25 == 0:
+            # Some rules without a literal ending, tried against every path
+            path = r'app%d\.\w+' % i
+        elif i % 2:
+            path = r'app%d\.requests\.[0-9]+xx' % i
+        else:
+            path = 'app%d.latency.p99' % i
+        rules.append(Rule('rule%d' % i, path, max=100))
+    return rules
+
+
+def make_paths(count, rules):
+    metrics = ('requests.2xx', 'requests.5xx', 'latency.p50', 'latency.p99',
+               'gc.count', 'gc.time', 'threads', 'heap.used')
+    return ['servers.host%d.app%d.%s' % (i % 50, i % (rules * 2),
+                                         metrics[i % len(metrics)])
+            for i in xrange(count)]
+
+
+def brute_force(rules, paths):
+    matched = 0
+    for path in paths:
+        for rule in rules:
+            if rule.regexp.match(path):
+                matched += 1
+    return matched
+
+
+def combined(matcher, paths):
+    matched = 0
+    for path in paths:
+        matched += len(matcher.match(path))
+    return matched
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-r', '--rules', type='int', default=500,
+                      help='number of rules')
+    parser.add_option('-n', '--paths', type='int', default=100000,
+                      help='number of metric paths')
+    (options, args) = parser.parse_args()
+
+    rules = make_rules(options.rules)
+    paths = make_paths(options.paths, options.rules)
+    matcher = RuleMatcher(rules, cache_size=options.paths)
+
+    for name, func in (
+            ('every rule', lambda: brute_force(rules, paths)),
+            ('matcher, first pass', lambda: combined(matcher, paths)),
+            ('matcher, cached', lambda: combined(matcher, paths))):
+        start = time.time()
+        matched = func()
+        elapsed = time.time() - start
+        print '%-22s %10d paths/sec %8d matches' % (
+            name, len(paths) / elapsed, matched)
+
+
+if __name__ == '__main__':
+    main()
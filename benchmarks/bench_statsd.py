@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measure StatsiteHandler and StatsdHandler against a local UDP sink:
+metrics/sec, datagrams sent and bytes on the wire (payload plus 28 bytes of
+IP and UDP header per datagram) with one record per datagram (batch = 1, the
+old behaviour) and with records packed up to the MTU.
+
+    ./benchmarks/bench_statsd.py [-n metrics]
+
+StatsdHandler is skipped when the statsd module is not installed.
+"""
+
+import configobj
+import optparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.handler.statsite import StatsiteHandler
+from diamond.metric import Metric
+
+try:
+    from diamond.handler import stats_d
+except SyntaxError:
+    # statsd releases that only support python 3
+    stats_d = None
+
+UDP_HEADER = 28
+
+received = {'datagrams': 0, 'bytes': 0, 'records': 0}
+
+
+def sink(sock):
+    while True:
+        data = sock.recv(65536)
+        received['datagrams'] += 1
+        received['bytes'] += len(data)
+        received['records'] += data.count('\n') + (not data.endswith('\n'))
+
+
+def run(handler_class, port, metrics, **options):
+    config = configobj.ConfigObj()
+    config['host'] = '127.0.0.1'
+    config['port'] = port
+    config['udpport'] = port
+    config.update(options)
+
+    for key in received:
+        received[key] = 0
+    handler = handler_class(config)
+    start = time.time()
+    for metric in metrics:
+        handler.process(metric)
+    handler.flush()
+    elapsed = time.time() - start
+
+    # Give the sink a moment to drain its socket buffer
+    deadline = time.time() + 2
+    while received['records'] < len(metrics) and time.time() < deadline:
+        time.sleep(0.01)
+    return (len(metrics) / elapsed, received['datagrams'],
+            received['bytes'] + received['datagrams'] * UDP_HEADER,
+            received['records'])
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=50000,
+                      help='number of metrics to send')
+    (options, args) = parser.parse_args()
+
+    metrics = [Metric('servers.host.cpu.cpu%d.user' % (i % 64), i,
+                      timestamp=1234567, host='host', metric_type='GAUGE')
+               for i in xrange(options.metrics)]
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    thread = threading.Thread(target=sink, args=(sock,))
+    thread.daemon = True
+    thread.start()
+
+    runs = [('statsite, batch 1', StatsiteHandler, {'batch': 1}),
+            ('statsite, mtu 1432', StatsiteHandler,
+             {'batch': 100, 'mtu': 1432})]
+    if stats_d is not None and stats_d.statsd is not None:
+        runs.extend([
+            ('statsd, batch 1', stats_d.StatsdHandler, {'batch': 1}),
+            ('statsd, mtu 1432', stats_d.StatsdHandler,
+             {'batch': 100, 'mtu': 1432}),
+        ])
+
+    print '%-20s %12s %10s %12s %10s' % ('', 'metrics/sec', 'datagrams',
+                                         'wire bytes', 'received')
+    for name, handler_class, config in runs:
+        print '%-20s %12d %10d %12d %10d' % (
+            (name,) + run(handler_class, port, metrics, **config))
+
+
+if __name__ == '__main__':
+    main()
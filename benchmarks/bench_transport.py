@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Compare metric throughput from a collector process to the handler process
+over the old Manager().Queue proxy (one put per metric) and over the batched
+pipe backed multiprocessing.Queue used by QueueHandler.
+
+    ./benchmarks/bench_transport.py [-n metrics] [-c collectors]
+"""
+
+import configobj
+import multiprocessing
+import optparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.handler.queue import QueueHandler
+from diamond.metric import Metric
+
+
+def make_metrics(count):
+    return [Metric('servers.host.cpu.cpu%d.user' % (i % 64), i,
+                   timestamp=1234567, host='host', metric_type='GAUGE')
+            for i in xrange(count)]
+
+
+def per_metric_producer(queue, metrics):
+    for metric in metrics:
+        queue.put(metric)
+    queue.put(None)
+
+
+def per_metric_consumer(queue, producers):
+    done = 0
+    while done < producers:
+        if queue.get() is None:
+            done += 1
+
+
+def batched_producer(queue, metrics, batch_size):
+    handler = QueueHandler(config=configobj.ConfigObj(), queue=queue,
+                           batch_size=batch_size)
+    for metric in metrics:
+        handler._process(metric)
+    handler._flush()
+    handler.queue.put(None)
+
+
+def batched_consumer(queue, producers):
+    done = 0
+    while done < producers:
+        item = queue.get()
+        if item is None:
+            done += 1
+            continue
+        for metric in item[0]:
+            pass
+
+
+def run(queue, producer, producer_args, consumer, collectors):
+    consumer_proc = multiprocessing.Process(target=consumer,
+                                            args=(queue, collectors))
+    consumer_proc.start()
+    start = time.time()
+    producers = [multiprocessing.Process(target=producer,
+                                         args=(queue,) + producer_args)
+                 for _ in xrange(collectors)]
+    for proc in producers:
+        proc.start()
+    for proc in producers:
+        proc.join()
+    consumer_proc.join()
+    return time.time() - start
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=50000,
+                      help='metrics per collector')
+    parser.add_option('-c', '--collectors', type='int', default=4,
+                      help='number of collector processes')
+    parser.add_option('-b', '--batch', type='int', default=256,
+                      help='metric_batch_size for the batched transport')
+    (options, args) = parser.parse_args()
+
+    metrics = make_metrics(options.metrics)
+    total = options.metrics * options.collectors
+
+    manager = multiprocessing.Manager()
+    elapsed = run(manager.Queue(maxsize=16384), per_metric_producer,
+                  (metrics,), per_metric_consumer, options.collectors)
+    print 'Manager().Queue, per metric:  %10.0f metrics/sec' % (
+        total / elapsed)
+    manager.shutdown()
+
+    elapsed = run(multiprocessing.Queue(maxsize=16384), batched_producer,
+                  (metrics, options.batch), batched_consumer,
+                  options.collectors)
+    print 'multiprocessing.Queue, batch %d: %10.0f metrics/sec' % (
+        options.batch, total / elapsed)
+
+
+if __name__ == '__main__':
+    main()
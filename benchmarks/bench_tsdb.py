@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Measure TSDBHandler throughput against a local fake TSDB: one put line per
+write (batch = 1, the old behaviour), batched put lines, and the /api/put
+bulk mode with and without gzip.
+
+    ./benchmarks/bench_tsdb.py [-n metrics]
+"""
+
+import BaseHTTPServer
+import configobj
+import gzip
+import json
+import optparse
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import time
+from cStringIO import StringIO
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             '..', 'src')))
+
+from diamond.handler.tsdb import TSDBHandler
+from diamond.metric import Metric
+
+received = [0]
+
+
+class LineHandler(SocketServer.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            data = self.request.recv(65536)
+            if not data:
+                return
+            received[0] += data.count('\n')
+
+
+class PutHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Write the response in one go, or Nagle delays every request
+    wbufsize = -1
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        received[0] += len(json.loads(body))
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def serve(server):
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server.server_address[1]
+
+
+def run(port, metrics, **options):
+    config = configobj.ConfigObj()
+    config['host'] = '127.0.0.1'
+    config['port'] = port
+    config.update(options)
+
+    received[0] = 0
+    handler = TSDBHandler(config)
+    start = time.time()
+    for metric in metrics:
+        handler.process(metric)
+    handler.flush()
+    while received[0] < len(metrics):
+        time.sleep(0.001)
+    elapsed = time.time() - start
+    handler._close()
+    return len(metrics) / elapsed
+
+
+def main():
+    parser = optparse.OptionParser()
+    parser.add_option('-n', '--metrics', type='int', default=100000,
+                      help='number of metrics to send')
+    (options, args) = parser.parse_args()
+
+    metrics = [Metric('servers.host.cpu.cpu%d.user' % (i % 64), i,
+                      timestamp=1234567, host='host')
+               for i in xrange(options.metrics)]
+
+    line_port = serve(ThreadedTCPServer(('127.0.0.1', 0), LineHandler))
+    http_port = serve(ThreadedHTTPServer(('127.0.0.1', 0), PutHandler))
+
+    for name, port, config in (
+            ('put lines, batch 1', line_port, {'batch': 1}),
+            ('put lines, batch 500', line_port, {'batch': 500}),
+            ('/api/put', http_port, {'mode': 'http', 'batch': 500}),
+            ('/api/put, gzip', http_port,
+             {'mode': 'http', 'batch': 500, 'compression': True})):
+        print '%-22s %10d metrics/sec' % (name,
+                                          run(port, metrics, **config))
+
+
+if __name__ == '__main__':
+    socket.setdefaulttimeout(30)
+    main()
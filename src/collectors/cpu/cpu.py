@@ -184,10 +184,7 @@ class CPUCollector(diamond.collector.Collector):
                     self.config['xenfix'] = False
 
             # Publish Metric Derivative
-            for metric_name in metrics.keys():
-                self.publish(metric_name,
-                             metrics[metric_name],
-                             precision=2)
+            self.publish_many(metrics, precision=2)
             return True
 
         else:
@@ -4,6 +4,7 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from test import get_published_calls
 from test import unittest
 from mock import Mock
 from mock import patch
@@ -34,14 +35,14 @@ class TestCPUCollector(CollectorTestCase):
 
     @patch('__builtin__.open')
     @patch('os.access', Mock(return_value=True))
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_open_proc_stat(self, publish_mock, open_mock):
         CPUCollector.PROC = '/proc/stat'
         open_mock.return_value = StringIO('')
         self.collector.collect()
         open_mock.assert_called_once_with('/proc/stat')
 
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_work_with_synthetic_data(self, publish_mock):
         patch_open = patch('__builtin__.open', Mock(return_value=StringIO(
             'cpu 100 200 300 400 500 0 0 0 0 0')))
@@ -67,7 +68,7 @@ class TestCPUCollector(CollectorTestCase):
             'total.user': 1.0
         })
 
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_work_with_real_data(self, publish_mock):
         CPUCollector.PROC = self.getFixturePath('proc_stat_1')
         self.collector.collect()
@@ -90,7 +91,7 @@ class TestCPUCollector(CollectorTestCase):
                            defaultpath=self.collector.config['path'])
         self.assertPublishedMany(publish_mock, metrics)
 
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_work_with_ec2_data(self, publish_mock):
         self.collector.config['interval'] = 30
         patch_open = patch('os.path.isdir', Mock(return_value=True))
@@ -116,7 +117,7 @@ class TestCPUCollector(CollectorTestCase):
 
         self.assertPublishedMany(publish_mock, metrics)
 
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_473(self, publish_mock):
         """
         No cpu value should ever be over 100
@@ -137,8 +138,8 @@ class TestCPUCollector(CollectorTestCase):
 
         totals = {}
 
-        for call in publish_mock.mock_calls:
-            call = call[1]
+        for call in get_published_calls(publish_mock):
+            call = call[0]
             if call[0][:6] == 'total.':
                 continue
             if call[1] > 100:
@@ -202,7 +203,7 @@ class TestCPUCollectorNormalize(CollectorTestCase):
                  )
                 )
 
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_work_proc_stat(self, publish_mock):
         patch_open = patch('__builtin__.open', Mock(return_value=StringIO(
             "\n".join([self.input_dict_to_proc_string('', self.input_base),
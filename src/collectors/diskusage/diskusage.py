@@ -274,7 +274,8 @@ class DiskUsageCollector(diamond.collector.Collector):
 
             # Only publish when we have io figures
             if (metrics['io'] > 0 or self.config['send_zero']):
-                for key in metrics:
-                    metric_name = '.'.join([info['device'], key]).replace(
-                        '/', '_')
-                    self.publish(metric_name, metrics[key], precision=3)
+                device = info['device'].replace('/', '_')
+                self.publish_many(
+                    dict(('.'.join([device, key.replace('/', '_')]), value)
+                         for key, value in metrics.iteritems()),
+                    precision=3)
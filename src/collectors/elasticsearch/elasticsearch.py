@@ -415,6 +415,7 @@ class ElasticSearchCollector(diamond.collector.Collector):
             return {}
 
         scheme = self.config['scheme']
-        for alias in sorted(self.instances):
-            (host, port) = self.instances[alias]
-            self.collect_instance(alias, scheme, host, port)
+        self.collect_instances(
+            self.collect_instance,
+            [(alias, scheme) + tuple(self.instances[alias])
+             for alias in sorted(self.instances)])
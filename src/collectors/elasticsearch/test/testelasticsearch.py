@@ -241,14 +241,19 @@ class TestElasticSearchCollector(CollectorTestCase):
         self.collector = ElasticSearchCollector(config, None)
         self.assertEqual(len(self.collector.instances), 2)
 
-        returns = [
-            self.getFixture('stats'),
-            self.getFixture('indices_stats'),
-            self.getFixture('stats2'),
-            self.getFixture('indices_stats2'),
-        ]
+        # Instances are polled concurrently, so answer by url
+        returns = {
+            'http://10.10.10.201:9200/_nodes/_local/stats':
+                self.getFixture('stats'),
+            'http://10.10.10.201:9200/_stats':
+                self.getFixture('indices_stats'),
+            'http://10.10.10.202:9200/_nodes/_local/stats':
+                self.getFixture('stats2'),
+            'http://10.10.10.202:9200/_stats':
+                self.getFixture('indices_stats2'),
+        }
         urlopen_mock = patch('urllib2.urlopen', Mock(
-            side_effect=lambda *args: returns.pop(0)))
+            side_effect=lambda url: returns.pop(url)))
 
         urlopen_mock.start()
         self.collector.collect()
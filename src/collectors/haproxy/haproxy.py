@@ -172,8 +172,9 @@ class HAProxyCollector(diamond.collector.Collector):
     def collect(self):
         if 'servers' in self.config:
             if isinstance(self.config['servers'], list):
-                for serv in self.config['servers']:
-                    self._collect(serv)
+                self.collect_instances(
+                    self._collect,
+                    [(serv,) for serv in self.config['servers']])
             else:
                 self._collect(self.config['servers'])
         else:
@@ -39,9 +39,13 @@ class TestHttpdCollector(CollectorTestCase):
 
         self.HTTPResponse = TestHTTPResponse()
 
-        httplib.HTTPConnection.request = Mock(return_value=True)
-        httplib.HTTPConnection.getresponse = Mock(
-            return_value=self.HTTPResponse)
+        # Tests call setUp() again, the cleanups undo the patches in reverse
+        for p in (patch.object(httplib.HTTPConnection, 'request',
+                               Mock(return_value=True)),
+                  patch.object(httplib.HTTPConnection, 'getresponse',
+                               Mock(return_value=self.HTTPResponse))):
+            p.start()
+            self.addCleanup(p.stop)
 
     def test_import(self):
         self.assertTrue(HttpdCollector)
@@ -106,10 +106,15 @@ class IODriveSNMPCollector(parent_SNMPCollector):
         # Set timestamp
         timestamp = time.time()
 
+        # Get every stat in as few requests as possible
+        data = self.get_many(self.IODRIVE_STATS.values() +
+                             self.IODRIVE_BYTE_STATS.values(),
+                             host, port, community)
+
         for k, v in self.IODRIVE_STATS.items():
             # Get Metric Name and Value
             metricName = '.'.join([k])
-            metricValue = int(self.get(v, host, port, community)[v])
+            metricValue = int(data[v])
 
             # Get Metric Path
             metricPath = '.'.join(['servers', host, device, metricName])
@@ -123,7 +128,7 @@ class IODriveSNMPCollector(parent_SNMPCollector):
         for k, v in self.IODRIVE_BYTE_STATS.items():
             # Get Metric Name and Value
             metricName = '.'.join([k])
-            metricValue = int(self.get(v, host, port, community)[v])
+            metricValue = int(data[v])
 
             # Get Metric Path
             metricPath = '.'.join(['servers', host, device, metricName])
@@ -136,6 +136,11 @@ class MongoDBCollector(diamond.collector.Collector):
         else:
             passwd = None
 
+        # Ensure that the SSL option is a boolean.
+        if type(self.config['ssl']) is str:
+            self.config['ssl'] = str_to_bool(self.config['ssl'])
+
+        instances = []
         for host in hosts:
             matches = re.search('((.+)\@)?(.+)?', host)
             alias = matches.group(2)
@@ -150,76 +155,78 @@ class MongoDBCollector(diamond.collector.Collector):
             else:
                 base_prefix = [alias]
 
+            instances.append((host, base_prefix, user, passwd))
+
+        self.collect_instances(self._collect_host, instances)
+
+    def _collect_host(self, host, base_prefix, user, passwd):
+        """Collect and publish the stats of a single mongod"""
+        try:
+            if ReadPreference is None:
+                conn = pymongo.MongoClient(
+                    host,
+                    socketTimeoutMS=self.config['network_timeout'],
+                    ssl=self.config['ssl'],
+                )
+            else:
+                conn = pymongo.MongoClient(
+                    host,
+                    socketTimeoutMS=self.config['network_timeout'],
+                    ssl=self.config['ssl'],
+                    read_preference=ReadPreference.SECONDARY,
+                )
+        except Exception, e:
+            self.log.error('Couldnt connect to mongodb: %s', e)
+            return
+
+        # try auth
+        if user:
             try:
-                # Ensure that the SSL option is a boolean.
-                if type(self.config['ssl']) is str:
-                    self.config['ssl'] = str_to_bool(self.config['ssl'])
-
-                if ReadPreference is None:
-                    conn = pymongo.MongoClient(
-                        host,
-                        socketTimeoutMS=self.config['network_timeout'],
-                        ssl=self.config['ssl'],
-                    )
-                else:
-                    conn = pymongo.MongoClient(
-                        host,
-                        socketTimeoutMS=self.config['network_timeout'],
-                        ssl=self.config['ssl'],
-                        read_preference=ReadPreference.SECONDARY,
-                    )
+                conn.admin.authenticate(user, passwd)
             except Exception, e:
-                self.log.error('Couldnt connect to mongodb: %s', e)
+                self.log.error(
+                    'User auth given, but could not autheticate' +
+                    ' with host: %s, err: %s' % (host, e))
+                return
+
+        data = conn.db.command('serverStatus')
+        self._publish_transformed(data, base_prefix)
+        if str_to_bool(self.config['simple']):
+            data = self._extract_simple_data(data)
+        if str_to_bool(self.config['replica']):
+            try:
+                replset_data = conn.admin.command('replSetGetStatus')
+                self._publish_replset(replset_data, base_prefix)
+            except pymongo.errors.OperationFailure as e:
+                self.log.error('error getting replica set status', e)
+        self._publish_transformed(data, base_prefix)
+
+        self._publish_dict_with_prefix(data, base_prefix)
+        db_name_filter = re.compile(self.config['databases'])
+        ignored_collections = re.compile(self.config['ignore_collections'])
+        sample_threshold = self.MAX_CRC32 * self.config[
+            'collection_sample_rate']
+        for db_name in conn.database_names():
+            if not db_name_filter.search(db_name):
                 continue
-
-            # try auth
-            if user:
-                try:
-                    conn.admin.authenticate(user, passwd)
-                except Exception, e:
-                    self.log.error(
-                        'User auth given, but could not autheticate' +
-                        ' with host: %s, err: %s' % (host, e))
-                    return{}
-
-            data = conn.db.command('serverStatus')
-            self._publish_transformed(data, base_prefix)
-            if str_to_bool(self.config['simple']):
-                data = self._extract_simple_data(data)
-            if str_to_bool(self.config['replica']):
-                try:
-                    replset_data = conn.admin.command('replSetGetStatus')
-                    self._publish_replset(replset_data, base_prefix)
-                except pymongo.errors.OperationFailure as e:
-                    self.log.error('error getting replica set status', e)
-            self._publish_transformed(data, base_prefix)
-
-            self._publish_dict_with_prefix(data, base_prefix)
-            db_name_filter = re.compile(self.config['databases'])
-            ignored_collections = re.compile(self.config['ignore_collections'])
-            sample_threshold = self.MAX_CRC32 * self.config[
-                'collection_sample_rate']
-            for db_name in conn.database_names():
-                if not db_name_filter.search(db_name):
+            db_stats = conn[db_name].command('dbStats')
+            db_prefix = base_prefix + ['databases', db_name]
+            self._publish_dict_with_prefix(db_stats, db_prefix)
+            for collection_name in conn[db_name].collection_names():
+                if ignored_collections.search(collection_name):
+                    continue
+                if (self.config['collection_sample_rate'] < 1 and (
+                        zlib.crc32(collection_name) & 0xffffffff
+                ) > sample_threshold):
                     continue
-                db_stats = conn[db_name].command('dbStats')
-                db_prefix = base_prefix + ['databases', db_name]
-                self._publish_dict_with_prefix(db_stats, db_prefix)
-                for collection_name in conn[db_name].collection_names():
-                    if ignored_collections.search(collection_name):
-                        continue
-                    if (self.config['collection_sample_rate'] < 1 and (
-                            zlib.crc32(collection_name) & 0xffffffff
-                    ) > sample_threshold):
-                        continue
-
-                    collection_stats = conn[db_name].command('collstats',
-                                                             collection_name)
-                    if str_to_bool(self.config['translate_collections']):
-                        collection_name = collection_name.replace('.', '_')
-                    collection_prefix = db_prefix + [collection_name]
-                    self._publish_dict_with_prefix(collection_stats,
-                                                   collection_prefix)
+
+                collection_stats = conn[db_name].command('collstats',
+                                                         collection_name)
+                if str_to_bool(self.config['translate_collections']):
+                    collection_name = collection_name.replace('.', '_')
+                collection_prefix = db_prefix + [collection_name]
+                self._publish_dict_with_prefix(collection_stats,
+                                               collection_prefix)
 
     def _publish_replset(self, data, base_prefix):
         """ Given a response to replSetGetStatus, publishes all numeric values
@@ -251,22 +258,22 @@ class MongoDBCollector(diamond.collector.Collector):
         """ Publish values of type: counter or percent """
         self._publish_dict_with_prefix(data.get('opcounters', {}),
                                        base_prefix + ['opcounters_per_sec'],
-                                       self.publish_counter)
+                                       self.publish_counters)
         self._publish_dict_with_prefix(data.get('opcountersRepl', {}),
                                        base_prefix +
                                        ['opcountersRepl_per_sec'],
-                                       self.publish_counter)
+                                       self.publish_counters)
         self._publish_metrics(base_prefix + ['backgroundFlushing_per_sec'],
                               'flushes',
                               data.get('backgroundFlushing', {}),
-                              self.publish_counter)
+                              self.publish_counters)
         self._publish_dict_with_prefix(data.get('network', {}),
                                        base_prefix + ['network_per_sec'],
-                                       self.publish_counter)
+                                       self.publish_counters)
         self._publish_metrics(base_prefix + ['extra_info_per_sec'],
                               'page_faults',
                               data.get('extra_info', {}),
-                              self.publish_counter)
+                              self.publish_counters)
 
         def get_dotted_value(data, key_name):
             key_name = key_name.split('.')
@@ -331,24 +338,43 @@ class MongoDBCollector(diamond.collector.Collector):
                         value, time_delta=bool(interval), interval=interval)
 
     def _publish_dict_with_prefix(self, dict, prefix, publishfn=None):
+        values = {}
+        nested = {}
         for key in dict:
-            self._publish_metrics(prefix, key, dict, publishfn)
+            self._gather_metrics(prefix, key, dict, values, nested)
+        self._publish_gathered(values, nested, publishfn)
 
     def _publish_metrics(self, prev_keys, key, data, publishfn=None):
         """Recursively publish keys"""
+        values = {}
+        nested = {}
+        self._gather_metrics(prev_keys, key, data, values, nested)
+        self._publish_gathered(values, nested, publishfn)
+
+    def _gather_metrics(self, prev_keys, key, data, values, nested):
+        """Recursively gather numeric values by metric name. Values of
+        nested keys go into nested, as they are always published as gauges"""
         if key not in data:
             return
         value = data[key]
         keys = prev_keys + [key]
-        if not publishfn:
-            publishfn = self.publish
         if isinstance(value, dict):
             for new_key in value:
-                self._publish_metrics(keys, new_key, value)
+                self._gather_metrics(keys, new_key, value, nested, nested)
         elif isinstance(value, int) or isinstance(value, float):
-            publishfn('.'.join(keys), value)
+            values['.'.join(keys)] = value
         elif isinstance(value, long):
-            publishfn('.'.join(keys), float(value))
+            values['.'.join(keys)] = float(value)
+
+    def _publish_gathered(self, values, nested, publishfn=None):
+        """Publish gathered values as a batch with publishfn (publish_many
+        by default) and nested values as a batch of gauges"""
+        if not publishfn:
+            publishfn = self.publish_many
+        if values:
+            publishfn(values)
+        if nested:
+            self.publish_many(nested)
 
     def _extract_simple_data(self, data):
         return {
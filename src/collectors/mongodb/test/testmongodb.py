@@ -32,7 +32,7 @@ class TestMongoDBCollector(CollectorTestCase):
             'host': 'localhost:27017',
             'databases': '^db'
         })
-        self.collector = MongoDBCollector(config, None)
+        self.collector = MongoDBCollector(config, [])
         self.connection = MagicMock()
 
     def test_import(self):
@@ -40,7 +40,7 @@ class TestMongoDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_nested_keys_for_server_stats(self,
                                                          publish_mock,
                                                          connector_mock):
@@ -57,7 +57,7 @@ class TestMongoDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_nested_keys_for_db_stats(self,
                                                      publish_mock,
                                                      connector_mock):
@@ -79,7 +79,7 @@ class TestMongoDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_stats_with_long_type(self,
                                                  publish_mock,
                                                  connector_mock):
@@ -96,7 +96,7 @@ class TestMongoDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_ignore_unneeded_databases(self,
                                               publish_mock,
                                               connector_mock):
@@ -108,7 +108,7 @@ class TestMongoDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_ignore_unneeded_collections(self,
                                                 publish_mock,
                                                 connector_mock):
@@ -136,7 +136,7 @@ class TestMongoDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_ignore_replset_status_if_disabled(self,
                                                       publish_mock,
                                                       connector_mock):
@@ -160,7 +160,7 @@ class TestMongoMultiHostDBCollector(CollectorTestCase):
             'hosts': ['localhost:27017', 'localhost:27057'],
             'databases': '^db',
         })
-        self.collector = MongoDBCollector(config, None)
+        self.collector = MongoDBCollector(config, [])
         self.connection = MagicMock()
 
     def test_import(self):
@@ -168,7 +168,7 @@ class TestMongoMultiHostDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_nested_keys_for_server_stats(self,
                                                          publish_mock,
                                                          connector_mock):
@@ -187,7 +187,7 @@ class TestMongoMultiHostDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_nested_keys_for_db_stats(self,
                                                      publish_mock,
                                                      connector_mock):
@@ -211,7 +211,7 @@ class TestMongoMultiHostDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_stats_with_long_type(self,
                                                  publish_mock,
                                                  connector_mock):
@@ -230,7 +230,7 @@ class TestMongoMultiHostDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_ignore_unneeded_databases(self,
                                               publish_mock,
                                               connector_mock):
@@ -242,7 +242,7 @@ class TestMongoMultiHostDBCollector(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_ignore_unneeded_collections(self,
                                                 publish_mock,
                                                 connector_mock):
@@ -283,7 +283,7 @@ class TestMongoDBCollectorWithReplica(CollectorTestCase):
             'databases': '^db',
             'replica': True
         })
-        self.collector = MongoDBCollector(config, None)
+        self.collector = MongoDBCollector(config, [])
         self.connection = MagicMock()
 
     def test_import(self):
@@ -291,7 +291,7 @@ class TestMongoDBCollectorWithReplica(CollectorTestCase):
 
     @run_only_if_pymongo_is_available
     @patch('pymongo.MongoClient')
-    @patch.object(Collector, 'publish')
+    @patch.object(Collector, 'publish_many')
     def test_should_publish_replset_status_if_enabled(self,
                                                       publish_mock,
                                                       connector_mock):
@@ -31,6 +31,7 @@ GRANT PROCESS ON *.* TO 'user'@'hostname' IDENTIFIED BY
 import diamond.collector
 from diamond.collector import str_to_bool
 import re
+import threading
 import time
 
 try:
@@ -225,6 +226,8 @@ class MySQLCollector(diamond.collector.Collector):
     innodb_status_match = {}
 
     def __init__(self, *args, **kwargs):
+        # Hosts are polled on separate threads, each with its own connection
+        self._local = threading.local()
         super(MySQLCollector, self).__init__(*args, **kwargs)
         for key in self.innodb_status_keys:
             self.innodb_status_keys[key] = re.compile(
@@ -290,6 +293,14 @@ class MySQLCollector(diamond.collector.Collector):
         })
         return config
 
+    @property
+    def db(self):
+        return getattr(self._local, 'db', None)
+
+    @db.setter
+    def db(self, db):
+        self._local.db = db
+
     def get_db_stats(self, query):
         cursor = self.db.cursor(cursorclass=MySQLdb.cursors.DictCursor)
 
@@ -442,6 +453,7 @@ class MySQLCollector(diamond.collector.Collector):
             self.log.error('Unable to import MySQLdb')
             return False
 
+        instances = []
         for host in self.config['hosts']:
             matches = re.search(
                 '^([^:]*):([^@]*)@([^:]*):?([^/]*)/([^/]*)/?(.*)', host)
@@ -470,21 +482,26 @@ class MySQLCollector(diamond.collector.Collector):
             if params['db'] == 'None':
                 del params['db']
 
-            try:
-                metrics = self.get_stats(params=params)
-            except Exception, e:
-                try:
-                    self.disconnect()
-                except MySQLdb.ProgrammingError:
-                    pass
-                self.log.error('Collection failed for %s %s', nickname, e)
-                continue
+            instances.append((nickname, params))
 
-            # Warn if publish contains an unknown variable
-            if 'publish' in self.config and metrics['status']:
-                for k in self.config['publish'].split():
-                    if k not in metrics['status']:
-                        self.log.error("No such key '%s' available, issue " +
-                                       "'show global status' for a full " +
-                                       "list", k)
-            self._publish_stats(nickname, metrics)
+        self.collect_instances(self._collect_host, instances)
+
+    def _collect_host(self, nickname, params):
+        try:
+            metrics = self.get_stats(params=params)
+        except Exception, e:
+            try:
+                self.disconnect()
+            except MySQLdb.ProgrammingError:
+                pass
+            self.log.error('Collection failed for %s %s', nickname, e)
+            return
+
+        # Warn if publish contains an unknown variable
+        if 'publish' in self.config and metrics['status']:
+            for k in self.config['publish'].split():
+                if k not in metrics['status']:
+                    self.log.error("No such key '%s' available, issue " +
+                                   "'show global status' for a full " +
+                                   "list", k)
+        self._publish_stats(nickname, metrics)
@@ -172,11 +172,16 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
         # Set timestamp
         timestamp = time.time()
 
+        # Get all system OIDs in as few requests as possible
+        systemData = self.get_many(self.NETSCALER_SYSTEM_GUAGES.values() +
+                                   self.NETSCALER_SYSTEM_COUNTERS.values(),
+                                   host, port, community)
+
         # Collect Netscaler System OIDs
         for k, v in self.NETSCALER_SYSTEM_GUAGES.items():
             # Get Metric Name and Value
             metricName = '.'.join([k])
-            metricValue = int(self.get(v, host, port, community)[v])
+            metricValue = int(systemData[v])
             # Get Metric Path
             metricPath = '.'.join(['devices', device, 'system', metricName])
             # Create Metric
@@ -191,8 +196,8 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
             # Get Metric Path
             metricPath = '.'.join(['devices', device, 'system', metricName])
             # Get Metric Value
-            metricValue = self.derivative(metricPath, long(
-                self.get(v, host, port, community)[v]), self.MAX_VALUE)
+            metricValue = self.derivative(metricPath, long(systemData[v]),
+                                          self.MAX_VALUE)
             # Create Metric
             metric = Metric(metricPath, metricValue, timestamp, 0)
             # Publish Metric
@@ -204,45 +209,38 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
 
         for serviceName in serviceNames:
             # Get Service Name in OID form
-            serviceNameOid = self.get_string_index_oid(serviceName)
+            serviceNameOid = self._convert_from_oid(
+                self.get_string_index_oid(serviceName))
 
-            # Get Service Type
+            # Get the type, state and gauges in one go
             serviceTypeOid = ".".join([self.NETSCALER_SERVICE_TYPE,
-                                       self._convert_from_oid(serviceNameOid)])
-            serviceType = int(self.get(serviceTypeOid,
-                                       host,
-                                       port,
-                                       community)[serviceTypeOid].strip("\'"))
+                                       serviceNameOid])
+            serviceStateOid = ".".join([self.NETSCALER_SERVICE_STATE,
+                                        serviceNameOid])
+            serviceGuageOids = dict(
+                (k, ".".join([v, serviceNameOid]))
+                for k, v in self.NETSCALER_SERVICE_GUAGES.items())
+            serviceData = self.get_many(
+                [serviceTypeOid, serviceStateOid] + serviceGuageOids.values(),
+                host, port, community)
 
             # Filter excluded service types
+            serviceType = int(serviceData[serviceTypeOid].strip("\'"))
             if serviceType in map(lambda v: int(v),
                                   self.config.get('exclude_service_type')):
                 continue
 
-            # Get Service State
-            serviceStateOid = ".".join([self.NETSCALER_SERVICE_STATE,
-                                        self._convert_from_oid(serviceNameOid)])
-            serviceState = int(self.get(serviceStateOid,
-                                        host,
-                                        port,
-                                        community)[serviceStateOid].strip("\'"))
-
             # Filter excluded service states
+            serviceState = int(serviceData[serviceStateOid].strip("\'"))
             if serviceState in map(lambda v: int(v),
                                    self.config.get('exclude_service_state')):
                 continue
 
-            for k, v in self.NETSCALER_SERVICE_GUAGES.items():
-                serviceGuageOid = ".".join(
-                    [v, self._convert_from_oid(serviceNameOid)])
+            for k, serviceGuageOid in serviceGuageOids.items():
                 # Get Metric Name
                 metricName = '.'.join([re.sub(r'\.|\\', '_', serviceName), k])
                 # Get Metric Value
-                metricValue = int(self.get(serviceGuageOid,
-                                           host,
-                                           port,
-                                           community
-                                           )[serviceGuageOid].strip("\'"))
+                metricValue = int(serviceData[serviceGuageOid].strip("\'"))
                 # Get Metric Path
                 metricPath = '.'.join(['devices',
                                        device,
@@ -259,45 +257,38 @@ class NetscalerSNMPCollector(parent_SNMPCollector):
 
         for vserverName in vserverNames:
             # Get Vserver Name in OID form
-            vserverNameOid = self.get_string_index_oid(vserverName)
+            vserverNameOid = self._convert_from_oid(
+                self.get_string_index_oid(vserverName))
 
-            # Get Vserver Type
+            # Get the type, state and gauges in one go
             vserverTypeOid = ".".join([self.NETSCALER_VSERVER_TYPE,
-                                       self._convert_from_oid(vserverNameOid)])
-            vserverType = int(self.get(vserverTypeOid,
-                                       host,
-                                       port,
-                                       community)[vserverTypeOid].strip("\'"))
-
-            # filter excluded vserver types
+                                       vserverNameOid])
+            vserverStateOid = ".".join([self.NETSCALER_VSERVER_STATE,
+                                        vserverNameOid])
+            vserverGuageOids = dict(
+                (k, ".".join([v, vserverNameOid]))
+                for k, v in self.NETSCALER_VSERVER_GUAGES.items())
+            vserverData = self.get_many(
+                [vserverTypeOid, vserverStateOid] + vserverGuageOids.values(),
+                host, port, community)
+
+            # Filter excluded vserver types
+            vserverType = int(vserverData[vserverTypeOid].strip("\'"))
             if vserverType in map(lambda v: int(v),
                                   self.config.get('exclude_vserver_type')):
                 continue
 
-            # Get Service State
-            vserverStateOid = ".".join([self.NETSCALER_VSERVER_STATE,
-                                        self._convert_from_oid(vserverNameOid)])
-            vserverState = int(self.get(vserverStateOid,
-                                        host,
-                                        port,
-                                        community)[vserverStateOid].strip("\'"))
-
-            # Filter excluded vserver state
+            # Filter excluded vserver states
+            vserverState = int(vserverData[vserverStateOid].strip("\'"))
             if vserverState in map(lambda v: int(v),
                                    self.config.get('exclude_vserver_state')):
                 continue
 
-            for k, v in self.NETSCALER_VSERVER_GUAGES.items():
-                vserverGuageOid = ".".join(
-                    [v, self._convert_from_oid(vserverNameOid)])
+            for k, vserverGuageOid in vserverGuageOids.items():
                 # Get Metric Name
                 metricName = '.'.join([re.sub(r'\.|\\', '_', vserverName), k])
                 # Get Metric Value
-                metricValue = int(self.get(vserverGuageOid,
-                                           host,
-                                           port,
-                                           community
-                                           )[vserverGuageOid].strip("\'"))
+                metricValue = int(vserverData[vserverGuageOid].strip("\'"))
                 # Get Metric Path
                 metricPath = '.'.join(['devices',
                                        device,
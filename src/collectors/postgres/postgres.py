@@ -14,6 +14,7 @@ from diamond.collector import str_to_bool
 
 try:
     import psycopg2
+    import psycopg2.extensions
     import psycopg2.extras
 except ImportError:
     psycopg2 = None
@@ -24,6 +25,11 @@ class PostgresqlCollector(diamond.collector.Collector):
     PostgreSQL collector class
     """
 
+    def __init__(self, *args, **kwargs):
+        super(PostgresqlCollector, self).__init__(*args, **kwargs)
+        # Open connections, by database name, kept across intervals
+        self.connections = {}
+
     def get_default_config_help(self):
         """
         Return help text for collector
@@ -46,6 +52,8 @@ class PostgresqlCollector(diamond.collector.Collector):
             " eg. in format 9.2",
             'has_admin': 'Admin privileges are required to execute some'
             ' queries.',
+            'persistent_connections': 'Keep one connection per database open'
+            ' between intervals instead of reconnecting for every query',
         })
         return config_help
 
@@ -68,6 +76,7 @@ class PostgresqlCollector(diamond.collector.Collector):
             'metrics': [],
             'pg_version': 9.2,
             'has_admin': True,
+            'persistent_connections': True,
         })
         return config
 
@@ -96,34 +105,48 @@ class PostgresqlCollector(diamond.collector.Collector):
         else:
             metrics = registry['basic']
 
-        # Iterate every QueryStats class
+        klasses = []
         for metric_name in set(metrics):
             if metric_name not in metrics_registry:
                 self.log.error(
                     'metric_name %s not found in metric registry' % metric_name)
                 continue
+            klasses.append(metrics_registry[metric_name])
 
-            for dbase in dbs:
-                conn = self._connect(database=dbase)
+        try:
+            # Run every QueryStats class for a database over one connection.
+            # Setting multi_db to True will run a query on all known
+            # databases. This is bad for queries that hit views like
+            # pg_database, which are shared across databases, so those with
+            # multi_db False only run against the first database.
+            for i, dbase in enumerate(dbs):
+                if i > 0:
+                    klasses = [k for k in klasses if k.multi_db]
+                if not klasses:
+                    break
+
+                conn = self._get_connection(dbase)
                 try:
-                    klass = metrics_registry[metric_name]
-                    stat = klass(dbase, conn,
-                                 underscore=self.config['underscore'])
-                    stat.fetch(self.config['pg_version'])
-                    for metric, value in stat:
-                        if value is not None:
-                            self.publish(metric, value)
-
-                    # Setting multi_db to True will run this query on all known
-                    # databases. This is bad for queries that hit views like
-                    # pg_database, which are shared across databases.
-                    #
-                    # If multi_db is False, bail early after the first query
-                    # iteration. Otherwise, continue to remaining databases.
-                    if stat.multi_db is False:
-                        break
-                finally:
-                    conn.close()
+                    for klass in klasses:
+                        stat = klass(dbase, conn,
+                                     underscore=self.config['underscore'])
+                        stat.fetch(self.config['pg_version'])
+                        for metric, value in stat:
+                            if value is not None:
+                                self.publish(metric, value)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError), e:
+                    # The server went away or the connection broke, the
+                    # next interval will reconnect
+                    self.log.error('Connection to %s failed: %s', dbase, e)
+                    self._close_connection(dbase)
+        finally:
+            if not str_to_bool(self.config['persistent_connections']):
+                self._close_connections()
+
+        # Forget databases that have been dropped
+        for dbase in self.connections.keys():
+            if dbase not in dbs and dbase != self.config['dbname']:
+                self._close_connection(dbase)
 
     def _get_db_names(self):
         """
@@ -134,11 +157,16 @@ class PostgresqlCollector(diamond.collector.Collector):
             WHERE datallowconn AND NOT datistemplate
             AND NOT datname='postgres' AND NOT datname='rdsadmin' ORDER BY 1
         """
-        conn = self._connect(self.config['dbname'])
+        conn = self._get_connection(self.config['dbname'])
         cursor = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        cursor.execute(query)
-        datnames = [d['datname'] for d in cursor.fetchall()]
-        conn.close()
+        try:
+            cursor.execute(query)
+            datnames = [d['datname'] for d in cursor.fetchall()]
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self._close_connection(self.config['dbname'])
+            raise
+        finally:
+            cursor.close()
 
         # Exclude `postgres` database list, unless it is the
         # only database available (required for querying pg_stat_database)
@@ -147,6 +175,35 @@ class PostgresqlCollector(diamond.collector.Collector):
 
         return datnames
 
+    def _get_connection(self, database):
+        """
+        Return the open connection to database, connecting if there is none
+        or the one we had has gone bad
+        """
+        conn = self.connections.get(database)
+        if conn is not None:
+            if ((not conn.closed and conn.get_transaction_status() !=
+                 psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN)):
+                return conn
+            self._close_connection(database)
+
+        conn = self._connect(database=database)
+        self.connections[database] = conn
+        return conn
+
+    def _close_connection(self, database):
+        conn = self.connections.pop(database, None)
+        if conn is None:
+            return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _close_connections(self):
+        for database in self.connections.keys():
+            self._close_connection(database)
+
     def _connect(self, database=None):
         """
         Connect to given database
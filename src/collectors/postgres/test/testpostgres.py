@@ -60,3 +60,39 @@ class TestPostgresqlCollector(CollectorTestCase):
 
         with self.assertRaises(Exception):
             self.collector._connect('test_db')
+
+    @patch('postgres.psycopg2')
+    def test_connections_kept_between_collects(self, psycopg2_mock):
+        def connect(**kwargs):
+            conn = Mock(closed=0)
+            conn.cursor.return_value.fetchall.return_value = []
+            return conn
+        psycopg2_mock.connect.side_effect = connect
+        self.collector.config['metrics'] = ['DatabaseStats', 'UserTableStats']
+        self.collector._get_db_names = Mock(return_value=['db1', 'db2'])
+
+        self.collector.collect()
+        self.collector.collect()
+        self.assertEqual(psycopg2_mock.connect.call_count, 2)
+        self.assertEqual(sorted(self.collector.connections), ['db1', 'db2'])
+
+        # A closed connection is replaced on the next collect
+        self.collector.connections['db1'].closed = 1
+        self.collector.collect()
+        self.assertEqual(psycopg2_mock.connect.call_count, 3)
+
+    @patch('postgres.psycopg2')
+    def test_connections_closed_when_not_persistent(self, psycopg2_mock):
+        config = get_collector_config('PostgresqlCollector', {
+            'persistent_connections': False,
+        })
+        self.collector = PostgresqlCollector(config, None)
+        conn_mock = Mock(closed=0)
+        conn_mock.cursor.return_value.fetchall.return_value = []
+        psycopg2_mock.connect.return_value = conn_mock
+        self.collector._get_db_names = Mock(return_value=['db1'])
+
+        self.collector.collect()
+
+        self.assertEqual(self.collector.connections, {})
+        self.assertTrue(conn_mock.close.called)
@@ -356,6 +356,8 @@ class RedisCollector(diamond.collector.Collector):
             self.log.error('Unable to import module redis')
             return {}
 
+        instances = []
         for nick in self.instances.keys():
             (host, port, unix_socket, auth) = self.instances[nick]
-            self.collect_instance(nick, host, int(port), unix_socket, auth)
+            instances.append((nick, host, int(port), unix_socket, auth))
+        self.collect_instances(self.collect_instance, instances)
@@ -75,9 +75,20 @@ class ServerTechPDUCollector(parent_SNMPCollector):
 
         inputFeeds = {}
 
+        # Walk every table in one go and split the results up by column
+        oids = (self.PDU_SYSTEM_GAUGES.values() + [self.PDU_INFEED_NAMES] +
+                self.PDU_INFEED_GAUGES.values())
+        data = self.walk_many(oids, host, port, community)
+        columns = dict((oid, {}) for oid in oids)
+        for o, value in data.items():
+            for oid in oids:
+                if o.startswith(oid + '.'):
+                    columns[oid][o] = value
+                    break
+
         # Collect PDU input gauge values
         for gaugeName, gaugeOid in self.PDU_SYSTEM_GAUGES.items():
-            systemGauges = self.walk(gaugeOid, host, port, community)
+            systemGauges = columns[gaugeOid]
             for o, gaugeValue in systemGauges.items():
                 # Get Metric Name
                 metricName = gaugeName
@@ -92,8 +103,7 @@ class ServerTechPDUCollector(parent_SNMPCollector):
                 self.publish_metric(metric)
 
         # Collect PDU input feed names
-        inputFeedNames = self.walk(
-            self.PDU_INFEED_NAMES, host, port, community)
+        inputFeedNames = columns[self.PDU_INFEED_NAMES]
         for o, inputFeedName in inputFeedNames.items():
             # Extract input feed name
             inputFeed = ".".join(o.split(".")[-2:])
@@ -101,7 +111,7 @@ class ServerTechPDUCollector(parent_SNMPCollector):
 
         # Collect PDU input gauge values
         for gaugeName, gaugeOid in self.PDU_INFEED_GAUGES.items():
-            inputFeedGauges = self.walk(gaugeOid, host, port, community)
+            inputFeedGauges = columns[gaugeOid]
             for o, gaugeValue in inputFeedGauges.items():
                 # Extract input feed name
                 inputFeed = ".".join(o.split(".")[-2:])
@@ -10,6 +10,8 @@ SNMPCollector is a special collector for collecting data by using SNMP
 """
 
 import socket
+import threading
+import time
 
 import warnings
 
@@ -31,15 +33,53 @@ except ImportError:
 warnings.showwarning = old_showwarning
 
 import diamond.collector
+from diamond.collector import str_to_bool
+from diamond.error import DiamondException
 
 
 class SNMPCollector(diamond.collector.Collector):
+    """
+    Base class for collectors polling the devices in their devices section
+    over SNMP. Subclasses implement collect_snmp(device, host, port,
+    community), which is called for up to max_concurrency devices at a time.
+    """
+
+    def __init__(self, *args, **kwargs):
+        # Devices are polled on separate threads, each with its own command
+        # generator and deadline
+        self._local = threading.local()
+        super(SNMPCollector, self).__init__(*args, **kwargs)
+
+    @property
+    def snmpCmdGen(self):
+        try:
+            return self._local.snmpCmdGen
+        except AttributeError:
+            self._local.snmpCmdGen = cmdgen.CommandGenerator()
+            return self._local.snmpCmdGen
+
+    @snmpCmdGen.setter
+    def snmpCmdGen(self, snmpCmdGen):
+        self._local.snmpCmdGen = snmpCmdGen
+
+    def process_config(self):
+        super(SNMPCollector, self).process_config()
+        # Auth and transport objects by (host, port, community), built once
+        # and reused for every request until the config is reloaded
+        self._targets = {}
 
     def get_default_config_help(self):
         config_help = super(SNMPCollector, self).get_default_config_help()
         config_help.update({
             'timeout': 'Seconds before timing out the snmp connection',
             'retries': 'Number of times to retry before bailing',
+            'bulk': 'Walk with GETBULK, turn off for SNMPv1 only devices',
+            'max_repetitions': 'Rows asked for in each GETBULK request',
+            'max_varbinds': 'OIDs asked for in each GET request',
+            'device_timeout': 'Seconds after which polling a device is'
+                              ' given up on',
+            'devices': 'Devices to poll, each a section with a host, port'
+                       ' and community',
         })
         return config_help
 
@@ -50,9 +90,65 @@ class SNMPCollector(diamond.collector.Collector):
         default_config['path_prefix'] = 'systems'
         default_config['timeout'] = 5
         default_config['retries'] = 3
+        default_config['bulk'] = True
+        default_config['max_repetitions'] = 25
+        default_config['max_varbinds'] = 32
+        default_config['max_concurrency'] = 16
+        default_config['device_timeout'] = 30
+        default_config['devices'] = {}
         # Return default config
         return default_config
 
+    def collect(self):
+        """
+        Poll every configured device
+        """
+        if cmdgen is None:
+            self.log.error('Unable to import pysnmp')
+            return
+
+        self.collect_instances(self._collect_device,
+                               [(device,) for device in
+                                sorted(self.config['devices'])])
+
+    def collect_snmp(self, device, host, port, community):
+        """
+        Collect the metrics of a single device
+        """
+        raise NotImplementedError()
+
+    def _collect_device(self, device):
+        """
+        Run collect_snmp for a device and publish how long it took and
+        whether it failed
+        """
+        dev_config = self.config['devices'][device]
+        host = dev_config['host']
+        port = int(dev_config.get('port', 161))
+        community = dev_config.get('community', 'public')
+
+        start = time.time()
+        self._local.deadline = start + float(self.config['device_timeout'])
+        failed = 0
+        try:
+            self.collect_snmp(device, host, port, community)
+        except Exception, e:
+            self.log.error('%s: polling %s failed: %s', self.name, device, e)
+            failed = 1
+        finally:
+            self._local.deadline = None
+
+        path = '.'.join(['devices', device, 'snmp'])
+        self.publish_gauge(path + '.collection_time',
+                           (time.time() - start) * 1000, precision=1)
+        self.publish_gauge(path + '.collection_failed', failed)
+
+    def _check_deadline(self, host):
+        deadline = getattr(self._local, 'deadline', None)
+        if deadline is not None and time.time() > deadline:
+            raise DiamondException('%s: gave up on %s after %s seconds' % (
+                self.name, host, self.config['device_timeout']))
+
     def _convert_to_oid(self, s):
         d = s.split(".")
         return tuple([int(x) for x in d])
@@ -60,37 +156,76 @@ class SNMPCollector(diamond.collector.Collector):
     def _convert_from_oid(self, oid):
         return ".".join([str(x) for x in oid])
 
-    def get(self, oid, host, port, community):
+    def _get_target(self, host, port, community):
         """
-        Perform SNMP get for a given OID
+        Return the SNMP auth and transport data for a device
         """
-        # Initialize return value
-        ret = {}
-
-        # Convert OID to tuple if necessary
-        if not isinstance(oid, tuple):
-            oid = self._convert_to_oid(oid)
+        key = (host, port, community)
+        try:
+            return self._targets[key]
+        except KeyError:
+            pass
 
-        # Convert Host to IP if necessary
-        host = socket.gethostbyname(host)
+        # Convert Host to IP once, rather than for every request
+        address = (socket.gethostbyname(host), int(port))
 
         # Assemble SNMP Auth Data
         snmpAuthData = cmdgen.CommunityData('agent', community)
 
         # Assemble SNMP Transport Data
         snmpTransportData = cmdgen.UdpTransportTarget(
-            (host, port),
+            address,
             int(self.config['timeout']),
             int(self.config['retries']))
 
-        # Assemble SNMP Next Command
-        result = self.snmpCmdGen.getCmd(snmpAuthData, snmpTransportData, oid)
-        varBind = result[3]
+        self._targets[key] = (snmpAuthData, snmpTransportData)
+        return self._targets[key]
+
+    def get(self, oid, host, port, community):
+        """
+        Perform SNMP get for a given OID
+        """
+        return self.get_many([oid], host, port, community)
 
-        # TODO: Error check
+    def get_many(self, oids, host, port, community):
+        """
+        Perform SNMP get for a list of OIDs, asking for up to max_varbinds
+        of them in each request
+        """
+        # Initialize return value
+        ret = {}
 
-        for o, v in varBind:
-            ret[o.prettyPrint()] = v.prettyPrint()
+        # Convert OIDs to tuples if necessary
+        oids = [oid if isinstance(oid, tuple) else self._convert_to_oid(oid)
+                for oid in oids]
+
+        snmpAuthData, snmpTransportData = self._get_target(host, port,
+                                                           community)
+
+        step = max(int(self.config['max_varbinds']), 1)
+        chunks = [oids[i:i + step] for i in xrange(0, len(oids), step)]
+        while chunks:
+            self._check_deadline(host)
+            chunk = chunks.pop(0)
+            result = self.snmpCmdGen.getCmd(snmpAuthData, snmpTransportData,
+                                            *chunk)
+            errorIndication, errorStatus, errorIndex, varBind = result
+
+            if errorIndication:
+                # No point in sending anything more to a device that's not
+                # answering
+                raise DiamondException('SNMP get from %s failed: %s' % (
+                    host, errorIndication))
+
+            if errorStatus and len(chunk) > 1:
+                # The response was too big, or (SNMPv1) one OID failed the
+                # whole request, so ask again in halves
+                half = len(chunk) // 2
+                chunks[:0] = [chunk[:half], chunk[half:]]
+                continue
+
+            for o, v in varBind:
+                ret[o.prettyPrint()] = v.prettyPrint()
 
         return ret
 
@@ -98,35 +233,47 @@ class SNMPCollector(diamond.collector.Collector):
         """
         Perform an SNMP walk on a given OID
         """
+        return self.walk_many([oid], host, port, community)
+
+    def walk_many(self, oids, host, port, community):
+        """
+        Perform an SNMP walk on a list of OIDs at the same time, such as the
+        columns of a table, using GETBULK unless bulk is turned off
+        """
         # Initialize return value
         ret = {}
 
-        # Convert OID to tuple if necessary
-        if not isinstance(oid, tuple):
-            oid = self._convert_to_oid(oid)
-
-        # Convert Host to IP if necessary
-        host = socket.gethostbyname(host)
-
-        # Assemble SNMP Auth Data
-        snmpAuthData = cmdgen.CommunityData('agent', community)
-
-        # Assemble SNMP Transport Data
-        snmpTransportData = cmdgen.UdpTransportTarget(
-            (host, port),
-            int(self.config['timeout']),
-            int(self.config['retries']))
-
-        # Assemble SNMP Next Command
-        resultTable = self.snmpCmdGen.nextCmd(snmpAuthData,
-                                              snmpTransportData,
-                                              oid)
+        # Convert OIDs to tuples if necessary
+        oids = [oid if isinstance(oid, tuple) else self._convert_to_oid(oid)
+                for oid in oids]
+
+        snmpAuthData, snmpTransportData = self._get_target(host, port,
+                                                           community)
+
+        self._check_deadline(host)
+
+        # Assemble SNMP Next or Bulk Command
+        if str_to_bool(self.config['bulk']):
+            resultTable = self.snmpCmdGen.bulkCmd(
+                snmpAuthData, snmpTransportData, 0,
+                int(self.config['max_repetitions']), *oids)
+        else:
+            resultTable = self.snmpCmdGen.nextCmd(snmpAuthData,
+                                                  snmpTransportData,
+                                                  *oids)
+        errorIndication = resultTable[0]
         varBindTable = resultTable[3]
 
-        # TODO: Error Check
+        if errorIndication:
+            raise DiamondException('SNMP walk of %s failed: %s' % (
+                host, errorIndication))
 
         for varBindTableRow in varBindTable:
             for o, v in varBindTableRow:
+                # The last GETBULK response can run past the subtree
+                name = tuple(o)
+                if not any(name[:len(oid)] == oid for oid in oids):
+                    continue
                 ret[o.prettyPrint()] = v.prettyPrint()
 
         return ret
@@ -4,10 +4,24 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from mock import Mock
+from mock import patch
 
 from snmp import SNMPCollector
 
 
+class OID(tuple):
+
+    def prettyPrint(self):
+        return '.'.join(str(x) for x in self)
+
+
+class Value(str):
+
+    def prettyPrint(self):
+        return str(self)
+
+
 class TestSNMPCollector(CollectorTestCase):
 
     def setUp(self, allowed_names=None):
@@ -21,3 +35,100 @@ class TestSNMPCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPCollector)
+
+    @patch('snmp.cmdgen')
+    @patch('socket.gethostbyname', Mock(return_value='10.0.0.1'))
+    def test_get_many_batches_oids(self, cmdgen_mock):
+        self.collector.config['max_varbinds'] = 2
+        self.collector.snmpCmdGen = Mock()
+        self.collector.snmpCmdGen.getCmd.side_effect = (
+            lambda auth, transport, *oids:
+            (None, 0, 0, [(OID(o), Value(o[-1])) for o in oids]))
+
+        oids = ['1.3.6.1.%d' % i for i in range(5)]
+        self.assertEqual(
+            self.collector.get_many(oids, 'switch1', 161, 'public'),
+            dict((oid, oid[-1]) for oid in oids))
+        self.assertEqual(self.collector.snmpCmdGen.getCmd.call_count, 3)
+
+        # The transport is built, and the host resolved, only once
+        self.collector.get('1.3.6.1.0', 'switch1', 161, 'public')
+        self.assertEqual(cmdgen_mock.UdpTransportTarget.call_count, 1)
+        cmdgen_mock.UdpTransportTarget.assert_called_once_with(
+            ('10.0.0.1', 161), 5, 3)
+
+    @patch('snmp.cmdgen', Mock())
+    @patch('socket.gethostbyname', Mock(return_value='10.0.0.1'))
+    def test_get_many_splits_failed_requests(self):
+        def getCmd(auth, transport, *oids):
+            if len(oids) > 1:
+                return (None, 'tooBig', 0, [])
+            return (None, 0, 0, [(OID(oids[0]), Value('1'))])
+        self.collector.snmpCmdGen = Mock()
+        self.collector.snmpCmdGen.getCmd.side_effect = getCmd
+
+        oids = ['1.3.6.1.%d' % i for i in range(3)]
+        self.assertEqual(
+            self.collector.get_many(oids, 'switch1', 161, 'public'),
+            dict((oid, '1') for oid in oids))
+
+    @patch('snmp.cmdgen', Mock())
+    @patch('socket.gethostbyname', Mock(return_value='10.0.0.1'))
+    def test_walk_uses_bulk_and_stays_in_subtree(self):
+        self.collector.snmpCmdGen = Mock()
+        self.collector.snmpCmdGen.bulkCmd.return_value = (None, 0, 0, [
+            [(OID((1, 3, 6, 1, 2, 1)), Value('a'))],
+            [(OID((1, 3, 6, 1, 2, 2)), Value('b'))],
+            [(OID((1, 3, 6, 1, 3, 1)), Value('c'))],
+        ])
+
+        self.assertEqual(
+            self.collector.walk('1.3.6.1.2', 'switch1', 161, 'public'),
+            {'1.3.6.1.2.1': 'a', '1.3.6.1.2.2': 'b'})
+        self.assertFalse(self.collector.snmpCmdGen.nextCmd.called)
+
+    @patch('snmp.cmdgen', Mock())
+    @patch('socket.gethostbyname', Mock(return_value='10.0.0.1'))
+    def test_collect_polls_every_device(self):
+        self.collector.config['devices'] = {
+            'switch1': {'host': 'switch1', 'community': 'public'},
+            'switch2': {'host': 'switch2', 'port': '1161'},
+            'dead': {'host': 'dead'},
+        }
+
+        def collect_snmp(device, host, port, community):
+            if device == 'dead':
+                self.collector.snmpCmdGen = Mock()
+                self.collector.snmpCmdGen.getCmd.return_value = (
+                    'requestTimedOut', 0, 0, [])
+                self.collector.get('1.3.6.1', host, port, community)
+            self.collector.publish(device + '.up', 1)
+        self.collector.collect_snmp = Mock(side_effect=collect_snmp)
+        self.collector.publish_metrics = Mock()
+
+        self.collector.collect()
+
+        self.collector.collect_snmp.assert_any_call(
+            'switch2', 'switch2', 1161, 'public')
+        published = {}
+        for call in self.collector.publish_metrics.call_args_list:
+            for metric in call[0][0]:
+                published[metric.path] = metric.value
+        path = self.collector.get_metric_path
+        self.assertEqual(published[path('switch1.up')], 1)
+        self.assertEqual(
+            published[path('devices.switch1.snmp.collection_failed')], 0)
+        self.assertEqual(
+            published[path('devices.dead.snmp.collection_failed')], 1)
+        self.assertFalse(path('dead.up') in published)
+        self.assertTrue(path('devices.dead.snmp.collection_time') in published)
+
+    @patch('snmp.cmdgen', Mock())
+    @patch('socket.gethostbyname', Mock(return_value='10.0.0.1'))
+    def test_device_timeout(self):
+        self.collector.snmpCmdGen = Mock()
+        self.collector._local.deadline = 0
+
+        self.assertRaises(Exception, self.collector.walk, '1.3.6.1',
+                          'switch1', 161, 'public')
+        self.assertFalse(self.collector.snmpCmdGen.bulkCmd.called)
@@ -122,25 +122,30 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
         # Log
         self.log.info("Collecting SNMP interface statistics from: %s", device)
 
-        # Define a list of interface indexes
-        ifIndexes = []
-
-        # Get Interface Indexes
-        ifIndexOid = '.'.join([self.IF_MIB_INDEX_OID])
-        ifIndexData = self.walk(ifIndexOid, host, port, community)
-        ifIndexes = [v for v in ifIndexData.values()]
+        # Walk the interface types, the OIDs end in the interface index
+        ifTypeData = self.walk(self.IF_MIB_TYPE_OID, host, port, community)
+        ifIndexes = sorted(
+            oid[len(self.IF_MIB_TYPE_OID) + 1:]
+            for oid, ifType in ifTypeData.items()
+            if ifType in self.IF_TYPES)
+
+        # Get names and counters of the interfaces we care about in as few
+        # requests as possible
+        oids = []
+        for ifIndex in ifIndexes:
+            oids.append('.'.join([self.IF_MIB_NAME_OID, ifIndex]))
+            for gaugeOid in self.IF_MIB_GAUGE_OID_TABLE.values():
+                oids.append('.'.join([gaugeOid, ifIndex]))
+            for counterOid in self.IF_MIB_COUNTER_OID_TABLE.values():
+                oids.append('.'.join([counterOid, ifIndex]))
+        ifData = self.get_many(oids, host, port, community)
 
         for ifIndex in ifIndexes:
-            # Get Interface Type
-            ifTypeOid = '.'.join([self.IF_MIB_TYPE_OID, ifIndex])
-            ifTypeData = self.get(ifTypeOid, host, port, community)
-            if ifTypeData[ifTypeOid] not in self.IF_TYPES:
-                # Skip Interface
-                continue
             # Get Interface Name
             ifNameOid = '.'.join([self.IF_MIB_NAME_OID, ifIndex])
-            ifNameData = self.get(ifNameOid, host, port, community)
-            ifName = ifNameData[ifNameOid]
+            ifName = ifData.get(ifNameOid)
+            if ifName is None:
+                continue
             # Remove quotes from string
             ifName = re.sub(r'(\"|\')', '', ifName)
 
@@ -148,8 +153,7 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
             for gaugeName, gaugeOid in self.IF_MIB_GAUGE_OID_TABLE.items():
                 ifGaugeOid = '.'.join([self.IF_MIB_GAUGE_OID_TABLE[gaugeName],
                                        ifIndex])
-                ifGaugeData = self.get(ifGaugeOid, host, port, community)
-                ifGaugeValue = ifGaugeData[ifGaugeOid]
+                ifGaugeValue = ifData.get(ifGaugeOid)
                 if not ifGaugeValue:
                     continue
 
@@ -170,8 +174,7 @@ class SNMPInterfaceCollector(parent_SNMPCollector):
             for counterName, counterOid in counterItems:
                 ifCounterOid = '.'.join(
                     [self.IF_MIB_COUNTER_OID_TABLE[counterName], ifIndex])
-                ifCounterData = self.get(ifCounterOid, host, port, community)
-                ifCounterValue = ifCounterData[ifCounterOid]
+                ifCounterValue = ifData.get(ifCounterOid)
                 if not ifCounterValue:
                     continue
 
@@ -4,6 +4,7 @@
 
 from test import CollectorTestCase
 from test import get_collector_config
+from mock import Mock
 
 from snmpinterface import SNMPInterfaceCollector
 
@@ -19,3 +20,26 @@ class TestSNMPInterfaceCollector(CollectorTestCase):
 
     def test_import(self):
         self.assertTrue(SNMPInterfaceCollector)
+
+    def test_collect_snmp_fetches_interfaces_together(self):
+        collector = self.collector
+        collector.walk = Mock(return_value={
+            '1.3.6.1.2.1.2.2.1.3.1': '6',
+            '1.3.6.1.2.1.2.2.1.3.2': '24',
+        })
+        collector.get_many = Mock(return_value={
+            '1.3.6.1.2.1.31.1.1.1.1.1': '"eth0"',
+            '1.3.6.1.2.1.2.2.1.14.1': '3',
+        })
+        collector.publish_gauge = Mock()
+        collector.publish_counter = Mock()
+
+        collector.collect_snmp('switch1', 'switch1', 161, 'public')
+
+        self.assertEqual(collector.get_many.call_count, 1)
+        oids = collector.get_many.call_args[0][0]
+        self.assertTrue('1.3.6.1.2.1.31.1.1.1.1.1' in oids)
+        self.assertFalse([oid for oid in oids if oid.endswith('.2')])
+        collector.publish_gauge.assert_called_once_with(
+            'devices.switch1.interface.eth0.ifInErrors', 3)
+        self.assertFalse(collector.publish_counter.called)
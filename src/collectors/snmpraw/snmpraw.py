@@ -123,35 +123,42 @@ class SNMPRawCollector(parent_SNMPCollector):
         value = data.items()[0][1]
         return value
 
-    def _get_value(self, device, oid, host, port, community):
-        data = self.get(oid, host, port, community)
-
-        if data is None:
-            self._skip(device, oid, 'device down (#1)')
-            return
+    def _get_values(self, device, oids, host, port, community):
+        """
+        Return the values of a list of OIDs, fetched with as few requests as
+        possible, leaving out (and muting) the ones that failed
+        """
+        data = self.get_many(oids, host, port, community)
 
         self.log.debug('Data received from GET \'{0}\': [{1}]'.format(
             device, data))
 
-        if len(data) == 0:
-            self._skip(device, oid, 'empty response, device down?')
-            return
-
-        if oid not in data:
-            # oid is not even in hierarchy, happens when using 9.9.9.9
-            # but not when using 1.9.9.9
-            self._skip(device, oid, 'no object at OID (#1)')
-            return
-
-        value = data[oid]
-        if value == 'No Such Object currently exists at this OID':
-            self._skip(device, oid, 'no object at OID (#2)')
-            return
+        values = {}
+        for oid in oids:
+            if len(data) == 0:
+                self._skip(device, oid, 'empty response, device down?')
+                continue
+
+            if oid not in data:
+                # oid is not even in hierarchy, happens when using 9.9.9.9
+                # but not when using 1.9.9.9
+                self._skip(device, oid, 'no object at OID (#1)')
+                continue
+
+            value = data[oid]
+            if value == 'No Such Object currently exists at this OID':
+                self._skip(device, oid, 'no object at OID (#2)')
+                continue
+
+            if value == 'No Such Instance currently exists at this OID':
+                value = self._get_value_walk(device, oid, host, port,
+                                             community)
+                if value is None:
+                    continue
 
-        if value == 'No Such Instance currently exists at this OID':
-            return self._get_value_walk(device, oid, host, port, community)
+            values[oid] = value
 
-        return value
+        return values
 
     def collect_snmp(self, device, host, port, community):
         """
@@ -162,18 +169,23 @@ class SNMPRawCollector(parent_SNMPCollector):
 
         dev_config = self.config['devices'][device]
         if 'oids' in dev_config:
+            oids = []
             for oid, metricName in dev_config['oids'].items():
-
                 if (device, oid) in self.skip_list:
                     self.log.debug(
                         'Skipping OID \'{0}\' ({1}) on device \'{2}\''.format(
                             oid, metricName, device))
                     continue
+                oids.append(oid)
 
-                timestamp = time.time()
-                value = self._get_value(device, oid, host, port, community)
-                if value is None:
+            timestamp = time.time()
+            values = self._get_values(device, oids, host, port, community)
+
+            for oid in oids:
+                if oid not in values:
                     continue
+                metricName = dev_config['oids'][oid]
+                value = values[oid]
 
                 self.log.debug(
                     '\'{0}\' ({1}) on device \'{2}\' - value=[{3}]'.format(
@@ -26,7 +26,8 @@ class TestSNMPRawCollector(CollectorTestCase):
 
     @patch.object(Collector, 'publish_metric')
     @patch.object(time, 'time', Mock(return_value=1000))
-    @patch.object(SNMPRawCollector, '_get_value', Mock(return_value=5))
+    @patch.object(SNMPRawCollector, '_get_values',
+                  Mock(return_value={'1.1.1.1': 5}))
     def test_metric(self, collect_mock):
         test_config = {'devices': {'test': {'oids': {'1.1.1.1': 'test'}}}}
         self.collector.config.update(test_config)
@@ -39,12 +40,26 @@ class TestSNMPRawCollector(CollectorTestCase):
 
         self.assertEqual(metric.metric_type, 'GAUGE')
         self.assertEqual(metric.ttl, None)
-        self.assertEqual(metric.value, self.collector._get_value())
+        self.assertEqual(metric.value, 5)
         self.assertEqual(metric.precision, self.collector._precision(5))
         self.assertEqual(metric.host, None)
         self.assertEqual(metric.path, path)
         self.assertEqual(metric.timestamp, 1000)
 
+    def test_get_values_mutes_missing_oids(self):
+        self.collector.get_many = Mock(return_value={
+            '1.1.1.1': '5',
+            '1.1.1.2': 'No Such Object currently exists at this OID',
+        })
+
+        values = self.collector._get_values(
+            'test', ['1.1.1.1', '1.1.1.2', '1.1.1.3'], None, None, None)
+
+        self.assertEqual(values, {'1.1.1.1': '5'})
+        self.assertEqual(self.collector.get_many.call_count, 1)
+        self.assertEqual(self.collector.skip_list,
+                         [('test', '1.1.1.2'), ('test', '1.1.1.3')])
+
 
 ###############################################################################
 if __name__ == "__main__":
@@ -11,7 +11,9 @@ import logging
 import configobj
 import time
 import re
+import signal
 import subprocess
+import threading
 
 from diamond.metric import Metric
 from diamond.utils.config import load_config
@@ -26,6 +28,9 @@ if platform.architecture()[0] == '64bit':
 else:
     MAX_COUNTER = (2 ** 32) - 1
 
+# Maximum number of metric names a collector keeps resolved paths for
+METRIC_PATH_CACHE_SIZE = 65536
+
 
 def get_hostname(config, method=None):
     """
@@ -160,6 +165,10 @@ class Collector(object):
     The Collector class is a base class for all metric collectors.
     """
 
+    # Metrics published from collect_instances() threads are held back here,
+    # per thread, until the calling thread publishes them
+    _instance_local = None
+
     def __init__(self, config=None, handlers=[], name=None, configfile=None):
         """
         Create a new instance of the Collector class
@@ -174,6 +183,9 @@ class Collector(object):
 
         self.handlers = handlers
         self.last_values = {}
+        # The last collect_instances() thread of each instance, to tell one
+        # still running from an earlier run
+        self.instance_threads = {}
 
         self.configfile = None
         self.load_config(configfile, config)
@@ -212,6 +224,13 @@ class Collector(object):
 
         self.process_config()
 
+        # Forget metric paths resolved from the previous config, they are
+        # resolved again on the next publish
+        self._metric_path_parts = None
+        self._metric_paths = {}
+        self._metric_host = None
+        self._metric_ttl = None
+
     def process_config(self):
         """
         Intended to put any code that should be run after any config reload
@@ -254,6 +273,11 @@ class Collector(object):
                                  'Mutually exclusive with metrics_blacklist',
             'metrics_blacklist': 'Regex to match metrics to block. ' +
                                  'Mutually exclusive with metrics_whitelist',
+            'max_concurrency': 'Number of instances a multi-instance ' +
+                               'collector polls at the same time',
+            'instance_timeout': 'Seconds to wait for each instance of a ' +
+                                'multi-instance collector to be polled, ' +
+                                '0 for 80% of the interval',
         }
 
     def get_default_config(self):
@@ -306,6 +330,13 @@ class Collector(object):
 
             # Blacklist of metrics to let through
             'metrics_blacklist': None,
+
+            # Number of instances polled at the same time by collectors
+            # that support more than one instance
+            'max_concurrency': 8,
+
+            # Deadline for polling all instances, 0 for 80% of the interval
+            'instance_timeout': 0,
         }
 
     def get_metric_path(self, name, instance=None):
@@ -315,20 +346,46 @@ class Collector(object):
             virtual machine and should have a different
             root prefix.
         """
+        try:
+            return self._metric_paths[(name, instance)]
+        except KeyError:
+            pass
+
+        if self._metric_path_parts is None:
+            self._metric_path_parts = self._get_metric_path_parts()
+        prefix, path, instance_prefix = self._metric_path_parts
+
+        if instance is not None:
+            if path == '.':
+                metric_path = '.'.join([instance_prefix, instance, name])
+            else:
+                metric_path = '.'.join([instance_prefix, instance, path, name])
+        elif path == '.':
+            metric_path = '.'.join([prefix, name])
+        else:
+            metric_path = '.'.join([prefix, path, name])
+
+        if len(self._metric_paths) >= METRIC_PATH_CACHE_SIZE:
+            self._metric_paths.clear()
+        self._metric_paths[(name, instance)] = metric_path
+
+        return metric_path
+
+    def _get_metric_path_parts(self):
+        """
+        Resolve the parts of the metric path that only depend on the config:
+        the prefix (including hostname and suffix), the collector path and
+        the instance prefix
+        """
         if 'path' in self.config:
             path = self.config['path']
         else:
             path = self.__class__.__name__
 
-        if instance is not None:
-            if 'instance_prefix' in self.config:
-                prefix = self.config['instance_prefix']
-            else:
-                prefix = 'instances'
-            if path == '.':
-                return '.'.join([prefix, instance, name])
-            else:
-                return '.'.join([prefix, instance, path, name])
+        if 'instance_prefix' in self.config:
+            instance_prefix = self.config['instance_prefix']
+        else:
+            instance_prefix = 'instances'
 
         if 'path_prefix' in self.config:
             prefix = self.config['path_prefix']
@@ -351,10 +408,7 @@ class Collector(object):
         if suffix:
             prefix = '.'.join((prefix, suffix))
 
-        if path == '.':
-            return '.'.join([prefix, name])
-        else:
-            return '.'.join([prefix, path, name])
+        return prefix, path, instance_prefix
 
     def get_hostname(self):
         return get_hostname(self.config)
@@ -370,42 +424,195 @@ class Collector(object):
         """
         Publish a metric with the given name
         """
+        metric = self._create_metric(name, value, raw_value, precision,
+                                     metric_type, instance)
+
+        # Publish Metric
+        if metric is not None:
+            self.publish_metric(metric)
+
+    def publish_many(self, values, precision=0, metric_type='GAUGE',
+                     instance=None):
+        """
+        Publish a dict of metric names to values, handing them to the
+        handlers as a single batch
+        """
+        timestamp = int(time.time())
+        metrics = []
+        for name, value in values.iteritems():
+            metric = self._create_metric(name, value, None, precision,
+                                         metric_type, instance, timestamp)
+            if metric is not None:
+                metrics.append(metric)
+
+        self.publish_metrics(metrics)
+
+    def _create_metric(self, name, value, raw_value, precision, metric_type,
+                       instance, timestamp=None):
+        """
+        Create the Metric for a published value, or return None if the
+        whitelist/blacklist filters it out
+        """
         # Check whitelist/blacklist
         if self.config['metrics_whitelist']:
             if not self.config['metrics_whitelist'].match(name):
-                return
+                return None
         elif self.config['metrics_blacklist']:
             if self.config['metrics_blacklist'].match(name):
-                return
+                return None
 
         # Get metric Path
         path = self.get_metric_path(name, instance=instance)
 
-        # Get metric TTL
-        ttl = float(self.config['interval']) * float(
-            self.config['ttl_multiplier'])
+        # Get metric TTL and host, resolved once per config load
+        if self._metric_ttl is None:
+            self._metric_ttl = float(self.config['interval']) * float(
+                self.config['ttl_multiplier'])
+            self._metric_host = self.get_hostname()
 
         # Create Metric
         try:
-            metric = Metric(path, value, raw_value=raw_value, timestamp=None,
-                            precision=precision, host=self.get_hostname(),
-                            metric_type=metric_type, ttl=ttl)
+            return Metric(path, value, raw_value=raw_value,
+                          timestamp=timestamp, precision=precision,
+                          host=self._metric_host, metric_type=metric_type,
+                          ttl=self._metric_ttl)
         except DiamondException:
             self.log.error(('Error when creating new Metric: path=%r, '
                             'value=%r'), path, value)
             raise
 
-        # Publish Metric
-        self.publish_metric(metric)
-
     def publish_metric(self, metric):
         """
         Publish a Metric object
         """
+        if self._instance_local is not None:
+            held = getattr(self._instance_local, 'metrics', None)
+            if held is not None:
+                held.append(metric)
+                return
+
         # Process Metric
         for handler in self.handlers:
             handler._process(metric)
 
+    def publish_metrics(self, metrics):
+        """
+        Publish a list of Metric objects as a single batch
+        """
+        if not metrics:
+            return
+
+        if self._instance_local is not None:
+            held = getattr(self._instance_local, 'metrics', None)
+            if held is not None:
+                held.extend(metrics)
+                return
+
+        for handler in self.handlers:
+            handler._process_batch(metrics)
+
+    def collect_instances(self, func, instances):
+        """
+        Call func(*args) for every tuple of args in instances, polling up to
+        max_concurrency of them at the same time, so one slow instance does
+        not hold up the rest.
+
+        Metrics published by func are handed to the handlers from the calling
+        thread as soon as its instance is done. An instance still running
+        after instance_timeout, or when the alarm collector_process set for
+        this run is about to go off, is logged, anything it publishes is
+        dropped, and it is skipped on later runs until its thread has
+        finished. An exception raised by func is logged and does not affect
+        the other instances.
+        """
+        instances = list(instances)
+        max_concurrency = min(int(self.config['max_concurrency']),
+                              len(instances))
+        if max_concurrency <= 1:
+            for args in instances:
+                self._collect_instance(func, args)
+            return
+
+        timeout = float(self.config['instance_timeout'])
+        if timeout <= 0:
+            timeout = float(self.config['interval']) * 0.8
+        # Give up in time to hand over what finished before the alarm goes
+        # off and the whole run is abandoned
+        alarm = signal.getitimer(signal.ITIMER_REAL)[0]
+        if alarm > 0:
+            cutoff = time.time() + alarm * 0.9
+        else:
+            cutoff = None
+
+        if self._instance_local is None:
+            self._instance_local = threading.local()
+
+        results = [None] * len(instances)
+        done = threading.Event()
+
+        def worker(i, args):
+            # Each thread publishes into a list of its own, so a thread that
+            # is given up on can not publish into a later run
+            self._instance_local.metrics = []
+            try:
+                self._collect_instance(func, args)
+            finally:
+                results[i] = self._instance_local.metrics
+                self._instance_local.metrics = None
+                done.set()
+
+        pending = []
+        for i, args in enumerate(instances):
+            thread = self.instance_threads.get(args[0])
+            if thread is not None and thread.is_alive():
+                self.log.error('%s: instance %s is still being polled from '
+                               'an earlier run, skipping it', self.name,
+                               args[0])
+                continue
+            pending.append(i)
+        pending.reverse()
+
+        running = {}
+        while pending or running:
+            done.clear()
+            now = time.time()
+            for i, (thread, started, deadline) in running.items():
+                if not thread.is_alive():
+                    del running[i]
+                    self.publish_metrics(results[i])
+                elif now >= deadline:
+                    self.log.error('%s: instance %s did not finish within '
+                                   '%.1f seconds', self.name, instances[i][0],
+                                   now - started)
+                    del running[i]
+            if cutoff is not None and now >= cutoff:
+                for i in reversed(pending):
+                    self.log.error('%s: no time left to poll instance %s',
+                                   self.name, instances[i][0])
+                pending = []
+            while pending and len(running) < max_concurrency:
+                i = pending.pop()
+                thread = threading.Thread(
+                    target=worker, args=(i, instances[i]),
+                    name='%s-%s' % (self.name, instances[i][0]))
+                thread.daemon = True
+                self.instance_threads[instances[i][0]] = thread
+                deadline = now + timeout
+                if cutoff is not None:
+                    deadline = min(deadline, cutoff)
+                running[i] = (thread, now, deadline)
+                thread.start()
+            if running:
+                done.wait(max(min(deadline for thread, started, deadline
+                                  in running.itervalues()) - now, 0))
+
+    def _collect_instance(self, func, args):
+        try:
+            func(*args)
+        except Exception:
+            self.log.exception('%s: collecting instance %s failed',
+                               self.name, args[0])
+
     def publish_gauge(self, name, value, precision=0, instance=None):
         return self.publish(name, value, precision=precision,
                             metric_type='GAUGE', instance=instance)
@@ -422,6 +629,27 @@ class Collector(object):
                             precision=precision, metric_type='COUNTER',
                             instance=instance)
 
+    def publish_counters(self, values, precision=0, max_value=0,
+                         time_delta=True, interval=None, allow_negative=False,
+                         instance=None):
+        """
+        Publish the derivatives of a dict of counter names to raw values,
+        handing them to the handlers as a single batch
+        """
+        timestamp = int(time.time())
+        metrics = []
+        for name, raw_value in values.iteritems():
+            value = self.derivative(name, raw_value, max_value=max_value,
+                                    time_delta=time_delta, interval=interval,
+                                    allow_negative=allow_negative,
+                                    instance=instance)
+            metric = self._create_metric(name, value, raw_value, precision,
+                                         'COUNTER', instance, timestamp)
+            if metric is not None:
+                metrics.append(metric)
+
+        self.publish_metrics(metrics)
+
     def derivative(self, name, new, max_value=0,
                    time_delta=True, interval=None,
                    allow_negative=False, instance=None):
@@ -1,11 +1,83 @@
 # coding=utf-8
 
 import logging
+import os
+import random
+import socket
 import threading
 import traceback
 from configobj import ConfigObj
 import time
 
+from spill import SpillLog
+
+
+class CircuitBreaker(object):
+    """
+    Keeps a handler from trying to reach a sink that is down on every send.
+
+    The breaker starts closed and allows every attempt. `threshold` failures
+    in a row open it, and allow() then returns False until `backoff` seconds
+    have passed. After that it is half-open: allow() lets one attempt
+    through per delay, success() closes the breaker and failure() opens it
+    again with the delay doubled, up to `max_backoff`. Each delay is
+    shortened by a random fraction of up to `jitter`, so handlers that lost
+    the same sink don't all come back at the same moment.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold=1, backoff=1.0, max_backoff=60.0,
+                 jitter=0.5):
+        self.threshold = threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.state = self.CLOSED
+        self.failures = 0
+        self.delay = backoff
+        self.retry_at = 0
+
+    def allow(self):
+        """
+        Return whether to attempt reaching the sink now
+        """
+        if self.state == self.CLOSED:
+            return True
+        now = time.time()
+        if now < self.retry_at:
+            return False
+        # Allow the next trial after another delay, in case nothing reports
+        # how this one went
+        self.state = self.HALF_OPEN
+        self.retry_at = now + self._jittered(self.delay)
+        return True
+
+    def success(self):
+        """
+        Record that the sink was reached
+        """
+        self.state = self.CLOSED
+        self.failures = 0
+        self.delay = self.backoff
+
+    def failure(self):
+        """
+        Record that the sink could not be reached
+        """
+        self.failures += 1
+        if self.state == self.HALF_OPEN:
+            self.delay = min(self.delay * 2, self.max_backoff)
+        elif self.failures < self.threshold:
+            return
+        self.state = self.OPEN
+        self.retry_at = time.time() + self._jittered(self.delay)
+
+    def _jittered(self, delay):
+        return delay * (1 - self.jitter * random.random())
+
 
 class Handler(object):
     """
@@ -40,6 +112,22 @@ class Handler(object):
             self.config['server_error_interval'])
         self._errors = {}
 
+        # Optional on disk spill log for data the sink can not take right now
+        self.spill = None
+        if self.config['spill_path']:
+            self.spill = SpillLog(
+                os.path.join(self.config['spill_path'], self._spill_name()),
+                max_size=int(self.config['spill_max_size']),
+                segment_size=int(self.config['spill_segment_size']),
+                replay_rate=float(self.config['spill_replay_rate']),
+                log=self.log)
+
+        # Stops reconnect attempts while the sink is down
+        self.breaker = self._new_breaker()
+        # (host, port, family, socktype) -> (expiry, getaddrinfo result)
+        self.dns_cache_ttl = float(self.config['dns_cache_ttl'])
+        self._addrinfo = {}
+
         # Initialize Lock
         self.lock = threading.Lock()
 
@@ -51,6 +139,28 @@ class Handler(object):
             'get_default_config_help': 'get_default_config_help',
             'server_error_interval': ('How frequently to send repeated server '
                                       'errors'),
+            'buffer_size': ('How many metrics to buffer for this handler '
+                            'while it is busy sending'),
+            'overflow_policy': ('What to do when the buffer is full: '
+                                'drop_oldest, drop_newest or block'),
+            'spill_path': ('Directory to spill data to while the sink is '
+                           'down, for handlers that support it. Empty '
+                           'disables spilling'),
+            'spill_max_size': 'Maximum size of the spill log in bytes',
+            'spill_segment_size': 'Size of each spill log segment in bytes',
+            'spill_replay_rate': ('Maximum number of spilled records per '
+                                  'second to replay once the sink is back'),
+            'breaker_threshold': ('How many connection failures in a row '
+                                  'stop further attempts for a while'),
+            'breaker_backoff': ('Seconds to wait before trying a sink that '
+                                'is down again, doubled after each failed '
+                                'try'),
+            'breaker_max_backoff': ('The longest to wait between tries of a '
+                                    'sink that is down, in seconds'),
+            'breaker_jitter': ('Fraction of each wait to randomly take '
+                               'off, between 0 and 1'),
+            'dns_cache_ttl': ('How long to reuse a DNS lookup of the sink, '
+                              'in seconds'),
         }
 
     def get_default_config(self):
@@ -60,8 +170,65 @@ class Handler(object):
         return {
             'get_default_config': 'get_default_config',
             'server_error_interval': 120,
+            'buffer_size': 16384,
+            'overflow_policy': 'drop_oldest',
+            'spill_path': '',
+            'spill_max_size': 104857600,
+            'spill_segment_size': 4194304,
+            'spill_replay_rate': 1000,
+            'breaker_threshold': 1,
+            'breaker_backoff': 1,
+            'breaker_max_backoff': 60,
+            'breaker_jitter': 0.5,
+            'dns_cache_ttl': 300,
         }
 
+    def _spill_name(self):
+        """
+        Return the name of the spill log directory under spill_path. Handlers
+        of the same class, such as those of a MultiGraphiteHandler, each
+        need a log of their own, so it includes the destination from the
+        host and port options when there are any.
+        """
+        parts = [self.__class__.__name__]
+        for key in ('host', 'port'):
+            value = self.config.get(key)
+            if isinstance(value, list):
+                value = ','.join(value)
+            if value:
+                parts.append(str(value).replace(os.sep, '_'))
+        return '-'.join(parts)
+
+    def _new_breaker(self):
+        """
+        Return a CircuitBreaker set up from the config, for handlers that
+        need one per destination
+        """
+        return CircuitBreaker(
+            threshold=int(self.config['breaker_threshold']),
+            backoff=float(self.config['breaker_backoff']),
+            max_backoff=float(self.config['breaker_max_backoff']),
+            jitter=float(self.config['breaker_jitter']))
+
+    def _getaddrinfo(self, host, port, family=0, socktype=0):
+        """
+        socket.getaddrinfo, reusing the result for dns_cache_ttl seconds. If
+        a lookup fails the last result is used while there is one.
+        """
+        key = (host, port, family, socktype)
+        cached = self._addrinfo.get(key)
+        now = time.time()
+        if cached is not None and now < cached[0]:
+            return cached[1]
+        try:
+            addrinfo = socket.getaddrinfo(host, port, family, socktype)
+        except socket.gaierror:
+            if cached is None:
+                raise
+            return cached[1]
+        self._addrinfo[key] = (now + self.dns_cache_ttl, addrinfo)
+        return addrinfo
+
     def _process(self, metric):
         """
         Decorator for processing handlers with a lock, catching exceptions
@@ -86,6 +253,33 @@ class Handler(object):
         """
         raise NotImplementedError
 
+    def _process_batch(self, metrics):
+        """
+        Decorator for processing a batch of metrics with a lock, catching
+        exceptions
+        """
+        if not self.enabled:
+            return
+        try:
+            try:
+                self.lock.acquire()
+                self.process_batch(metrics)
+            except Exception:
+                self.log.error(traceback.format_exc())
+        finally:
+            if self.lock.locked():
+                self.lock.release()
+
+    def process_batch(self, metrics):
+        """
+        Process a list of metrics
+
+        Optional: Should be overridden in subclasses that can handle many
+        metrics at once. Defaults to calling process for each metric
+        """
+        for metric in metrics:
+            self.process(metric)
+
     def _flush(self):
         """
         Decorator for flushing handlers with an lock, catching exceptions
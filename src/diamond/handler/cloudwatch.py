@@ -32,10 +32,17 @@ metric = 05
 namespace = MachineLoad
 name = Avg05
 unit = None
+
+Matching datapoints are buffered per namespace and published by a background
+thread, up to 20 (the PutMetricData limit) per call. Failed calls are retried
+`retries` times, waiting `backoff` seconds and doubling that each time.
 """
 
-import sys
 import datetime
+import os
+import Queue
+import threading
+import time
 
 from Handler import Handler
 from configobj import Section
@@ -47,6 +54,9 @@ try:
 except ImportError:
     boto = None
 
+# Most datapoints PutMetricData accepts in one call
+MAX_DATUMS = 20
+
 
 class cloudwatchHandler(Handler):
     """
@@ -72,6 +82,8 @@ class cloudwatchHandler(Handler):
 
         # Initialize Options
         self.region = self.config['region']
+        self.retries = int(self.config['retries'])
+        self.backoff = float(self.config['backoff'])
         instances = boto.utils.get_instance_metadata()
         if 'instance-id' not in instances:
             self.log.error('CloudWatch: Failed to load instance metadata')
@@ -82,7 +94,8 @@ class cloudwatchHandler(Handler):
         self.valid_config = ('region', 'collector', 'metric', 'namespace',
                              'name', 'unit')
 
-        self.rules = []
+        # (collector, metric) -> rules publishing that metric
+        self.rules = {}
         for key_name, section in self.config.items():
             if section.__class__ is Section:
                 keys = section.keys()
@@ -92,9 +105,22 @@ class cloudwatchHandler(Handler):
                         self.log.warning("invalid key %s in section %s",
                                          key, section.name)
                     else:
-                        rules[key] = section[key]
+                        rules[key] = str(section[key])
+
+                if 'collector' not in rules or 'metric' not in rules:
+                    self.log.warning("CloudWatch: section %s needs a "
+                                     "collector and a metric", section.name)
+                    continue
+                self.rules.setdefault(
+                    (rules['collector'], rules['metric']), []).append(rules)
 
-                self.rules.append(rules)
+        # namespace -> datapoints waiting for a full batch
+        self.pending = {}
+        # Batches of (namespace, datapoints) for the sender thread
+        self.queue = Queue.Queue(maxsize=int(self.config['max_queue']))
+
+        # The process the sender thread was started in
+        self.sender_pid = None
 
         # Create CloudWatch Connection
         self._bind()
@@ -112,6 +138,11 @@ class cloudwatchHandler(Handler):
             'name': '',
             'unit': '',
             'collector': '',
+            'max_queue': 'Batches of datapoints waiting to be published, '
+                         'after that new batches are dropped',
+            'retries': 'How many times to retry a failed publish',
+            'backoff': 'Seconds to wait before the first retry, doubled '
+                       'for each further one',
         })
 
         return config
@@ -129,6 +160,9 @@ class cloudwatchHandler(Handler):
             'namespace': 'MachineLoad',
             'name': 'Avg01',
             'unit': 'None',
+            'max_queue': 100,
+            'retries': 3,
+            'backoff': 1,
         })
 
         return config
@@ -161,56 +195,93 @@ class cloudwatchHandler(Handler):
 
     def process(self, metric):
         """
-          Process a metric and send it to CloudWatch
+          Queue a metric to be published to CloudWatch by every rule that
+          matches it
         """
         if not boto:
             return
 
-        collector = str(metric.getCollectorPath())
-        metricname = str(metric.getMetricPath())
+        rules = self.rules.get((metric.getCollectorPath(),
+                                metric.getMetricPath()))
+        if not rules:
+            return
+
         timestamp = datetime.datetime.fromtimestamp(metric.timestamp)
+        for rule in rules:
+            namespace = rule['namespace']
+            pending = self.pending.setdefault(namespace, [])
+            pending.append((rule['name'], float(metric.value), timestamp,
+                            rule['unit']))
+            if len(pending) >= MAX_DATUMS:
+                self._enqueue(namespace)
+
+    def flush(self):
+        """
+          Hand every buffered datapoint to the sender thread
+        """
+        if not boto:
+            return
+        for namespace in self.pending.keys():
+            self._enqueue(namespace)
 
-        # Send the data as ......
+    def _start_sender(self):
+        """
+          Start the sender thread in this process. The handler is created
+          before the handler process forks, and threads do not survive
+          fork(), so this is done when the first batch is queued there.
+        """
+        if self.sender_pid == os.getpid():
+            return
+        self.sender_pid = os.getpid()
+        self.sender = threading.Thread(target=self._sender,
+                                       name='cloudwatchHandler')
+        self.sender.daemon = True
+        self.sender.start()
+
+    def _enqueue(self, namespace):
+        self._start_sender()
+        datums = self.pending.pop(namespace)
+        try:
+            self.queue.put((namespace, datums), block=False)
+        except Queue.Full:
+            self._throttle_error(
+                "CloudWatch: publish queue full, dropping %d datapoints",
+                len(datums))
 
-        for rule in self.rules:
-            self.log.debug(
-                "Comparing Collector: [%s] with (%s) "
-                "and Metric: [%s] with (%s)",
-                str(rule['collector']),
-                collector,
-                str(rule['metric']),
-                metricname
-            )
-
-            if ((str(rule['collector']) == collector and
-                 str(rule['metric']) == metricname)):
-                self.log.debug(
-                    "CloudWatch: Attempting to publish metric: %s to %s "
-                    "with value (%s) @%s",
-                    rule['name'],
-                    rule['namespace'],
-                    str(metric.value),
-                    str(metric.timestamp)
-                )
-                try:
-                    self.connection.put_metric_data(
-                        str(rule['namespace']),
-                        str(rule['name']),
-                        str(metric.value),
-                        timestamp, str(rule['unit']),
-                        {'InstanceId': self.instance_id})
-                    self.log.debug(
-                        "CloudWatch: Successfully published metric: %s to"
-                        " %s with value (%s)",
-                        rule['name'],
-                        rule['namespace'],
-                        str(metric.value)
-                    )
-                except AttributeError, e:
-                    self.log.error(
-                        "CloudWatch: Failed publishing - %s ", str(e))
-                except Exception:  # Rough connection re-try logic.
-                    self.log.error(
-                        "CloudWatch: Failed publishing - %s ",
-                        str(sys.exc_info()[0]))
+    def _sender(self):
+        """
+          Publish queued batches, one PutMetricData call each
+        """
+        while True:
+            namespace, datums = self.queue.get()
+            try:
+                self._publish(namespace, datums)
+            finally:
+                self.queue.task_done()
+
+    def _publish(self, namespace, datums):
+        names, values, timestamps, units = zip(*datums)
+        delay = self.backoff
+        for attempt in xrange(self.retries + 1):
+            if attempt:
+                time.sleep(delay)
+                delay *= 2
+            try:
+                if self.connection is None:
                     self._bind()
+                self.connection.put_metric_data(
+                    namespace, list(names), list(values), list(timestamps),
+                    list(units),
+                    [{'InstanceId': self.instance_id}] * len(datums))
+                self.log.debug(
+                    "CloudWatch: Successfully published %d datapoints to %s",
+                    len(datums), namespace)
+                self._reset_errors()
+                return
+            except Exception, e:  # Rough connection re-try logic.
+                self._throttle_error(
+                    "CloudWatch: Failed publishing - %s ", str(e))
+                self.connection = None
+
+        self.log.error("CloudWatch: Dropping %d datapoints for %s after %d "
+                       "attempts", len(datums), namespace, self.retries + 1)
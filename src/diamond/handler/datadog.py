@@ -4,6 +4,12 @@ Operations and Development teams who write and run applications
 at scale, and want to turn the massive amounts of data produced
 by their apps, tools and services into actionable insight.
 
+Metrics are queued and submitted in bulk, one series request per
+`queue_size` metrics, once `queue_size` are queued, `flush_interval` seconds
+after the last submission, or at the end of a collector run. Metrics that
+could not be submitted are kept for the next request, up to `max_backlog`
+of them.
+
 #### Dependencies
 
   * [dogapi](https://github.com/DataDog/datadogpy)
@@ -12,10 +18,13 @@ by their apps, tools and services into actionable insight.
 
 from Handler import Handler
 import logging
+import time
 from collections import deque
+from itertools import islice
 
 try:
     import dogapi
+    from dogapi.exceptions import ApiError
 except ImportError:
     dogapi = None
 
@@ -32,12 +41,19 @@ class DatadogHandler(Handler):
 
         if dogapi is None:
             logging.error("Failed to load dogapi module.")
+            self.enabled = False
             return
 
-        self.api = dogapi.dog_http_api
-        self.api.api_key = self.config.get('api_key', '')
-        self.queue_size = self.config.get('queue_size', 1)
-        self.queue = deque([])
+        # Errors are raised rather than logged by dogapi, so the queue is
+        # only emptied once the API has accepted the metrics
+        self.api = dogapi.DogHttpApi(api_key=self.config.get('api_key', ''),
+                                     api_host=self.config['api_host'] or None,
+                                     timeout=float(self.config['timeout']),
+                                     swallow=False)
+        self.queue_size = int(self.config['queue_size'])
+        self.flush_interval = float(self.config['flush_interval'])
+        self.queue = deque([], int(self.config['max_backlog']))
+        self.last_send = time.time()
 
     def get_default_config_help(self):
         """
@@ -48,6 +64,14 @@ class DatadogHandler(Handler):
         config.update({
             'api_key': 'Datadog API key',
             'queue_size': 'Number of metrics to queue before send',
+            'flush_interval': 'Send queued metrics at least this often, in'
+                              ' seconds, even if there are fewer than'
+                              ' queue_size',
+            'max_backlog': 'How many metrics to keep while sending fails,'
+                           ' the oldest are dropped after that',
+            'api_host': 'Datadog API url, by default DATADOG_HOST or'
+                        ' https://app.datadoghq.com as dogapi picks it',
+            'timeout': 'Request timeout in seconds',
         })
 
         return config
@@ -60,7 +84,11 @@ class DatadogHandler(Handler):
 
         config.update({
             'api_key': '',
-            'queue_size': '',
+            'queue_size': 500,
+            'flush_interval': 10,
+            'max_backlog': 10000,
+            'api_host': '',
+            'timeout': 10,
         })
 
         return config
@@ -71,7 +99,8 @@ class DatadogHandler(Handler):
         """
 
         self.queue.append(metric)
-        if len(self.queue) >= self.queue_size:
+        if (len(self.queue) >= self.queue_size or
+                time.time() - self.last_send >= self.flush_interval):
             self._send()
 
     def flush(self):
@@ -83,24 +112,54 @@ class DatadogHandler(Handler):
 
     def _send(self):
         """
-        Take metrics from queue and send it to Datadog API
+        Take metrics from queue and send them to Datadog API, queue_size at a
+        time
         """
-
-        while len(self.queue) > 0:
-            metric = self.queue.popleft()
-
+        self.last_send = time.time()
+        while self.queue:
+            count = min(len(self.queue), self.queue_size)
+            series = self._series(islice(self.queue, count))
+            logging.debug("Sending %d metrics in %d series", count,
+                          len(series))
+            try:
+                self.api.metrics(series)
+            except ApiError, e:
+                # Sending them again won't help
+                self._throttle_error("DatadogHandler: Datadog rejected %d "
+                                     "metrics. %s.", count, e)
+            except Exception, e:
+                # Keep them for the next send
+                self._throttle_error("DatadogHandler: Failed sending %d "
+                                     "metrics. %s.", count, e)
+                return
+            else:
+                self._reset_errors()
+
+            for i in xrange(count):
+                self.queue.popleft()
+
+    def _series(self, metrics):
+        """
+        Return the series payload for metrics, with the points of each
+        metric and host in one series
+        """
+        series = {}
+        for metric in metrics:
             path = '%s.%s.%s' % (
                 metric.getPathPrefix(),
                 metric.getCollectorPath(),
                 metric.getMetricPath()
             )
 
-            topic, value, timestamp = str(metric).split()
-            logging.debug(
-                "Sending.. topic[%s], value[%s], timestamp[%s]",
-                path,
-                value,
-                timestamp
-            )
-
-            self.api.metric(path, (timestamp, value), host=metric.host)
+            # Like api.metric(), default to the host dogapi runs on
+            host = metric.host or self.api._default_host
+            key = (path, host)
+            if key not in series:
+                series[key] = {
+                    'metric': path,
+                    'points': [],
+                    'type': 'gauge',
+                    'host': host,
+                }
+            series[key]['points'].append([metric.timestamp, metric.value])
+        return series.values()
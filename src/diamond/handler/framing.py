@@ -0,0 +1,59 @@
+# coding=utf-8
+
+"""
+Framing for the message bus handlers (zmq, rabbitmq, mqtt) in batch mode.
+
+With `batch` above 1 those handlers publish their buffered metrics as
+messages of one `path value timestamp` line per metric, each message at most
+`max_frame_size` bytes, instead of one message per metric. The zmq and
+rabbitmq handlers send a single such line when not in batch mode, so
+consumers can decode either with decode():
+
+    from diamond.handler.framing import decode
+
+    for path, value, timestamp in decode(message):
+        ...
+
+The mqtt handler not in batch mode publishes `value timestamp`, or just
+`value` with `timestamp = 0`, to a topic made from the path. Pass the
+topic to decode those messages; the path is the topic with its slashes
+turned back into dots, prefix included, and the timestamp None when the
+message has none.
+"""
+
+
+def frames(lines, max_size):
+    """
+    Join newline terminated lines into payloads of at most max_size bytes.
+    A line longer than max_size gets a payload of its own.
+    """
+    payload = []
+    size = 0
+    for line in lines:
+        if payload and size + len(line) > max_size:
+            yield ''.join(payload)
+            payload = []
+            size = 0
+        payload.append(line)
+        size += len(line)
+    if payload:
+        yield ''.join(payload)
+
+
+def decode(payload, topic=None):
+    """
+    Return the (path, value, timestamp) tuples of the metrics in a message,
+    and of a single metric mqtt message if its topic is given
+    """
+    metrics = []
+    for line in payload.splitlines():
+        fields = line.split()
+        if len(fields) == 3:
+            metrics.append((fields[0], float(fields[1]), int(fields[2])))
+        elif topic is not None and 1 <= len(fields) <= 2:
+            timestamp = None
+            if len(fields) == 2:
+                timestamp = int(fields[1])
+            metrics.append((topic.replace('/', '.'), float(fields[0]),
+                            timestamp))
+    return metrics
@@ -14,11 +14,29 @@ the e-commerce monitoring system. Today many
 [large companies](http://graphite.readthedocs.org/en/latest/who-is-using.html)
 use it.
 
+With the default `transport = nonblocking` metrics are queued on a
+connection that a thread shared by all the handlers writes out, so a slow
+graphite server does not hold up the other handlers. Up to `high_water`
+bytes are queued per connection. Beyond that, metrics stay stored until it
+catches up, without reconnecting. If the connection fails, what it still
+had queued is stored again, or spilled with `spill_path` set, and sent once
+it is back. `transport = blocking` writes straight to the socket instead.
+
+Metrics are buffered and sent in one write once `batch_bytes` bytes or
+`batch` metrics are waiting, whichever comes first, and at least every
+`max_latency` seconds, so the metrics of a quiet collector do not wait for
+the next flush. `batch = 1` with `batch_bytes = 0` sends every metric on its
+own, as the handler did before `batch` defaulted to 1000.
+
 """
 
 from Handler import Handler
+from httpsender import FlushTimer
+from ioloop import Connection
+from ioloop import QueueFull
 import socket
 import time
+import traceback
 
 
 class GraphiteHandler(Handler):
@@ -44,6 +62,8 @@ class GraphiteHandler(Handler):
         self.keepalive = bool(self.config['keepalive'])
         self.keepaliveinterval = int(self.config['keepaliveinterval'])
         self.batch_size = int(self.config['batch'])
+        self.batch_bytes = int(self.config['batch_bytes'])
+        self.max_latency = float(self.config['max_latency'])
         self.max_backlog_multiplier = int(
             self.config['max_backlog_multiplier'])
         self.trim_backlog_multiplier = int(
@@ -51,12 +71,19 @@ class GraphiteHandler(Handler):
         self.flow_info = self.config['flow_info']
         self.scope_id = self.config['scope_id']
         self.metrics = []
+        # Bytes in self.metrics
+        self.buffered = 0
         self.reconnect_interval = int(self.config['reconnect_interval'])
         self.last_connect_timestamp = -1
+        self.transport = self.config['transport'].lower()
+        self.high_water = int(self.config['high_water'])
 
         # Connect
         self._connect()
 
+        self.timer = FlushTimer(self._flush_buffered, self.max_latency,
+                                self.__class__.__name__)
+
     def get_default_config_help(self):
         """
         Returns the help text for the configuration options for this handler
@@ -69,6 +96,10 @@ class GraphiteHandler(Handler):
             'proto': 'udp, udp4, udp6, tcp, tcp4, or tcp6',
             'timeout': '',
             'batch': 'How many to store before sending to the graphite server',
+            'batch_bytes': 'How many bytes of metrics to store before'
+                           ' sending, 0 for no limit',
+            'max_latency': 'Send stored metrics at least this often, in'
+                           ' seconds. 0 to only send them on flush',
             'max_backlog_multiplier': 'how many batches to store before trimming',  # NOQA
             'trim_backlog_multiplier': 'Trim down how many batches',
             'keepalive': 'Enable keepalives for tcp streams',
@@ -77,6 +108,10 @@ class GraphiteHandler(Handler):
             'scope_id': 'IPv6 Scope ID',
             'reconnect_interval': 'How often (seconds) to reconnect to '
                                   'graphite. Default (0) is never',
+            'transport': 'nonblocking to send from a shared I/O thread, or'
+                         ' blocking to write from the handler',
+            'high_water': 'Most bytes to queue for sending with the'
+                          ' nonblocking transport',
         })
 
         return config
@@ -92,7 +127,9 @@ class GraphiteHandler(Handler):
             'port': 2003,
             'proto': 'tcp',
             'timeout': 15,
-            'batch': 1,
+            'batch': 1000,
+            'batch_bytes': 16384,
+            'max_latency': 1,
             'max_backlog_multiplier': 5,
             'trim_backlog_multiplier': 4,
             'keepalive': 0,
@@ -100,6 +137,8 @@ class GraphiteHandler(Handler):
             'flow_info': 0,
             'scope_id': 0,
             'reconnect_interval': 0,
+            'transport': 'nonblocking',
+            'high_water': 1048576,
         })
 
         return config
@@ -114,32 +153,66 @@ class GraphiteHandler(Handler):
         """
         Process a metric by sending it to graphite
         """
+        self.timer.start()
         # Append the data to the array as a string
-        self.metrics.append(str(metric))
-        if len(self.metrics) >= self.batch_size:
+        line = str(metric)
+        self.metrics.append(line)
+        self.buffered += len(line)
+        if (len(self.metrics) >= self.batch_size or
+                0 < self.batch_bytes <= self.buffered):
             self._send()
 
     def flush(self):
         """Flush metrics in queue"""
+        self.timer.start()
         self._send()
 
+    def _flush_buffered(self):
+        """
+        Send the stored metrics, if there are any, every max_latency seconds
+        """
+        with self.lock:
+            if not self.enabled or not self.metrics:
+                return
+            try:
+                self._send()
+            except Exception:
+                self.log.error(traceback.format_exc())
+
     def _send_data(self, data):
         """
-        Try to send all data in buffer.
+        Try to send all data in buffer. Returns whether it was sent.
         """
         try:
             self.socket.sendall(data)
             self._reset_errors()
+        except QueueFull:
+            # Still sending earlier metrics, no need to reconnect
+            return False
         except:
             self._close()
             self._throttle_error("GraphiteHandler: Socket error, "
                                  "trying reconnect.")
             self._connect()
+            if self.socket is None:
+                return False
             try:
                 self.socket.sendall(data)
             except:
-                return
+                self._close()
+                return False
             self._reset_errors()
+        return True
+
+    def _replay_spill(self):
+        """
+        Send data spilled to disk during an outage, at the spill replay rate
+        """
+        if self.spill is None:
+            return
+        records = self.spill.read()
+        if records and self._send_data(''.join(records)):
+            self.spill.commit()
 
     def _time_to_reconnect(self):
         if self.reconnect_interval > 0:
@@ -163,8 +236,18 @@ class GraphiteHandler(Handler):
                     self.log.debug("GraphiteHandler: Reconnect failed.")
                 else:
                     # Send data to socket
-                    self._send_data(''.join(self.metrics))
-                    self.metrics = []
+                    lines, self.metrics = self.metrics, []
+                    self.buffered = 0
+                    sent = self._send_data(''.join(lines))
+                    if sent:
+                        self._replay_spill()
+                    elif self.spill is not None:
+                        self.spill.append(lines)
+                    else:
+                        # Keep them for the next send, after anything a
+                        # failed connection gave back
+                        self.metrics.extend(lines)
+                        self.buffered += sum(len(line) for line in lines)
                     if self._time_to_reconnect():
                         self._close()
             except Exception:
@@ -176,16 +259,32 @@ class GraphiteHandler(Handler):
                     self.batch_size * self.max_backlog_multiplier):
                 trim_offset = (self.batch_size *
                                self.trim_backlog_multiplier * -1)
-                self.log.warn('GraphiteHandler: Trimming backlog. Removing' +
-                              ' oldest %d and keeping newest %d metrics',
-                              len(self.metrics) - abs(trim_offset),
-                              abs(trim_offset))
+                if self.spill is not None:
+                    self.log.warn('GraphiteHandler: Trimming backlog. '
+                                  'Spilling oldest %d to disk and keeping '
+                                  'newest %d metrics',
+                                  len(self.metrics) - abs(trim_offset),
+                                  abs(trim_offset))
+                    self.spill.append(self.metrics[:trim_offset])
+                else:
+                    self.log.warn('GraphiteHandler: Trimming backlog. '
+                                  'Removing oldest %d and keeping newest %d '
+                                  'metrics',
+                                  len(self.metrics) - abs(trim_offset),
+                                  abs(trim_offset))
                 self.metrics = self.metrics[trim_offset:]
+                self.buffered = sum(len(line) for line in self.metrics)
 
     def _connect(self):
         """
-        Connect to the graphite server
+        Connect to the graphite server, unless it was found down and is not
+        due to be tried again yet
         """
+        if not self.breaker.allow():
+            self.log.debug("GraphiteHandler: %s:%d is down, not reconnecting"
+                           " yet", self.host, self.port)
+            return
+
         if (self.proto == 'udp'):
             stream = socket.SOCK_DGRAM
         else:
@@ -193,30 +292,31 @@ class GraphiteHandler(Handler):
 
         if (self.proto[-1] == '4'):
             family = socket.AF_INET
-            connection_struct = (self.host, self.port)
         elif (self.proto[-1] == '6'):
             family = socket.AF_INET6
-            connection_struct = (self.host, self.port,
-                                 self.flow_info, self.scope_id)
         else:
-            connection_struct = (self.host, self.port)
-            try:
-                addrinfo = socket.getaddrinfo(self.host, self.port, 0, stream)
-            except socket.gaierror, ex:
-                self.log.error("GraphiteHandler: Error looking up graphite host"
-                               " '%s' - %s",
-                               self.host, ex)
-                return
-            if (len(addrinfo) > 0):
-                family = addrinfo[0][0]
-                if (family == socket.AF_INET6):
-                    connection_struct = (self.host, self.port,
-                                         self.flow_info, self.scope_id)
-            else:
-                family = socket.AF_INET
+            family = 0
+
+        try:
+            addrinfo = self._getaddrinfo(self.host, self.port, family, stream)
+        except socket.gaierror, ex:
+            self.log.error("GraphiteHandler: Error looking up graphite host"
+                           " '%s' - %s",
+                           self.host, ex)
+            self.breaker.failure()
+            return
+        family = addrinfo[0][0]
+        connection_struct = addrinfo[0][4]
+        if (family == socket.AF_INET6):
+            connection_struct = (connection_struct[0], self.port,
+                                 self.flow_info, self.scope_id)
 
         # Create socket
-        self.socket = socket.socket(family, stream)
+        if self.transport == 'nonblocking':
+            self.socket = Connection(family, stream, breaker=self.breaker,
+                                     high_water=self.high_water)
+        else:
+            self.socket = socket.socket(family, stream)
         if self.socket is None:
             # Log Error
             self.log.error("GraphiteHandler: Unable to create socket.")
@@ -242,18 +342,37 @@ class GraphiteHandler(Handler):
                            "graphite server %s:%d.",
                            self.host, self.port)
             self.last_connect_timestamp = time.time()
+            if self.transport != 'nonblocking':
+                # The connection tells the breaker once it is made
+                self.breaker.success()
         except Exception, ex:
             # Log Error
             self._throttle_error("GraphiteHandler: Failed to connect to "
                                  "%s:%i. %s.", self.host, self.port, ex)
+            self.breaker.failure()
             # Close Socket
             self._close()
             return
 
     def _close(self):
         """
-        Close the socket
+        Close the socket, keeping what it had queued but not sent
         """
         if self.socket is not None:
+            if isinstance(self.socket, Connection):
+                self._requeue(self.socket.take_unsent())
             self.socket.close()
         self.socket = None
+
+    def _requeue(self, data):
+        """
+        Spill data that was not sent, or put it back in front of the stored
+        metrics
+        """
+        if not data:
+            return
+        if self.spill is not None:
+            self.spill.append(data)
+        else:
+            self.metrics[:0] = data
+            self.buffered += sum(len(line) for line in data)
@@ -62,6 +62,8 @@ class GraphitePickleHandler(GraphiteHandler):
 
         config.update({
             'port': 2004,
+            # Metrics are pickled a batch at a time, not coalesced as lines
+            'batch': 1,
         })
 
         return config
@@ -77,7 +79,7 @@ class GraphitePickleHandler(GraphiteHandler):
             self.log.debug("GraphitePickleHandler: Sending batch size: %d",
                            self.batch_size)
             # Pickle the batch of metrics
-            self.metrics = [self._pickle_batch()]
+            self.metrics.append(self._pickle_batch())
             # Send pickled batch
             self._send()
             # Flush the metric pack down the wire
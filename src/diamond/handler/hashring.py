@@ -0,0 +1,80 @@
+# coding=utf-8
+
+"""
+The consistent hash ring carbon-relay uses to shard metrics between carbon
+caches (RELAY_METHOD = consistent-hashing, the default carbon_ch hash), so a
+handler that shards by itself sends each path to the cache carbon expects it
+on.
+
+Nodes are (server, instance) tuples, as in carbon's DESTINATIONS list
+(`server:port:instance`). The port is not part of the key.
+"""
+
+import bisect
+import hashlib
+
+
+def parse_destination(destination, default_port):
+    """
+    Split a `host[:port[:instance]]` destination into a (host, port,
+    instance) tuple. IPv6 addresses have to be put in brackets to be given a
+    port: `[::1]:2004`.
+    """
+    destination = destination.strip()
+    if destination.startswith('['):
+        host, _, rest = destination[1:].partition(']')
+        rest = rest[1:]
+    else:
+        host, _, rest = destination.partition(':')
+    port, _, instance = rest.partition(':')
+    return str(host), int(port or default_port), str(instance) or None
+
+
+class ConsistentHashRing(object):
+    """
+    A port of carbon.hashing.ConsistentHashRing
+    """
+
+    def __init__(self, nodes, replica_count=100):
+        self.ring = []
+        self.positions = set()
+        self.nodes = []
+        self.replica_count = replica_count
+        for node in nodes:
+            self.add_node(node)
+
+    def compute_ring_position(self, key):
+        return int(hashlib.md5(key).hexdigest()[:4], 16)
+
+    def add_node(self, node):
+        self.nodes.append(node)
+        for i in xrange(self.replica_count):
+            position = self.compute_ring_position('%s:%d' % (node, i))
+            while position in self.positions:
+                position += 1
+            self.positions.add(position)
+            bisect.insort(self.ring, (position, node))
+
+    def get_node(self, key):
+        """
+        Return the node key belongs to
+        """
+        position = self.compute_ring_position(key)
+        index = bisect.bisect_left(self.ring, (position, None))
+        return self.ring[index % len(self.ring)][1]
+
+    def get_nodes(self, key):
+        """
+        Return every node, in the order carbon-relay would pick them for key:
+        the owner first, then its replicas
+        """
+        position = self.compute_ring_position(key)
+        index = bisect.bisect_left(self.ring, (position, None))
+        nodes = []
+        for i in xrange(len(self.ring)):
+            node = self.ring[(index + i) % len(self.ring)][1]
+            if node not in nodes:
+                nodes.append(node)
+                if len(nodes) == len(self.nodes):
+                    break
+        return nodes
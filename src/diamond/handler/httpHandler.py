@@ -3,10 +3,17 @@
 
 """
 Send metrics to a http endpoint via POST
+
+Metrics are posted `batch` at a time over a keep-alive connection, at the end
+of every collector run and at least every `flush_interval` seconds. Failed
+posts are retried `retries` times with backoff; after that the metrics are
+kept for the next post, up to `max_backlog` of them.
 """
 
 from Handler import Handler
-import urllib2
+from httpsender import FlushTimer, HTTPSender
+import httplib
+import socket
 
 
 class HttpPostHandler(Handler):
@@ -16,7 +23,20 @@ class HttpPostHandler(Handler):
         Handler.__init__(self, config)
         self.metrics = []
         self.batch_size = int(self.config['batch'])
+        self.max_backlog = int(self.config['max_backlog'])
         self.url = self.config.get('url')
+        self.sender = HTTPSender(
+            self.url,
+            headers={'Content-Type': 'application/x-www-form-urlencoded'},
+            compression=str(self.config['compression']) == 'True',
+            timeout=float(self.config['timeout']),
+            retries=int(self.config['retries']),
+            backoff=float(self.config['backoff']),
+            breaker=self.breaker)
+
+        self.timer = FlushTimer(self._flush,
+                                float(self.config['flush_interval']),
+                                'HttpPostHandler')
 
     def get_default_config_help(self):
         """
@@ -27,6 +47,15 @@ class HttpPostHandler(Handler):
         config.update({
             'url': 'Fully qualified url to send metrics to',
             'batch': 'How many to store before sending to the graphite server',
+            'max_backlog': 'How many metrics to keep while posts fail',
+            'compression': 'Gzip request bodies',
+            'timeout': 'Request timeout in seconds',
+            'retries': 'How many times to retry a failed post',
+            'backoff': 'Seconds to wait before the first retry, doubled for'
+                       ' each further one',
+            'flush_interval': 'Post buffered metrics at least this often, in'
+                              ' seconds. 0 to only post at the end of'
+                              ' collector runs',
         })
 
         return config
@@ -40,12 +69,19 @@ class HttpPostHandler(Handler):
         config.update({
             'url': 'http://localhost/blah/blah/blah',
             'batch': 100,
+            'max_backlog': 10000,
+            'compression': False,
+            'timeout': 15,
+            'retries': 2,
+            'backoff': 0.5,
+            'flush_interval': 10,
         })
 
         return config
 
     # Join batched metrics and push to url mentioned in config
     def process(self, metric):
+        self.timer.start()
         self.metrics.append(str(metric))
         if len(self.metrics) >= self.batch_size:
             self.post()
@@ -53,9 +89,34 @@ class HttpPostHandler(Handler):
     # Overriding flush to post metrics for every collector.
     def flush(self):
         """Flush metrics in queue"""
+        self.timer.start()
         self.post()
 
     def post(self):
-        req = urllib2.Request(self.url, "\n".join(self.metrics))
-        urllib2.urlopen(req)
+        if not self.metrics:
+            return
+
+        try:
+            status = self.sender.post("\n".join(self.metrics))
+        except (httplib.HTTPException, socket.error), e:
+            self._throttle_error("HttpPostHandler: Failed posting to %s. %s.",
+                                 self.url, e)
+            status = None
+
+        if status is None or status >= 500:
+            if status is not None:
+                self._throttle_error("HttpPostHandler: %s returned %d",
+                                     self.url, status)
+            # Keep the metrics for the next post
+            if len(self.metrics) > self.max_backlog:
+                self.metrics = self.metrics[-self.max_backlog:]
+            return
+
+        if status >= 400:
+            # Posting them again won't help
+            self._throttle_error("HttpPostHandler: %s returned %d, dropping "
+                                 "%d metrics", self.url, status,
+                                 len(self.metrics))
+        else:
+            self._reset_errors()
         self.metrics = []
@@ -0,0 +1,171 @@
+# coding=utf-8
+
+"""
+HTTP transport shared by the handlers that POST their metrics: a persistent
+connection to one URL, optionally gzip compressed bodies and a bounded number
+of retries with exponential backoff. FlushTimer flushes a handler on a timer
+so buffered metrics go out even while no new ones arrive.
+"""
+
+import gzip
+import httplib
+import os
+import socket
+import threading
+import time
+import urlparse
+from cStringIO import StringIO
+
+
+def gzip_body(body):
+    """
+    Return body gzip compressed
+    """
+    buf = StringIO()
+    f = gzip.GzipFile(fileobj=buf, mode='wb')
+    f.write(body)
+    f.close()
+    return buf.getvalue()
+
+
+class HTTPSender(object):
+    """
+    POSTs request bodies to a single URL, reusing the connection between
+    requests
+    """
+
+    def __init__(self, url, headers=None, compression=False, timeout=15,
+                 retries=2, backoff=0.5, breaker=None):
+        """
+        headers are sent with every request. A request that can not reach the
+        server or gets a 5xx response is retried up to retries times, waiting
+        backoff seconds before the first retry and twice as long before each
+        further one. With a breaker, usually the handler's, requests fail
+        straight away while it is open.
+        """
+        parsed = urlparse.urlsplit(url)
+        self.scheme = parsed.scheme
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.path = parsed.path or '/'
+        if parsed.query:
+            self.path += '?' + parsed.query
+
+        self.headers = dict(headers or {})
+        self.compression = compression
+        if compression:
+            self.headers['Content-Encoding'] = 'gzip'
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker
+        self.connection = None
+
+    def post(self, body):
+        """
+        POST body and return the status of the last response. Raises
+        httplib.HTTPException or socket.error if the server could not be
+        reached at all, or socket.error without trying if the breaker is open.
+        """
+        if self.breaker is not None and not self.breaker.allow():
+            raise socket.error('circuit breaker open')
+        try:
+            status = self._post(body)
+        except (httplib.HTTPException, socket.error):
+            if self.breaker is not None:
+                self.breaker.failure()
+            raise
+        if self.breaker is not None:
+            if status >= 500:
+                self.breaker.failure()
+            else:
+                self.breaker.success()
+        return status
+
+    def _post(self, body):
+        if self.compression:
+            body = gzip_body(body)
+
+        attempt = 0
+        delay = self.backoff
+        while True:
+            reused = self.connection is not None
+            try:
+                status = self._request(body)
+            except (httplib.HTTPException, socket.error):
+                self.close()
+                if reused:
+                    # The server may have closed an idle keep-alive
+                    # connection, so try once more straight away on a new one
+                    continue
+                if attempt >= self.retries:
+                    raise
+            else:
+                if status < 500 or attempt >= self.retries:
+                    return status
+
+            attempt += 1
+            time.sleep(delay)
+            delay *= 2
+
+    def _request(self, body):
+        if self.connection is None:
+            if self.scheme == 'https':
+                self.connection = httplib.HTTPSConnection(
+                    self.host, self.port, timeout=self.timeout)
+            else:
+                self.connection = httplib.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+        self.connection.request('POST', self.path, body, self.headers)
+        response = self.connection.getresponse()
+        response.read()
+        return response.status
+
+    def close(self):
+        """
+        Close the connection, the next request opens a new one
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class FlushThread(threading.Thread):
+    """
+    Calls flush every interval seconds
+    """
+
+    def __init__(self, flush, interval, name):
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.flush = flush
+        self.interval = interval
+        # Waits on an event rather than time.sleep, which tests patch
+        self.wakeup = threading.Event()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.flush()
+
+
+class FlushTimer(object):
+    """
+    Runs a FlushThread in the process that uses the handler. Handlers are
+    created before the handler process forks, and threads do not survive
+    fork(), so call start() from process() and flush(): it starts the thread
+    the first time it is called in each process.
+    """
+
+    def __init__(self, flush, interval, name):
+        self.flush = flush
+        self.interval = interval
+        self.name = name
+        # The process the thread was started in
+        self.pid = None
+
+    def start(self):
+        if self.interval <= 0 or self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        FlushThread(self.flush, self.interval, self.name).start()
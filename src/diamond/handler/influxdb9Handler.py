@@ -10,9 +10,13 @@ v1.2 : added a timer to delay influxdb writing in case of failure
        this whill avoid the 100% cpu loop when influx in not responding
        Sebastien Prune THOMAS - prune@lecentre.net
 
+With `influxdb_version` 0.9 or later points are written natively in the line
+protocol, every buffered point in one (optionally gzip compressed) request over
+a keep-alive connection. While InfluxDB is unreachable up to `cache_size`
+points are kept, after that the oldest are dropped.
+
 - Dependency:
-    - influxdb client (pip install influxdb)
-      you need version > 0.1.6 for HTTPS (not yet released)
+    - influxdb client (pip install influxdb), for influxdb_version 0.8 only
 
 - enable it in `diamond.conf` :
 
@@ -30,27 +34,33 @@ password = root
 database = graphite
 time_precision = s
 influxdb_version = 0.8
+compression = False
+integer_fields = False
 """
 
-from six import integer_types
+import httplib
 import time
-from Handler import Handler
+import urllib
+from collections import deque
 
-try:
-    from influxdb.client import InfluxDBClient
-except ImportError:
-    InfluxDBClient = None
+from Handler import Handler
+from httpsender import HTTPSender
+from influxline import encode, PRECISIONS
 
 try:
     from influxdb.influxdb08 import InfluxDBClient as InfluxDB08Client
 except ImportError:
     InfluxDB08Client = None
 
+# Most points written in one request
+MAX_LINES = 5000
+
 
 class Influxdb9Handler(Handler):
     """
     Sending data to Influxdb using batched format
     """
+
     def __init__(self, config=None):
         """
         Create a new instance of the InfluxdbeHandler
@@ -58,7 +68,6 @@ class Influxdb9Handler(Handler):
         # Initialize Handler
         Handler.__init__(self, config)
 
-
         # Initialize Options
         if self.config['ssl'] == "True":
             self.ssl = True
@@ -71,29 +80,49 @@ class Influxdb9Handler(Handler):
         self.database = self.config['database']
         self.batch_size = int(self.config['batch_size'])
         self.metric_max_cache = int(self.config['cache_size'])
-        self.batch_count = 0
         self.time_precision = self.config['time_precision']
         self.influxdb_version = self.config['influxdb_version']
+        self.integer_fields = str(self.config['integer_fields']) == 'True'
 
         # Initialize Data
-        self.batch = {}
+        # Encoded lines with the line protocol, (path, timestamp, value)
+        # tuples for 0.8
+        self.batch = deque(maxlen=self.metric_max_cache)
+        self.dropped = 0
         self.influx = None
+        self.client = None
         self.batch_timestamp = time.time()
         self.time_multiplier = 1
 
-        if self.influxdb_version == '0.8' and not InfluxDB08Client:
-            self.log.error('influxdb.influxdb08.client.InfluxDBClient import failed. '
-                            'Handler disabled')
-            self.enabled = False
+        if self.influxdb_version == '0.8':
+            if not InfluxDB08Client:
+                self.log.error('influxdb.influxdb08.client.InfluxDBClient '
+                               'import failed. Handler disabled')
+                self.enabled = False
+                return
+            # Connect
+            self._connect()
             return
-        elif not InfluxDBClient:
-            self.log.error('influxdb.client.InfluxDBClient import failed. '
-                           'Handler disabled')
+
+        if self.time_precision not in PRECISIONS:
+            self.log.error('Influxdb9Handler: unknown time_precision %r. '
+                           'Handler disabled', self.time_precision)
             self.enabled = False
             return
-
-        # Connect
-        self._connect()
+        self.multiplier = PRECISIONS[self.time_precision]
+        params = [('db', self.database), ('precision', self.time_precision)]
+        if self.username:
+            params.extend([('u', self.username), ('p', self.password)])
+        # Points that can't be written are kept and sent with the next batch,
+        # so don't hold up the handler retrying
+        self.client = HTTPSender(
+            '%s://%s:%d/write?%s' % ('https' if self.ssl else 'http',
+                                     self.hostname, self.port,
+                                     urllib.urlencode(params)),
+            headers={'Content-Type': 'text/plain'},
+            compression=str(self.config['compression']) == 'True',
+            timeout=float(self.config['timeout']), retries=0,
+            breaker=self.breaker)
 
     def get_default_config_help(self):
         """
@@ -108,13 +137,18 @@ class Influxdb9Handler(Handler):
             'batch_size': 'How many metrics to store before sending to the'
             ' influxdb server',
             'cache_size': 'How many values to store in cache in case of'
-            ' influxdb failure',
+            ' influxdb failure, the oldest are dropped after that',
             'username': 'Username for connection',
             'password': 'Password for connection',
             'database': 'Database name',
             'time_precision': 'time precision in second(s), milisecond(ms) or '
             'microsecond (u)',
             'influxdb_version': 'InfluxDB API version, default 0.8',
+            'compression': 'gzip compress requests (0.9 and later)',
+            'integer_fields': 'Write int values as int fields rather than '
+            'floats (0.9 and later). Only for series created with int '
+            'fields, InfluxDB rejects points that change a field\'s type',
+            'timeout': 'HTTP timeout in seconds (0.9 and later)',
         })
 
         return config
@@ -136,6 +170,9 @@ class Influxdb9Handler(Handler):
             'cache_size': 20000,
             'time_precision': 's',
             'influxdb_version': '0.8',
+            'compression': False,
+            'integer_fields': False,
+            'timeout': 15,
         })
 
         return config
@@ -147,85 +184,120 @@ class Influxdb9Handler(Handler):
         self._close()
 
     def process(self, metric):
-        if self.batch_count <= self.metric_max_cache:
-            # Add the data to the batch
-            self.batch.setdefault(metric.path, []).append([metric.timestamp,
-                                                           metric.value])
-            self.batch_count += 1
-        # If there are sufficient metrics, then pickle and send
-        if self.batch_count >= self.batch_size and (
+        if self.client is not None:
+            point = encode(metric.path, metric.value, metric.timestamp,
+                           self.multiplier, self.integer_fields)
+            if point is None:
+                return
+        else:
+            point = (metric.path, metric.timestamp, metric.value)
+
+        if len(self.batch) == self.metric_max_cache:
+            self.dropped += 1
+            self._throttle_error(
+                "Influxdb9Handler: cache full, %d oldest metrics dropped so "
+                "far", self.dropped)
+        # Add the data to the batch
+        self.batch.append(point)
+
+        # If there are sufficient metrics, then send
+        if len(self.batch) >= self.batch_size and (
                 time.time() - self.batch_timestamp) > 2**self.time_multiplier:
             # Log
             self.log.debug(
                 "Influxdb9Handler: Sending batch sizeof : %d/%d after %fs",
-                self.batch_count,
+                len(self.batch),
                 self.batch_size,
                 (time.time() - self.batch_timestamp))
             # reset the batch timer
             self.batch_timestamp = time.time()
-            # Send pickled batch
+            # Send batch
             self._send()
         else:
             self.log.debug(
                 "Influxdb9Handler: not sending batch of %d as timestamp is %f",
-                self.batch_count,
+                len(self.batch),
                 (time.time() - self.batch_timestamp))
 
     def _send(self):
         """
         Send data to Influxdb. Data that can not be sent will be kept in queued.
         """
-        # Check to see if we have a valid socket. If not, try to connect.
         try:
-                if self.influx is None:
-                    self.log.debug("Influxdb9Handler: Socket is not connected. "
-                                   "Reconnecting.")
-                    self._connect()
-                if self.influx is None:
-                    self.log.debug("Influxdb9Handler: Reconnect failed.")
-                else:
-                    # build metrics data
-                    metrics = []
-                    if self.influxdb_version == "0.8":
-                        for path in self.batch:
-                            metrics.append({
-                                "points": self.batch[path],
-                                "name": path,
-                                "columns": ["time", "value"]})
-                    elif self.influxdb_version == "0.9":
-                        for path in self.batch:
-                            # Cast to float to ensure it's written as a float in InfluxDB.
-                            # This prevents future errors where the data type of a field
-                            # in InfluxDB is 'int', but we try to write a float to that field.
-                            value = self.batch[path][0][1]
-                            if isinstance(value, integer_types):
-                                value = float(value)
-
-                            metrics.append({
-                                "measurement": path,
-                                "precision": self.time_precision,
-                                "time": self.batch[path][0][0],
-                                "fields": {"value": value}})
-                    # Send data to influxdb
-                    self.log.debug("Influxdb9Handler: writing %d series of data",
-                                   len(metrics))
-                    self.influx.write_points(metrics,
-                                             time_precision=self.time_precision)
-
-                    # empty batch buffer
-                    self.batch = {}
-                    self.batch_count = 0
-                    self.time_multiplier = 1
+            if self.client is not None:
+                self._write_lines()
+            else:
+                self._write_series()
+            self.time_multiplier = 1
 
         except Exception:
-                self._close()
-                if self.time_multiplier < 5:
-                    self.time_multiplier += 1
-                self._throttle_error(
-                    "Influxdb9Handler: Error sending metrics, waiting for %ds.",
-                    2**self.time_multiplier)
+            self._close()
+            if self.time_multiplier < 5:
+                self.time_multiplier += 1
+            self._throttle_error(
+                "Influxdb9Handler: Error sending metrics, waiting for %ds.",
+                2**self.time_multiplier)
+            raise
+
+    def _write_lines(self):
+        """
+        Write the batch with the line protocol, MAX_LINES points a request
+        """
+        while self.batch:
+            lines = [self.batch.popleft()
+                     for _ in xrange(min(len(self.batch), MAX_LINES))]
+            self.log.debug("Influxdb9Handler: writing %d points", len(lines))
+            try:
+                status = self.client.post(''.join(lines))
+            except Exception:
+                self.batch.extendleft(reversed(lines))
                 raise
 
+            if status >= 500:
+                self.batch.extendleft(reversed(lines))
+                raise httplib.HTTPException('/write returned %d' % status)
+            if status >= 400:
+                # InfluxDB rejected (some of) the points, sending them again
+                # won't help
+                self._throttle_error(
+                    "Influxdb9Handler: /write returned %d, dropping %d points",
+                    status, len(lines))
+            else:
+                self._reset_errors()
+
+    def _write_series(self):
+        """
+        Write the batch with the 0.8 API, one series per path
+        """
+        # Check to see if we have a valid socket. If not, try to connect.
+        if self.influx is None:
+            self.log.debug("Influxdb9Handler: Socket is not connected. "
+                           "Reconnecting.")
+            self._connect()
+        if self.influx is None:
+            self.log.debug("Influxdb9Handler: Reconnect failed.")
+            return
+
+        # build metrics data
+        series = {}
+        for path, timestamp, value in self.batch:
+            series.setdefault(path, []).append([timestamp, value])
+        metrics = []
+        for path, points in series.iteritems():
+            metrics.append({
+                "points": points,
+                "name": path,
+                "columns": ["time", "value"]})
+
+        # Send data to influxdb
+        self.log.debug("Influxdb9Handler: writing %d series of data",
+                       len(metrics))
+        self.influx.write_points(metrics,
+                                 time_precision=self.time_precision)
+
+        # empty batch buffer
+        self.batch.clear()
+
     def _connect(self):
         """
         Connect to the influxdb server
@@ -233,14 +305,10 @@ class Influxdb9Handler(Handler):
 
         try:
             # Open Connection
-            if self.influxdb_version == '0.8':
-                self.influx = InfluxDB08Client(self.hostname, self.port,
-                                        self.username, self.password,
-                                        self.database, self.ssl)
-            else:
-                self.influx = InfluxDBClient(self.hostname, self.port,
-                                         self.username, self.password,
-                                         self.database, self.ssl)
+            # Use legacy client for InfluxDB 0.8
+            self.influx = InfluxDB08Client(self.hostname, self.port,
+                                           self.username, self.password,
+                                           self.database, self.ssl)
             # Log
             self.log.debug("Influxdb9Handler: Established connection to "
                            "%s:%d/%s.",
@@ -256,6 +324,8 @@ class Influxdb9Handler(Handler):
 
     def _close(self):
         """
-        Close the socket = do nothing for influx which is http stateless
+        Drop the 0.8 client and close the keep-alive connection
         """
         self.influx = None
+        if getattr(self, 'client', None) is not None:
+            self.client.close()
@@ -0,0 +1,41 @@
+# coding=utf-8
+
+"""
+Encode metrics in the InfluxDB (0.9+) line protocol for the InfluxDB
+handlers, which write them to the `/write` endpoint with an HTTPSender.
+
+Each point is encoded to its line as soon as it is buffered, so a backlog
+costs one string per point and a write is a single join of the buffered
+lines.
+"""
+
+import math
+
+# Timestamp multipliers from seconds for each write precision
+PRECISIONS = {
+    's': 1,
+    'ms': 1000,
+    'u': 1000000,
+    'n': 1000000000,
+}
+
+
+def encode(path, value, timestamp, multiplier=1, integers=False):
+    """
+    Return the line protocol line for a point, or None if InfluxDB can not
+    store its value
+
+    The value is written as a float field, as the handlers have always done
+    for 0.9, so a series never ends up with an int field that later float
+    values would be rejected by. With `integers` int values are written as
+    int fields instead, for series that were created with those.
+    """
+    if ',' in path or ' ' in path:
+        path = path.replace(',', '\\,').replace(' ', '\\ ')
+    if integers and isinstance(value, (int, long)):
+        return '%s value=%di %d\n' % (path, value,
+                                      int(timestamp * multiplier))
+    value = float(value)
+    if math.isnan(value) or math.isinf(value):
+        return None
+    return '%s value=%r %d\n' % (path, value, int(timestamp * multiplier))
@@ -0,0 +1,523 @@
+# coding=utf-8
+
+"""
+Non-blocking transport shared by the socket handlers.
+
+A Connection stands in for the socket of a handler with `transport =
+nonblocking`. sendall() only queues the data, and a single IOLoop thread
+writes the queues of every connection in the process as their sinks take
+them, so one slow receiver no longer holds up the others. Each write hands
+the kernel as much of the queue as it will take in one send(). Once the
+queue of a connection is above its high water mark sendall() raises
+QueueFull, and the handler treats the data as unsent, without reconnecting,
+until the sink has caught up.
+
+A connection that fails, or makes no progress for its timeout, is closed.
+The next sendall() raises the error so the handler reconnects, and the
+handler's circuit breaker hears about it. The buffers still queued when it
+failed, up to `high_water` bytes of them, are kept rather than dropped:
+take_unsent() hands them back to the handler to send again, spill or keep
+in its backlog. The first may have been partly sent, so a few lines can
+reach the sink twice. Only a connection the handler has already closed
+drops what it could not send.
+
+An unexpected error while serving a connection is logged and fails that
+connection only. The loop thread keeps serving the others, and should it
+die all the same, the next sendall() starts another.
+"""
+
+import errno
+import fcntl
+import logging
+import os
+import select
+import socket
+import threading
+import time
+from collections import deque
+
+# Most bytes to hand the kernel in one send()
+WRITE_CHUNK = 262144
+
+# Longest to wait in select/epoll, in seconds
+MAX_WAIT = 1.0
+
+WOULD_BLOCK = (errno.EAGAIN, errno.EWOULDBLOCK)
+IN_PROGRESS = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY)
+
+
+class QueueFull(socket.error):
+    """
+    The connection is up but its write queue is above the high water mark
+    """
+
+
+def _set_nonblocking(fd):
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+class SelectPoller(object):
+    """
+    Waits for file descriptors with select()
+    """
+
+    def poll(self, readers, writers, timeout):
+        try:
+            readable, writable, _ = select.select(readers, writers, [],
+                                                  timeout)
+        except select.error, e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return [], []
+        return readable, writable
+
+    def forget(self, fd):
+        pass
+
+
+class EpollPoller(object):
+    """
+    Waits for file descriptors with epoll, registering only the changes
+    """
+
+    def __init__(self):
+        self.epoll = select.epoll()
+        self.masks = {}
+
+    def poll(self, readers, writers, timeout):
+        masks = dict((fd, select.EPOLLIN) for fd in readers)
+        for fd in writers:
+            masks[fd] = masks.get(fd, 0) | select.EPOLLOUT
+
+        for fd in self.masks.keys():
+            if fd not in masks:
+                self.forget(fd)
+        # Descriptors that could not be watched, closed under us most likely
+        broken = []
+        for fd, mask in masks.iteritems():
+            try:
+                if fd not in self.masks:
+                    self.epoll.register(fd, mask)
+                elif self.masks[fd] != mask:
+                    self.epoll.modify(fd, mask)
+            except (IOError, ValueError):
+                self.forget(fd)
+                broken.append(fd)
+                continue
+            self.masks[fd] = mask
+
+        try:
+            events = self.epoll.poll(timeout)
+        except IOError, e:
+            if e.errno != errno.EINTR:
+                raise
+            return broken, broken
+        done = select.EPOLLHUP | select.EPOLLERR
+        # Reading or writing a broken descriptor raises its error, so its
+        # connection fails
+        readable = broken + [fd for fd, event in events
+                             if event & (select.EPOLLIN | done)]
+        writable = broken + [fd for fd, event in events
+                             if event & (select.EPOLLOUT | done)]
+        return readable, writable
+
+    def forget(self, fd):
+        """
+        Stop watching fd, before it is closed and its number reused
+        """
+        if self.masks.pop(fd, None) is not None:
+            try:
+                self.epoll.unregister(fd)
+            except (IOError, ValueError):
+                pass
+
+
+class IOLoop(threading.Thread):
+    """
+    Writes the queues of all the connections of the process from a single
+    thread. Use IOLoop.instance() rather than starting another one.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """
+        Return the running loop of this process, starting it if need be
+        """
+        with cls._instance_lock:
+            loop = cls._instance
+            if loop is None or loop.pid != os.getpid() or not loop.is_alive():
+                loop = cls._instance = cls()
+                loop.start()
+            return loop
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='IOLoop')
+        self.daemon = True
+        self.log = logging.getLogger('diamond')
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.connections = set()
+        if hasattr(select, 'epoll'):
+            self.poller = EpollPoller()
+        else:
+            self.poller = SelectPoller()
+        self._waker, self._wake = os.pipe()
+        _set_nonblocking(self._waker)
+        _set_nonblocking(self._wake)
+
+    def add(self, connection):
+        with self.lock:
+            self.connections.add(connection)
+        self.wake()
+
+    def remove(self, connection):
+        """
+        Stop serving connection. Only called from the loop thread.
+        """
+        with self.lock:
+            self.connections.discard(connection)
+        self.poller.forget(connection.fd)
+
+    def wake(self):
+        """
+        Interrupt the wait so new data and connections are picked up
+        """
+        try:
+            os.write(self._wake, 'x')
+        except OSError, e:
+            # A full pipe wakes the loop just the same
+            if e.errno not in WOULD_BLOCK:
+                raise
+
+    def run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception:
+                # This is the only thread writing for the handlers of the
+                # process, keep it going
+                self.log.exception('IOLoop: unexpected error')
+                time.sleep(MAX_WAIT)
+
+    def run_once(self):
+        now = time.time()
+        with self.lock:
+            connections = list(self.connections)
+
+        readers = {}
+        writers = {}
+        timeout = MAX_WAIT
+        for connection in connections:
+            try:
+                if connection.expire(now):
+                    continue
+                if connection.wants_read():
+                    readers[connection.fd] = connection
+                if connection.wants_write():
+                    writers[connection.fd] = connection
+                if connection.deadline is not None:
+                    timeout = max(0, min(timeout, connection.deadline - now))
+            except Exception, e:
+                self._broken(connection, e)
+
+        readable, writable = self.poller.poll(
+            [self._waker] + readers.keys(), writers.keys(), timeout)
+
+        for fd in readable:
+            if fd == self._waker:
+                self._drain_waker()
+            elif fd in readers and readers[fd].error is None:
+                self._serve(readers[fd], readers[fd].handle_read)
+        for fd in writable:
+            if fd in writers and writers[fd].error is None:
+                self._serve(writers[fd], writers[fd].handle_write)
+
+    def _serve(self, connection, method):
+        try:
+            method()
+        except Exception, e:
+            self._broken(connection, e)
+
+    def _broken(self, connection, e):
+        """
+        Fail a connection that raised an unexpected error, leaving the
+        others be
+        """
+        self.log.exception('IOLoop: unexpected error on connection %d',
+                           connection.fd)
+        if connection.error is not None or connection.closed:
+            self.remove(connection)
+            return
+        try:
+            # The handlers expect socket errors from sendall()
+            connection._fail(socket.error(errno.EIO, str(e)))
+        except Exception:
+            self.log.exception('IOLoop: failed to close connection %d',
+                               connection.fd)
+            self.remove(connection)
+
+    def _drain_waker(self):
+        try:
+            while os.read(self._waker, 4096):
+                pass
+        except OSError, e:
+            if e.errno not in WOULD_BLOCK:
+                raise
+
+
+class Connection(object):
+    """
+    A non-blocking socket with a write queue, served by the IOLoop. It has
+    the methods of socket the handlers use, so it can take the place of one:
+    create it, set options and the timeout, then connect().
+    """
+
+    def __init__(self, family, socktype, breaker=None, high_water=1048576,
+                 loop=None):
+        """
+        breaker, usually the handler's, hears whether the connection could
+        be made. Once high_water bytes are queued, sendall() raises
+        QueueFull.
+        """
+        self.sock = socket.socket(family, socktype)
+        self.fd = self.sock.fileno()
+        self.type = socktype
+        self.breaker = breaker
+        self.high_water = high_water
+        self.loop = loop
+        self.timeout = None
+        self.lock = threading.Lock()
+        # The buffers passed to sendall() not yet sent in full, and how much
+        # of the first has been
+        self.queue = deque()
+        self.offset = 0
+        self.queued = 0
+        # What was still queued when the connection failed
+        self.unsent = []
+        self.connected = False
+        self.closing = False
+        self.closed = False
+        self.error = None
+        # When the connection fails unless it makes progress
+        self.deadline = None
+
+    def setsockopt(self, *args):
+        self.sock.setsockopt(*args)
+
+    def settimeout(self, timeout):
+        """
+        How long to wait for the connection to be made, and for queued data
+        to go out, before giving up on the connection
+        """
+        self.timeout = timeout
+
+    def fileno(self):
+        return self.fd
+
+    def connect(self, address):
+        """
+        Start connecting to address. Errors that are known straight away are
+        raised, others close the connection later.
+        """
+        self.sock.setblocking(0)
+        err = self.sock.connect_ex(address)
+        if err == 0:
+            self._connected()
+        elif err in IN_PROGRESS:
+            self.deadline = self._deadline()
+        else:
+            self.sock.close()
+            self.closed = True
+            raise socket.error(err, os.strerror(err))
+        if self.loop is None:
+            self.loop = IOLoop.instance()
+        self.loop.add(self)
+
+    def sendall(self, data):
+        """
+        Queue data to be sent. Raises the error that closed the connection,
+        or QueueFull while the queue is above the high water mark.
+        """
+        with self.lock:
+            if self.error is not None:
+                raise self.error
+            if self.closing or self.closed:
+                raise socket.error(errno.EPIPE, 'Connection closed')
+            if self.queued and self.queued + len(data) > self.high_water:
+                raise QueueFull(errno.ENOBUFS, '%d bytes waiting to be sent'
+                                % self.queued)
+            if not self.queue and self.connected:
+                self.deadline = self._deadline()
+            self.queue.append(data)
+            self.queued += len(data)
+        self._running_loop().wake()
+
+    def take_unsent(self):
+        """
+        Return the buffers passed to sendall() that had not been sent in full
+        when the connection failed, oldest first, and forget them
+        """
+        with self.lock:
+            unsent, self.unsent = self.unsent, []
+        return unsent
+
+    def close(self):
+        """
+        Close the connection once the queued data is sent, or the timeout
+        runs out
+        """
+        if self.loop is None:
+            if not self.closed:
+                self.sock.close()
+                self.closed = True
+            return
+        with self.lock:
+            self.closing = True
+            if self.queue:
+                self.deadline = self._deadline()
+        self._running_loop().wake()
+
+    def _running_loop(self):
+        loop = self.loop
+        if loop.pid != os.getpid() or (loop.ident is not None and
+                                       not loop.is_alive()):
+            # Connected before the process forked, and the loop thread did
+            # not come along, or the loop thread died
+            self.loop = IOLoop.instance()
+            self.loop.add(self)
+        return self.loop
+
+    def _deadline(self):
+        if self.timeout is None:
+            return None
+        return time.time() + self.timeout
+
+    def _connected(self):
+        self.connected = True
+        if self.breaker is not None:
+            self.breaker.success()
+
+    # The rest is only called from the loop thread
+
+    def wants_read(self):
+        # Nothing is expected back, reading just notices the sink hang up
+        return self.connected and self.type == socket.SOCK_STREAM
+
+    def wants_write(self):
+        return not self.connected or bool(self.queue)
+
+    def expire(self, now):
+        """
+        Close the connection if it is done with, or has run out of time.
+        Returns whether it was closed.
+        """
+        if self.error is not None:
+            return True
+        if self.closing and not self.queue:
+            self._close()
+            return True
+        if self.deadline is not None and now >= self.deadline:
+            if not self.connected:
+                self._fail(socket.timeout('Timed out connecting'))
+            elif self.queue:
+                self._fail(socket.timeout('Timed out sending %d bytes'
+                                          % self.queued))
+            return self.error is not None
+        return False
+
+    def handle_read(self):
+        try:
+            data = self.sock.recv(65536)
+        except socket.error, e:
+            if e.args[0] not in WOULD_BLOCK:
+                self._fail(e)
+            return
+        if not data:
+            self._fail(socket.error(errno.ECONNRESET,
+                                    'Connection closed by the sink'))
+
+    def handle_write(self):
+        if not self.connected:
+            err = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+            if err:
+                self._fail(socket.error(err, os.strerror(err)))
+                return
+            with self.lock:
+                self.deadline = self._deadline() if self.queue else None
+            self._connected()
+        if self.type == socket.SOCK_STREAM:
+            self._write_stream()
+        else:
+            self._write_datagrams()
+        if self.closing and self.error is None and not self.queue:
+            self._close()
+
+    def _write_stream(self):
+        # Join as much of the queue as one send() can take, so many small
+        # writes cost a single system call. The buffers stay queued until
+        # they are sent in full, to be handed back if the connection fails.
+        with self.lock:
+            buffers = []
+            size = -self.offset
+            for data in self.queue:
+                buffers.append(data)
+                size += len(data)
+                if size >= WRITE_CHUNK:
+                    break
+            offset = self.offset
+        data = ''.join(buffers)[offset:]
+
+        try:
+            sent = self.sock.send(data)
+        except socket.error, e:
+            if e.args[0] not in WOULD_BLOCK:
+                self._fail(e)
+                return
+            sent = 0
+
+        with self.lock:
+            self.queued -= sent
+            done = self.offset + sent
+            while self.queue and done >= len(self.queue[0]):
+                done -= len(self.queue.popleft())
+            self.offset = done
+            if sent:
+                self.deadline = self._deadline() if self.queue else None
+
+    def _write_datagrams(self):
+        # Each queued buffer is a datagram of its own
+        while True:
+            with self.lock:
+                if not self.queue:
+                    self.deadline = None
+                    return
+                data = self.queue[0]
+            try:
+                self.sock.send(data)
+            except socket.error, e:
+                if e.args[0] not in WOULD_BLOCK:
+                    self._fail(e)
+                return
+            with self.lock:
+                self.queue.popleft()
+                self.queued -= len(data)
+
+    def _fail(self, error):
+        with self.lock:
+            self.error = error
+            self.unsent.extend(self.queue)
+            self.queue.clear()
+            self.offset = 0
+            self.queued = 0
+        self._close()
+        if self.breaker is not None and not self.closing:
+            self.breaker.failure()
+
+    def _close(self):
+        self.loop.remove(self)
+        self.sock.close()
+        self.closed = True
@@ -3,12 +3,16 @@
 [Logentries: Log Management & Analytics Made Easy ](https://logentries.com/).
 Send Diamond stats to your Logentries Account where you can monitor and alert
 based on data in real time.
+
+Events are posted over a keep-alive connection.
 """
 
 from Handler import Handler
+from httpsender import HTTPSender
+import httplib
 import logging
-import urllib2
 import json
+import socket
 from collections import deque
 
 
@@ -28,6 +32,11 @@ class LogentriesDiamondHandler(Handler):
         self.queue = deque([])
         if self.log_token is None:
             raise Exception
+        self.sender = HTTPSender(
+            "https://js.logentries.com/v1/logs/" + self.log_token,
+            headers={'Content-Type': 'application/json'},
+            timeout=float(self.config['timeout']),
+            breaker=self.breaker)
 
     def get_default_config_help(self):
         """
@@ -39,7 +48,8 @@ class LogentriesDiamondHandler(Handler):
         config.update({
             'log_token':
                 '[Your log token](https://logentries.com/doc/input-token/)',
-            'queue_size': ''
+            'queue_size': '',
+            'timeout': 'Request timeout in seconds',
         })
 
         return config
@@ -52,7 +62,8 @@ class LogentriesDiamondHandler(Handler):
 
         config.update({
             'log_token': '',
-            'queue_size': 100
+            'queue_size': 100,
+            'timeout': 15,
         })
 
         return config
@@ -75,9 +86,11 @@ class LogentriesDiamondHandler(Handler):
             metric = self.queue.popleft()
             topic, value, timestamp = str(metric).split()
             msg = json.dumps({"event": {topic: value}})
-            req = urllib2.Request("https://js.logentries.com/v1/logs/" +
-                                  self.log_token, msg)
             try:
-                urllib2.urlopen(req)
-            except urllib2.URLError, e:
+                status = self.sender.post(msg)
+            except (httplib.HTTPException, socket.error), e:
                 logging.error("Can't send log message to Logentries %s", e)
+                continue
+            if status >= 400:
+                logging.error("Can't send log message to Logentries, "
+                              "got HTTP %d", status)
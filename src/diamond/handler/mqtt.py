@@ -30,6 +30,13 @@ a `diamond.conf` containing something along these lines:
         # MQTT broker
         prefix = some/pre/fix       (default: "")
 
+        # Publish metrics this many at a time, as messages of one
+        # "path value timestamp" line per metric, to a single topic
+        # (prefixed like the others) instead of one message per metric
+        batch = 1                   (default: 1)
+        batch_topic = diamond/host  (default: diamond/<hostname>)
+        max_frame_size = 65536      (default: 65536 bytes)
+
         # If you want to connect to your MQTT broker with TLS, you'll have
         # to set the following four parameters
         tls = True          (default: False)
@@ -56,10 +63,13 @@ which subscribes to an MQTT broker and sends metrics off to Graphite.
   publishes its death at a topic called clients/diamond/<hostname>
 * Support for reconnecting to a broker is implemented and ought to
   work.
+* Messages can be read with diamond.handler.framing.decode(), passing the
+  topic for those not in batch mode.
 
 """
 
 from Handler import Handler
+from framing import frames
 from diamond.collector import get_hostname
 import os
 HAVE_SSL = True
@@ -99,6 +109,13 @@ class MQTTHandler(Handler):
         self.qos = int(self.config.get('qos', 0))
         self.prefix = self.config.get('prefix', "")
         self.tls = self.config.get('tls', False)
+        self.batch_size = int(self.config.get('batch', 1))
+        self.max_frame_size = int(self.config.get('max_frame_size', 65536))
+        self.batch_topic = self.config.get('batch_topic',
+                                           'diamond/%s' % self.hostname)
+        if len(self.prefix):
+            self.batch_topic = "%s/%s" % (self.prefix, self.batch_topic)
+        self.lines = []
         self.timestamp = 0
         try:
             self.timestamp = self.config['timestamp']
@@ -182,6 +199,12 @@ class MQTTHandler(Handler):
             return
 
         line = str(metric)
+        if self.batch_size > 1:
+            self.lines.append(line)
+            if len(self.lines) >= self.batch_size:
+                self._publish()
+            return
+
         topic, value, timestamp = line.split()
         if len(self.prefix):
             topic = "%s/%s" % (self.prefix, topic)
@@ -193,6 +216,23 @@ class MQTTHandler(Handler):
         else:
             self.mqttc.publish(topic, "%s %s" % (value, timestamp), self.qos)
 
+    def flush(self):
+        """
+        Publish the buffered metrics
+        """
+        if not mosquitto:
+            return
+        self._publish()
+
+    def _publish(self):
+        """
+        Publish the buffered metrics to the batch topic in as few messages
+        as fit
+        """
+        for frame in frames(self.lines, self.max_frame_size):
+            self.mqttc.publish(self.batch_topic, frame, self.qos)
+        self.lines = []
+
     def _disconnect(self, mosq, obj, rc):
 
         self.log.debug("MQTTHandler: reconnecting to broker...")
@@ -4,12 +4,28 @@
 Send metrics to a [graphite](http://graphite.wikidot.com/) using the default
 interface. Unlike GraphiteHandler, this one supports multiple graphite servers.
 Specify them as a list of hosts divided by comma.
+
+By default (`mode = mirror`) every metric is sent to every host. With
+`mode = shard` each metric is sent to only `replication_factor` of them,
+picked with the same consistent hash ring carbon-relay uses, so the metrics
+land on the carbon caches that own them. Hosts are then given as
+`host[:port[:instance]]`, like carbon's DESTINATIONS, and should be listed
+exactly as they are there. While a host is down its metrics go to the next
+host in the ring instead.
+
+With the default `transport = nonblocking` one I/O thread writes to all the
+hosts, so a slow host does not hold up the others.
 """
 
-from Handler import Handler
+from Handler import CircuitBreaker, Handler
 from graphite import GraphiteHandler
+from hashring import ConsistentHashRing, parse_destination
+from ioloop import Connection
 from copy import deepcopy
 
+# Maximum number of metric paths to remember the hosts of in shard mode
+ROUTE_CACHE_SIZE = 100000
+
 
 class MultiGraphiteHandler(Handler):
     """
@@ -17,6 +33,8 @@ class MultiGraphiteHandler(Handler):
     graphite servers by using two instances of GraphiteHandler
     """
 
+    handler_class = GraphiteHandler
+
     def __init__(self, config=None):
         """
         Create a new instance of the MultiGraphiteHandler class
@@ -27,11 +45,60 @@ class MultiGraphiteHandler(Handler):
         self.handlers = []
 
         # Initialize Options
+        self.mode = self.config['mode']
+        self.replication_factor = int(self.config['replication_factor'])
         hosts = self.config['host']
+        if isinstance(hosts, basestring):
+            hosts = [hosts]
+
+        if self.mode == 'shard':
+            self._init_shards(hosts)
+            return
+        elif self.mode != 'mirror':
+            self.log.error('%s: Unknown mode %r, using mirror',
+                           self.__class__.__name__, self.mode)
+            self.mode = 'mirror'
+
         for host in hosts:
             config = deepcopy(self.config)
             config['host'] = host
-            self.handlers.append(GraphiteHandler(config))
+            self.handlers.append(self.handler_class(config))
+
+    def _init_shards(self, hosts):
+        """
+        Create a handler per destination and the ring that picks between them
+        """
+        # Ring node -> handler for it
+        self.nodes = {}
+        # Carbon breaks ties between ring positions by the order the nodes
+        # were added in, so they have to be added in the configured order
+        nodes = []
+        # Handlers whose host was down the last time they sent
+        self.down = set()
+        # Metric path -> ring nodes in the order to try them
+        self.routes = {}
+
+        default_port = int(self.config['port'])
+        for destination in hosts:
+            host, port, instance = parse_destination(destination,
+                                                     default_port)
+            node = (host, instance)
+            if node in self.nodes:
+                self.log.error('%s: %s is the same ring node as an earlier '
+                               'host, ignoring it', self.__class__.__name__,
+                               destination)
+                continue
+            config = deepcopy(self.config)
+            config['host'] = host
+            config['port'] = port
+            handler = self.handler_class(config)
+            self.handlers.append(handler)
+            self.nodes[node] = handler
+            nodes.append(node)
+            if self._is_down(handler):
+                self.down.add(handler)
+
+        self.ring = ConsistentHashRing(nodes)
 
     def get_default_config_help(self):
         """
@@ -45,8 +112,20 @@ class MultiGraphiteHandler(Handler):
             'proto': 'udp or tcp',
             'timeout': '',
             'batch': 'How many to store before sending to the graphite server',
+            'batch_bytes': 'How many bytes of metrics to store before'
+                           ' sending, 0 for no limit',
+            'max_latency': 'Send stored metrics at least this often, in'
+                           ' seconds. 0 to only send them on flush',
             'max_backlog_multiplier': 'how many batches to store before trimming',  # NOQA
             'trim_backlog_multiplier': 'Trim down how many batches',
+            'mode': 'mirror to send every metric to every host, shard to'
+                    ' send each one to the hosts carbon-relay would pick',
+            'replication_factor': 'How many hosts to send each metric to in'
+                                  ' shard mode',
+            'transport': 'nonblocking to send from a shared I/O thread, or'
+                         ' blocking to write from the handler',
+            'high_water': 'Most bytes to queue for sending to each host with'
+                          ' the nonblocking transport',
         })
 
         return config
@@ -62,9 +141,15 @@ class MultiGraphiteHandler(Handler):
             'port': 2003,
             'proto': 'tcp',
             'timeout': 15,
-            'batch': 1,
+            'batch': 1000,
+            'batch_bytes': 16384,
+            'max_latency': 1,
             'max_backlog_multiplier': 5,
             'trim_backlog_multiplier': 4,
+            'mode': 'mirror',
+            'replication_factor': 1,
+            'transport': 'nonblocking',
+            'high_water': 1048576,
         })
 
         return config
@@ -74,10 +159,68 @@ class MultiGraphiteHandler(Handler):
         Process a metric by passing it to GraphiteHandler
         instances
         """
-        for handler in self.handlers:
-            handler.process(metric)
+        # Through _process, as each handler also sends from its own timer
+        if self.mode != 'shard':
+            for handler in self.handlers:
+                handler._process(metric)
+            return
+
+        for handler in self._route(metric.path):
+            handler._process(metric)
+            if self._is_down(handler):
+                self.down.add(handler)
+
+    def _is_down(self, handler):
+        """
+        Whether the host of handler could not be reached, or is being tried
+        again after that. A non-blocking connection is there while it is
+        still being refused or timing out, so its breaker and error tell.
+        """
+        if handler.socket is None:
+            return True
+        if handler.breaker.state != CircuitBreaker.CLOSED:
+            return True
+        return (isinstance(handler.socket, Connection) and
+                handler.socket.error is not None)
+
+    def _route(self, path):
+        """
+        Return the handlers for the first replication_factor hosts in the
+        ring for path that are up, or for the first ones regardless if too
+        few are
+        """
+        try:
+            nodes = self.routes[path]
+        except KeyError:
+            nodes = self.ring.get_nodes(path)
+            if len(self.routes) >= ROUTE_CACHE_SIZE:
+                self.routes.clear()
+            self.routes[path] = nodes
+
+        handlers = []
+        for node in nodes:
+            handler = self.nodes[node]
+            if handler not in self.down and not self._is_down(handler):
+                handlers.append(handler)
+                if len(handlers) == self.replication_factor:
+                    return handlers
+
+        # Let the hosts that should have it queue the rest
+        for node in nodes:
+            if len(handlers) == self.replication_factor:
+                break
+            handler = self.nodes[node]
+            if handler not in handlers:
+                handlers.append(handler)
+        return handlers
 
     def flush(self):
         """Flush metrics in queue"""
         for handler in self.handlers:
-            handler.flush()
+            handler._flush()
+
+        if self.mode == 'shard':
+            # Flushing reconnects the handlers whose host was down, so this
+            # is where they come back
+            self.down = set(handler for handler in self.handlers
+                            if self._is_down(handler))
@@ -2,10 +2,25 @@
 
 """
 Insert the collected values into a mysql table
+
+Rows are buffered and inserted `batch` at a time, or once `flush_interval`
+seconds have passed since the last insert, with a single multi-row INSERT and
+one commit per flush.
+
+#### Dependencies
+
+ * [MySQLdb](http://mysql-python.sourceforge.net/)
+
 """
 
+import time
+
 from Handler import Handler
-import MySQLdb
+
+try:
+    import MySQLdb
+except ImportError:
+    MySQLdb = None
 
 
 class MySQLHandler(Handler):
@@ -13,6 +28,7 @@ class MySQLHandler(Handler):
     Implements the abstract Handler class, sending data to a mysql table
     """
     conn = None
+    cursor = None
 
     def __init__(self, config=None):
         """
@@ -21,6 +37,12 @@ class MySQLHandler(Handler):
         # Initialize Handler
         Handler.__init__(self, config)
 
+        if MySQLdb is None:
+            self.log.error('MySQLHandler: MySQLdb import failed. '
+                           'Handler disabled')
+            self.enabled = False
+            return
+
         # Initialize Options
         self.hostname = self.config['hostname']
         self.port = int(self.config['port'])
@@ -31,6 +53,17 @@ class MySQLHandler(Handler):
         self.col_time = self.config['col_time']
         self.col_metric = self.config['col_metric']
         self.col_value = self.config['col_value']
+        self.batch_size = int(self.config['batch'])
+        self.flush_interval = float(self.config['flush_interval'])
+        self.max_backlog = int(self.config['max_backlog'])
+
+        # The statement is the same for every flush, MySQLdb turns
+        # executemany() of it into one multi-row INSERT
+        self.statement = (
+            "INSERT INTO %s (%s, %s, %s) VALUES (%%s, %%s, %%s)" % (
+                self.table, self.col_metric, self.col_time, self.col_value))
+        self.rows = []
+        self.last_flush = time.time()
 
         # Connect
         self._connect()
@@ -42,6 +75,11 @@ class MySQLHandler(Handler):
         config = super(MySQLHandler, self).get_default_config_help()
 
         config.update({
+            'batch': 'How many rows to insert at once',
+            'flush_interval': 'Insert buffered rows at least this often, in'
+                              ' seconds, even if there are fewer than batch',
+            'max_backlog': 'How many rows to keep while inserts fail, the'
+                           ' oldest are dropped after that',
         })
 
         return config
@@ -53,6 +91,9 @@ class MySQLHandler(Handler):
         config = super(MySQLHandler, self).get_default_config()
 
         config.update({
+            'batch': 100,
+            'flush_interval': 10,
+            'max_backlog': 10000,
         })
 
         return config
@@ -67,27 +108,46 @@ class MySQLHandler(Handler):
         """
         Process a metric
         """
-        # Just send the data
-        self._send(str(metric))
+        self.rows.append((metric.path, metric.timestamp, metric.value))
+        if len(self.rows) >= self.batch_size:
+            self._send()
+
+    def flush(self):
+        """
+        Insert the buffered rows if flush_interval has passed
+        """
+        if self.rows and time.time() - self.last_flush >= self.flush_interval:
+            self._send()
 
-    def _send(self, data):
+    def _send(self):
         """
-        Insert the data
+        Insert the buffered rows in one transaction
         """
-        data = data.strip().split(' ')
+        self.last_flush = time.time()
+        if not self.breaker.allow():
+            # MySQL is down, keep the rows until it is due to be tried again
+            # rather than wait on a connect for every metric
+            self._trim_backlog()
+            return
         try:
-            cursor = self.conn.cursor()
-            cursor.execute("INSERT INTO %s (%s, %s, %s) VALUES(%%s, %%s, %%s)"
-                           % (self.table, self.col_metric,
-                              self.col_time, self.col_value),
-                           (data[0], data[2], data[1]))
-            cursor.close()
+            if self.conn is None:
+                self._connect()
+            self.cursor.executemany(self.statement, self.rows)
             self.conn.commit()
-        except BaseException, e:
+            self.rows = []
+            self.breaker.success()
+        except Exception, e:
             # Log Error
-            self.log.error("MySQLHandler: Failed sending data. %s.", e)
-            # Attempt to restablish connection
-            self._connect()
+            self._throttle_error("MySQLHandler: Failed sending data. %s.", e)
+            self.breaker.failure()
+            # Keep the rows for the next flush, up to max_backlog
+            self._trim_backlog()
+            # Reconnect on the next flush
+            self._close()
+
+    def _trim_backlog(self):
+        if len(self.rows) > self.max_backlog:
+            del self.rows[:len(self.rows) - self.max_backlog]
 
     def _connect(self):
         """
@@ -99,11 +159,22 @@ class MySQLHandler(Handler):
                                     user=self.username,
                                     passwd=self.password,
                                     db=self.database)
+        self.cursor = self.conn.cursor()
 
     def _close(self):
         """
         Close the connection
         """
+        if self.cursor:
+            try:
+                self.cursor.close()
+            except Exception:
+                pass
+            self.cursor = None
         if self.conn:
-            self.conn.commit()
-            self.conn.close()
+            try:
+                self.conn.rollback()
+                self.conn.close()
+            except Exception:
+                pass
+            self.conn = None
@@ -6,16 +6,20 @@ do not try to use it as a normal handler
 """
 
 from Handler import Handler
+from diamond.metric import MetricBatch
 import Queue
 
 
 class QueueHandler(Handler):
-    def __init__(self, config=None, queue=None, log=None, should_exit=None):
+    def __init__(self, config=None, queue=None, log=None, should_exit=None,
+                 batch_size=256):
         # Initialize Handler
         Handler.__init__(self, config=config, log=log)
 
         self.queue = queue
         self.should_exit = should_exit
+        self.batch_size = batch_size
+        self.batch = MetricBatch()
 
     def __del__(self):
         """
@@ -32,11 +36,21 @@ class QueueHandler(Handler):
         We skip any locking code due to the fact that this is now a single
         process per collector
         """
-        try:
-            self.queue.put(metric, block=False)
-        except Queue.Full:
-            self.log.error("metric queue full")
-            self.should_exit.set()
+        self.batch.append(metric)
+        if len(self.batch) >= self.batch_size:
+            self._put(flush=False)
+
+    def process_batch(self, metrics):
+        return self._process_batch(metrics)
+
+    def _process_batch(self, metrics):
+        """
+        We skip any locking code due to the fact that this is now a single
+        process per collector
+        """
+        self.batch.extend(metrics)
+        if len(self.batch) >= self.batch_size:
+            self._put(flush=False)
 
     def flush(self):
         return self._flush()
@@ -46,10 +60,17 @@ class QueueHandler(Handler):
         We skip any locking code due to the fact that this is now a single
         process per collector
         """
-        # Send a None down the queue to indicate a flush
+        # Send the pending batch down the queue, marked as a flush
+        self._put(flush=True)
+
+    def _put(self, flush):
+        """
+        Send the pending batch down the queue as a single item
+        """
+        batch = self.batch
+        self.batch = MetricBatch()
         try:
-            self.queue.put(None, block=False)
+            self.queue.put((batch, flush), block=False)
         except Queue.Full:
             self.log.error("metric queue full")
             self.should_exit.set()
-
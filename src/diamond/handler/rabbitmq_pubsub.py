@@ -2,10 +2,18 @@
 
 """
 Output the collected values to RabitMQ pub/sub channel
+
+Each metric is published as its own message unless `batch` is above 1. Then
+metrics are buffered and published `batch` at a time, and at the end of
+every collector run, as messages of up to `max_frame_size` bytes with one
+line per metric. diamond.handler.framing.decode() reads both.
+
+Each server has its own circuit breaker: a server that can not be reached is
+skipped, and its messages dropped, until it is due to be tried again.
 """
 
 from Handler import Handler
-import time
+from framing import frames
 
 try:
     import pika
@@ -35,7 +43,7 @@ class rmqHandler (Handler):
         # Initialize Data
         self.connections = {}
         self.channels = {}
-        self.reconnect_interval = 1
+        self.breakers = {}
 
         # Initialize Options
         tmp_rmq_server = self.config['rmq_server']
@@ -52,6 +60,9 @@ class rmqHandler (Handler):
         self.rmq_exchange_type = 'fanout'
         self.rmq_durable = True
         self.rmq_heartbeat_interval = 300
+        self.batch_size = int(self.config['batch'])
+        self.max_frame_size = int(self.config['max_frame_size'])
+        self.lines = []
 
         self.get_config()
         # Create rabbitMQ pub socket and bind
@@ -93,6 +104,10 @@ class rmqHandler (Handler):
         config.update({
             'server': '',
             'rmq_exchange': '',
+            'batch': 'How many metrics to publish in one go. 1 publishes'
+                     ' each metric as its own message',
+            'max_frame_size': 'The largest message to publish in batch mode,'
+                              ' in bytes',
         })
         return config
 
@@ -105,6 +120,8 @@ class rmqHandler (Handler):
         config.update({
             'server': '127.0.0.1',
             'rmq_exchange': 'diamond',
+            'batch': 1,
+            'max_frame_size': 65536,
         })
 
         return config
@@ -139,35 +156,30 @@ class rmqHandler (Handler):
             virtual_host=self.rmq_vhost,
             credentials=credentials,
             heartbeat_interval=self.rmq_heartbeat_interval,
-            retry_delay=5,
-            connection_attempts=3)
+            connection_attempts=1)
 
         self.connections[rmq_server] = None
-        while (self.connections[rmq_server] is None or
-               self.connections[rmq_server].is_open is False):
-            try:
-                self.connections[rmq_server] = pika.BlockingConnection(
-                    parameters)
-                self.channels[rmq_server] = self.connections[
-                    rmq_server].channel()
-                self.channels[rmq_server].exchange_declare(
-                    exchange=self.rmq_exchange,
-                    type=self.rmq_exchange_type,
-                    durable=self.rmq_durable)
-                # Reset reconnect_interval after a successful connection
-                self.reconnect_interval = 1
-            except Exception, exception:
-                self.log.debug("Caught exception in _bind: %s", exception)
-                if rmq_server in self.connections.keys():
-                    self._unbind(rmq_server)
-
-                if self.reconnect_interval >= 16:
-                    break
-
-                if self.reconnect_interval < 16:
-                    self.reconnect_interval = self.reconnect_interval * 2
+        self.channels[rmq_server] = None
+        if rmq_server not in self.breakers:
+            self.breakers[rmq_server] = self._new_breaker()
+        breaker = self.breakers[rmq_server]
+        if not breaker.allow():
+            return
 
-                time.sleep(self.reconnect_interval)
+        try:
+            self.connections[rmq_server] = pika.BlockingConnection(
+                parameters)
+            self.channels[rmq_server] = self.connections[
+                rmq_server].channel()
+            self.channels[rmq_server].exchange_declare(
+                exchange=self.rmq_exchange,
+                type=self.rmq_exchange_type,
+                durable=self.rmq_durable)
+            breaker.success()
+        except Exception, exception:
+            self.log.debug("Caught exception in _bind: %s", exception)
+            self._unbind(rmq_server)
+            breaker.failure()
 
     def _unbind(self, rmq_server=None):
         """ Close AMQP connection and unset channel """
@@ -191,6 +203,28 @@ class rmqHandler (Handler):
         """
           Process a metric and send it to RMQ pub socket
         """
+        if self.batch_size <= 1:
+            self._publish(["%s" % metric])
+            return
+
+        self.lines.append(str(metric))
+        if len(self.lines) >= self.batch_size:
+            self._publish(frames(self.lines, self.max_frame_size))
+            self.lines = []
+
+    def flush(self):
+        """
+          Publish the buffered metrics
+        """
+        if self.lines:
+            self._publish(frames(self.lines, self.max_frame_size))
+            self.lines = []
+
+    def _publish(self, bodies):
+        """
+          Publish bodies to every RMQ server, checking each connection once
+        """
+        bodies = list(bodies)
         for rmq_server in self.connections.keys():
             try:
                 if ((self.connections[rmq_server] is None or
@@ -198,12 +232,16 @@ class rmqHandler (Handler):
                     self._bind(rmq_server)
 
                 channel = self.channels[rmq_server]
-                channel.basic_publish(exchange=self.rmq_exchange,
-                                      routing_key='', body="%s" % metric)
+                if channel is None:
+                    # Down, and not due to be tried again yet
+                    continue
+                for body in bodies:
+                    channel.basic_publish(exchange=self.rmq_exchange,
+                                          routing_key='', body=body)
             except Exception, exception:
                 self.log.error(
-                    "Failed publishing to %s, attempting reconnect",
-                    rmq_server)
+                    "Failed publishing to %s, reconnecting on the next"
+                    " publish", rmq_server)
                 self.log.debug("Caught exception: %s", exception)
                 self._unbind(rmq_server)
-                self._bind(rmq_server)
+                self.breakers[rmq_server].failure()
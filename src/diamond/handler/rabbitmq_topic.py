@@ -52,10 +52,7 @@ class rmqHandler (Handler):
             return
 
         # Create rabbitMQ topic exchange and bind
-        try:
-            self._bind()
-        except pika.exceptions.AMQPConnectionError:
-            self.log.error('Failed to bind to rabbitMQ topic exchange')
+        self._bind()
 
     def get_default_config_help(self):
         """
@@ -94,8 +91,13 @@ class rmqHandler (Handler):
 
     def _bind(self):
         """
-           Create  socket and bind
+           Create  socket and bind, unless the server was found down and is
+           not due to be tried again yet
         """
+        self.connection = None
+        self.channel = None
+        if not self.breaker.allow():
+            return
 
         credentials = pika.PlainCredentials(self.user, self.password)
         params = pika.ConnectionParameters(credentials=credentials,
@@ -103,13 +105,22 @@ class rmqHandler (Handler):
                                            virtual_host=self.vhost,
                                            port=self.port)
 
-        self.connection = pika.BlockingConnection(params)
-        self.channel = self.connection.channel()
-
-        # NOTE : PIKA version uses 'exchange_type' instead of 'type'
-
-        self.channel.exchange_declare(exchange=self.topic_exchange,
-                                      exchange_type="topic")
+        try:
+            self.connection = pika.BlockingConnection(params)
+            self.channel = self.connection.channel()
+
+            # NOTE : PIKA version uses 'exchange_type' instead of 'type'
+
+            self.channel.exchange_declare(exchange=self.topic_exchange,
+                                          exchange_type="topic")
+        except Exception, exception:
+            self.log.error('Failed to bind to rabbitMQ topic exchange: %s',
+                           exception)
+            self.connection = None
+            self.channel = None
+            self.breaker.failure()
+            return
+        self.breaker.success()
 
     def __del__(self):
         """
@@ -128,6 +139,12 @@ class rmqHandler (Handler):
         if not pika:
             return
 
+        if self.channel is None:
+            self._bind()
+            if self.channel is None:
+                # Down, skip metrics until it is due to be tried again
+                return
+
         routingKeyDic = {
             'metric': lambda: metric.path,
             'custom': lambda: self.custom_routing_key,
@@ -149,7 +166,8 @@ class rmqHandler (Handler):
                 routing_key=routingKeyDic[self.routing_key](),
                 body="%s" % metric)
 
-        except Exception:  # Rough connection re-try logic.
+        except Exception:  # Reconnect on the next metric
             self.log.info(
                 "Failed publishing to rabbitMQ. Attempting reconnect")
+            self.breaker.failure()
             self._bind()
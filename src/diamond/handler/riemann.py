@@ -15,11 +15,26 @@ It has these options:
  * `host` - The Riemann host to connect to.
  * `port` - The port it's on.
  * `transport` - Either `tcp` or `udp`. (default: `tcp`)
+ * `batch` - How many events to send in one message. (default: `100`)
+ * `flush_interval` - Send buffered events at least this often, in seconds.
+   (default: `10`)
+ * `max_backlog` - How many events to keep while Riemann can not be reached.
+   (default: `10000`)
+ * `max_udp_size` - The largest message to send over udp, in bytes. Riemann
+   drops larger ones. (default: `16384`)
+
+Events are sent many to a message, so over tcp they wait for one
+acknowledgement per batch rather than one each. A batch is sent once `batch`
+events are buffered, `flush_interval` seconds after the last one was sent, or
+at the end of a collector run.
 
 """
 
 from Handler import Handler
 import logging
+import time
+from collections import deque
+from itertools import islice
 try:
     import bernhard
 except ImportError:
@@ -34,12 +49,20 @@ class RiemannHandler(Handler):
 
         if bernhard is None:
             logging.error("Failed to load bernhard module")
+            self.enabled = False
             return
 
         # Initialize options
         self.host = self.config['host']
         self.port = int(self.config['port'])
         self.transport = self.config['transport']
+        self.batch_size = int(self.config['batch'])
+        self.flush_interval = float(self.config['flush_interval'])
+        self.max_udp_size = int(self.config['max_udp_size'])
+
+        # Protobuf events waiting to be sent
+        self.events = deque([], int(self.config['max_backlog']))
+        self.last_send = time.time()
 
         # Initialize client
         if self.transport == 'tcp':
@@ -58,6 +81,12 @@ class RiemannHandler(Handler):
             'host': '',
             'port': '',
             'transport': 'tcp or udp',
+            'batch': 'How many events to send in one message',
+            'flush_interval': 'Send buffered events at least this often, in'
+                              ' seconds',
+            'max_backlog': 'How many events to keep while Riemann can not be'
+                           ' reached',
+            'max_udp_size': 'The largest message to send over udp, in bytes',
         })
 
         return config
@@ -72,20 +101,86 @@ class RiemannHandler(Handler):
             'host': '',
             'port': 123,
             'transport': 'tcp',
+            'batch': 100,
+            'flush_interval': 10,
+            'max_backlog': 10000,
+            'max_udp_size': 16384,
         })
 
         return config
 
     def process(self, metric):
         """
-        Send a metric to Riemann.
+        Queue a metric to be sent to Riemann.
         """
-        event = self._metric_to_riemann_event(metric)
-        try:
-            self.client.send(event)
-        except Exception, e:
-            self.log.error("RiemannHandler: Error sending event to Riemann: %s",
-                           e)
+        self.events.append(
+            self._riemann_event_to_pb(self._metric_to_riemann_event(metric)))
+        if (len(self.events) >= self.batch_size or
+                time.time() - self.last_send >= self.flush_interval):
+            self._send()
+
+    def flush(self):
+        """
+        Send the queued events to Riemann.
+        """
+        self._send()
+
+    def _send(self):
+        """
+        Send the queued events, a batch per message. Events Riemann could not
+        be reached for stay queued, and stay there without trying while the
+        circuit breaker is open.
+        """
+        self.last_send = time.time()
+        while self.events:
+            if not self.breaker.allow():
+                return
+            count = self._message_size()
+            message = bernhard.Message(message=bernhard.pb.Msg())
+            message.message.events.extend(islice(self.events, count))
+            try:
+                response = self.client.transmit(message)
+            except Exception, e:
+                self._throttle_error(
+                    "RiemannHandler: Error sending events to Riemann: %s", e)
+                self.breaker.failure()
+                return
+
+            # Only tcp gets a response. The client has already reconnected
+            # and tried again if it got none.
+            if self.transport == 'tcp' and not response.ok:
+                if not response.error:
+                    self._throttle_error("RiemannHandler: No response from "
+                                         "Riemann, keeping %d events",
+                                         len(self.events))
+                    self.breaker.failure()
+                    return
+                # Sending them again won't help
+                self._throttle_error("RiemannHandler: Riemann rejected %d "
+                                     "events: %s", count, response.error)
+            else:
+                self._reset_errors()
+            self.breaker.success()
+
+            for i in xrange(count):
+                self.events.popleft()
+
+    def _message_size(self):
+        """
+        Return how many of the queued events to put in the next message
+        """
+        count = min(len(self.events), self.batch_size)
+        if self.transport == 'tcp':
+            return count
+
+        # Keep udp messages to one datagram Riemann will take. Each event
+        # costs its own size, a tag byte and at most two length bytes.
+        size = 0
+        for i, event in enumerate(islice(self.events, count)):
+            size += event.ByteSize() + 3
+            if size > self.max_udp_size:
+                return max(i, 1)
+        return count
 
     def _metric_to_riemann_event(self, metric):
         """
@@ -106,6 +201,19 @@ class RiemannHandler(Handler):
             'ttl': metric.ttl,
         }
 
+    def _riemann_event_to_pb(self, event):
+        """
+        Convert an event dictionary to a Riemann protobuf Event, leaving out
+        the fields that are None.
+        """
+        pb_event = bernhard.pb.Event()
+        for field, value in event.iteritems():
+            if value is not None:
+                if field == 'metric':
+                    field = 'metric_f'
+                setattr(pb_event, field, value)
+        return pb_event
+
     def _close(self):
         """
         Disconnect from Riemann.
@@ -2,12 +2,18 @@
 
 """
 Save stats in RRD files using rrdtool.
+
+Updates are buffered per file and written out in batches, either over the
+[rrdcached](http://oss.oetiker.ch/rrdtool/doc/rrdcached.en.html) BATCH
+protocol when `rrdcached` is set, or with one `rrdupdate` call per file.
 """
 
 import os
 import re
+import socket
 import subprocess
-import Queue
+import time
+from collections import deque
 
 from Handler import Handler
 
@@ -24,7 +30,16 @@ BASEDIR = '/var/lib/collectd/rrd'
 
 METRIC_STEP = 10
 
-BATCH_SIZE = 1
+BATCH_SIZE = 10
+
+# Write a file's updates once the oldest has waited this many seconds,
+# even if there are fewer than BATCH_SIZE of them.
+FLUSH_INTERVAL = 300
+
+# Updates kept per file while they can not be written; older ones are dropped.
+MAX_BACKLOG = 720
+
+RRDCACHED_PORT = 42217
 
 # NOTE: We don't really have a rigorous defition
 # for metrics, particularly how often they will be
@@ -59,25 +74,25 @@ RRA_SPECS = [
 
 class RRDHandler(Handler):
 
-    # NOTE: This handler is fairly loose about locking (none),
-    # and the reason is because the calls are always protected
-    # by locking done in the _process and _flush routines.
-    # If this were to change at some point, we would definitely
-    # want to be a bit more sensible about how we lock.
-    #
-    # We would probably also want to restructure this as a
-    # consumer and producer so that one thread can continually
-    # write out data, but that really depends on the design
-    # at the top level.
+    # NOTE: Updates are only ever buffered and written from process() and
+    # flush(), which the Handler base class already serialises, so the
+    # per-file buffers are plain deques without any locking of their own.
 
     def __init__(self, *args, **kwargs):
         super(RRDHandler, self).__init__(*args, **kwargs)
         self._exists_cache = dict()
         self._basedir = self.config['basedir']
-        self._batch = self.config['batch']
-        self._step = self.config['step']
-        self._queues = {}
+        self._batch = int(self.config['batch'])
+        self._step = int(self.config['step'])
+        self._flush_interval = int(self.config['flush_interval'])
+        self._max_backlog = int(self.config['max_backlog'])
+        self._rrdcached = self.config['rrdcached']
+        self._timeout = float(self.config['timeout'])
+        # filename -> deque of pending (timestamp, value) updates
+        self._buffers = {}
         self._last_update = {}
+        self._socket = None
+        self._reader = None
 
     def get_default_config_help(self):
         config = super(RRDHandler, self).get_default_config_help()
@@ -85,6 +100,14 @@ class RRDHandler(Handler):
             'basedir': 'The base directory for all RRD files.',
             'batch': 'Wait for this many updates before saving to the RRD file',
             'step': 'The minimum interval represented in generated RRD files.',
+            'flush_interval': 'Save updates to the RRD file once the oldest'
+                              ' has waited this many seconds, even if there'
+                              ' are fewer than batch',
+            'max_backlog': 'Maximum number of updates kept per RRD file while'
+                           ' they can not be saved',
+            'rrdcached': 'Send updates to this rrdcached, as unix:/path or'
+                         ' host[:port], instead of running rrdupdate',
+            'timeout': 'Socket timeout for rrdcached, in seconds',
         })
         return config
 
@@ -94,9 +117,19 @@ class RRDHandler(Handler):
             'basedir': BASEDIR,
             'batch': BATCH_SIZE,
             'step': METRIC_STEP,
+            'flush_interval': FLUSH_INTERVAL,
+            'max_backlog': MAX_BACKLOG,
+            'rrdcached': '',
+            'timeout': 15,
         })
         return config
 
+    def __del__(self):
+        """
+        Destroy instance of the RRDHandler class
+        """
+        self._close()
+
     def _ensure_exists(self, filename, metric_name, metric_type):
         # We're good to go!
         if filename in self._exists_cache:
@@ -155,69 +188,167 @@ class RRDHandler(Handler):
         # we would like to have exceptions related to creating
         # the RRD file raised in the main thread.
         self._ensure_exists(filename, metric_name, metric.metric_type)
-        if self._queue(filename, metric.timestamp, metric.value) >= self._batch:
-            self._flush_queue(filename)
 
-    def _queue(self, filename, timestamp, value):
-        if filename not in self._queues:
-            queue = Queue.Queue()
-            self._queues[filename] = queue
-        else:
-            queue = self._queues[filename]
-        queue.put((timestamp, value))
-        return queue.qsize()
+        buf = self._buffers.get(filename)
+        if buf is None:
+            buf = deque(maxlen=self._max_backlog)
+            self._buffers[filename] = buf
+        # RRD only supports granularity at a
+        # per-second level (not milliseconds, etc.).
+        buf.append((int(metric.timestamp), metric.value))
 
     def flush(self):
-        # Grab all current queues.
-        for filename in self._queues.keys():
-            self._flush_queue(filename)
-
-    def _flush_queue(self, filename):
-        queue = self._queues[filename]
-
-        # Collect all pending updates.
-        updates = {}
-        max_timestamp = 0
-        while True:
-            try:
-                (timestamp, value) = queue.get(block=False)
-                # RRD only supports granularity at a
-                # per-second level (not milliseconds, etc.).
-                timestamp = int(timestamp)
-
-                # Remember the latest update done.
-                last_update = self._last_update.get(filename, 0)
-                if last_update >= timestamp:
-                    # Yikes. RRDtool won't let us do this.
-                    # We need to drop this update and log a warning.
-                    self.log.warning(
-                        "Dropping update to %s. Too frequent!" % filename)
-                    continue
-                max_timestamp = max(timestamp, max_timestamp)
-
-                # Add this update.
-                if timestamp not in updates:
-                    updates[timestamp] = []
-                updates[timestamp].append(value)
-            except Queue.Empty:
-                break
-
-        # Save the last update time.
-        self._last_update[filename] = max_timestamp
-
-        if len(updates) > 0:
-            # Construct our command line.
-            # This will look like <time>:<value1>[:<value2>...]
-            # The timestamps must be sorted, and we each of the
-            # <time> values must be unique (like a snowflake).
-            data_points = map(
-                lambda (timestamp, values): "%d:%s" %
-                (timestamp, ":".join(map(str, values))),
-                sorted(updates.items()))
-
-            # Optimisticly update.
-            # Nothing can really be done if we fail.
-            rrd_update_cmd = ["rrdupdate", filename, "--"]
-            rrd_update_cmd.extend(data_points)
-            self.log.info("update: %s" % str(rrd_update_cmd))
-            subprocess.call(rrd_update_cmd)
+        """
+        Save the updates of every file that has a full batch, or whose
+        oldest update has waited flush_interval seconds
+        """
+        now = time.time()
+        self._write([
+            filename for filename, buf in self._buffers.iteritems()
+            if buf and (len(buf) >= self._batch or
+                        now - buf[0][0] >= self._flush_interval)])
+
+    def _write(self, filenames):
+        updates = []
+        for filename in filenames:
+            points = self._take(filename)
+            if points:
+                updates.append((filename, points))
+        if not updates:
+            return
+
+        if self._rrdcached:
+            if not self._send_batch(updates):
+                # rrdcached is unreachable, keep the updates for next time
+                for filename, points in updates:
+                    self._requeue(filename, points)
+            return
+
+        for filename, points in updates:
+            self._update(filename, points)
+
+    def _take(self, filename):
+        """
+        Empty the buffer of a file, returning its updates in time order with
+        any that RRDtool would reject as too frequent dropped
+        """
+        buf = self._buffers[filename]
+        last_update = self._last_update.get(filename, 0)
+        points = []
+        for timestamp, value in sorted(buf):
+            if timestamp <= last_update:
+                # Yikes. RRDtool won't let us do this.
+                # We need to drop this update and log a warning.
+                self.log.warning(
+                    "Dropping update to %s. Too frequent!" % filename)
+                continue
+            points.append((timestamp, value))
+            last_update = timestamp
+        buf.clear()
+        return points
+
+    def _requeue(self, filename, points):
+        # Put the updates back ahead of anything buffered since, dropping the
+        # oldest if that is more than the backlog allows
+        buf = self._buffers[filename]
+        self._buffers[filename] = deque(points + list(buf),
+                                        maxlen=self._max_backlog)
+
+    def _update(self, filename, points):
+        # Optimisticly update.
+        # Nothing can really be done if we fail.
+        rrd_update_cmd = ["rrdupdate", filename, "--"]
+        rrd_update_cmd.extend("%d:%s" % point for point in points)
+        self.log.debug("update: %s" % str(rrd_update_cmd))
+        self._last_update[filename] = points[-1][0]
+        if subprocess.call(rrd_update_cmd, close_fds=True) != 0:
+            self._throttle_error("RRDHandler: rrdupdate of %s failed",
+                                 filename)
+
+    def _connect(self):
+        address = self._rrdcached
+        if address.startswith('unix:'):
+            address = address[len('unix:'):]
+
+        if address.startswith('/'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            host, _, port = address.partition(':')
+            address = self._getaddrinfo(host, int(port or RRDCACHED_PORT),
+                                        socket.AF_INET,
+                                        socket.SOCK_STREAM)[0][4]
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self._timeout)
+        try:
+            sock.connect(address)
+        except:
+            sock.close()
+            raise
+        self._socket = sock
+        self._reader = sock.makefile('rb')
+
+    def _read_status(self):
+        line = self._reader.readline()
+        if not line:
+            raise socket.error('rrdcached closed the connection')
+        status, _, message = line.rstrip('\n').partition(' ')
+        status = int(status)
+        if status < 0:
+            raise socket.error('rrdcached: %s' % message)
+        return status
+
+    def _send_batch(self, updates):
+        """
+        Send the updates to rrdcached in a single BATCH. Returns False if
+        rrdcached could not be reached, or is not due to be tried again yet
+        after failing, in which case nothing was sent.
+        """
+        if self._socket is None and not self.breaker.allow():
+            return False
+
+        lines = ['BATCH\n']
+        for filename, points in updates:
+            lines.append('UPDATE %s %s\n' % (
+                filename, ' '.join('%d:%s' % point for point in points)))
+        lines.append('.\n')
+        self.log.debug("RRDHandler: sending %d updates to rrdcached",
+                       len(updates))
+
+        try:
+            if self._socket is None:
+                self._connect()
+            # rrdcached reads the commands after its "Go ahead", so the whole
+            # batch can go out in one write
+            self._socket.sendall(''.join(lines))
+            self._read_status()
+            errors = self._read_status()
+            for _ in xrange(errors):
+                number, _, message = self._reader.readline().rstrip(
+                    '\n').partition(' ')
+                # Commands in the batch are numbered from 1
+                filename = updates[int(number) - 1][0]
+                self.log.warning("RRDHandler: rrdcached rejected update"
+                                 " of %s: %s", filename, message)
+        except (socket.error, ValueError, IndexError), e:
+            self._throttle_error("RRDHandler: error sending to rrdcached"
+                                 " at %s: %s", self._rrdcached, e)
+            self._close()
+            self.breaker.failure()
+            return False
+
+        for filename, points in updates:
+            self._last_update[filename] = points[-1][0]
+        self.breaker.success()
+        self._reset_errors()
+        return True
+
+    def _close(self):
+        """
+        Close the connection to rrdcached
+        """
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
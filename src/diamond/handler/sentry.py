@@ -26,10 +26,16 @@ max = 8.5
 name = Free Memory
 path = memory.MemFree
 min = 66020000
+
+Rules are looked up through a combined matcher: rules whose path ends in
+literal text are indexed by that text, so a metric is only checked against
+the few rules that could match it. Matches are kept in an LRU cache of
+`cache_size` metric paths.
 """
 
 import logging
 import re
+from collections import OrderedDict
 
 from Handler import Handler
 from diamond.collector import get_hostname
@@ -44,6 +50,12 @@ __author__ = 'Bruno Clermont'
 __email__ = 'bruno.clermont@gmail.com'
 
 
+# Characters that stand for themselves in a regular expression
+LITERAL_CHARS = frozenset('abcdefghijklmnopqrstuvwxyz'
+                          'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+                          '0123456789_-:/%@#,;=<> ')
+
+
 class InvalidRule(ValueError):
     """
     invalid rule
@@ -51,6 +63,38 @@ class InvalidRule(ValueError):
     pass
 
 
+def literal_suffix(pattern):
+    """
+    Return the literal text any string fully matched by the regular
+    expression pattern must end with, possibly ''
+    """
+    if '|' in pattern or '(?' in pattern:
+        # Alternatives or flags could change what the end has to be
+        return ''
+
+    # Split into single characters and escapes
+    tokens = []
+    i = 0
+    while i < len(pattern):
+        if pattern[i] == '\\' and i + 1 < len(pattern):
+            tokens.append(pattern[i:i + 2])
+            i += 2
+        else:
+            tokens.append(pattern[i])
+            i += 1
+
+    suffix = []
+    for token in reversed(tokens):
+        if token in LITERAL_CHARS:
+            suffix.append(token)
+        elif len(token) == 2 and not token[1].isalnum():
+            # An escaped punctuation character, such as \.
+            suffix.append(token[1])
+        else:
+            break
+    return ''.join(reversed(suffix))
+
+
 class BaseResult(object):
     """
     Base class for a Rule minimum/maximum check result
@@ -175,17 +219,23 @@ class Rule(object):
 
         # compile path regular expression
         self.regexp = re.compile(r'(?P<prefix>.*)\.(?P<path>%s)$' % path)
+        # what every matching metric path ends with
+        self.suffix = literal_suffix(path)
 
-    def process(self, metric, handler):
+    def process(self, metric, handler, match=None):
         """
         process a single diamond metric
         @type metric: diamond.metric.Metric
         @param metric: metric to process
         @type handler: diamond.handler.sentry.SentryHandler
         @param handler: configured Sentry graphite handler
+        @type match: re.MatchObject
+        @param match: optional result of matching the metric path against
+            this rule, if already known
         @rtype None
         """
-        match = self.regexp.match(metric.path)
+        if match is None:
+            match = self.regexp.match(metric.path)
         if match:
             minimum = Minimum(metric.value, self.min)
             maximum = Maximum(metric.value, self.max)
@@ -224,6 +274,70 @@ class Rule(object):
                                          self.regexp.pattern)
 
 
+class RuleMatcher(object):
+    """
+    Finds the rules matching a metric path without trying every rule
+
+    Rules are indexed by the literal text their path ends with, so only rules
+    whose suffix the metric path ends with are tried, one dict lookup per
+    distinct suffix length. Rules without such a suffix are always tried.
+    """
+
+    def __init__(self, rules, cache_size):
+        """
+        @type rules: list of Rule
+        @type cache_size: int
+        @param cache_size: how many metric paths to remember the matching
+            rules of
+        """
+        self.rules = rules
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.order = dict((id(rule), i) for i, rule in enumerate(rules))
+
+        self.by_suffix = {}
+        self.unindexed = []
+        for rule in rules:
+            if rule.suffix:
+                self.by_suffix.setdefault(rule.suffix, []).append(rule)
+            else:
+                self.unindexed.append(rule)
+        self.lengths = sorted(set(len(suffix) for suffix in self.by_suffix))
+
+    def candidates(self, path):
+        """
+        Return the rules that could match path, in configuration order
+        """
+        candidates = list(self.unindexed)
+        for length in self.lengths:
+            if length > len(path):
+                break
+            rules = self.by_suffix.get(path[-length:])
+            if rules:
+                candidates.extend(rules)
+        if len(candidates) > 1:
+            candidates.sort(key=lambda rule: self.order[id(rule)])
+        return candidates
+
+    def match(self, path):
+        """
+        Return a list of (rule, match) for the rules matching path
+        """
+        matches = self.cache.pop(path, None)
+        if matches is None:
+            matches = []
+            for rule in self.candidates(path):
+                match = rule.regexp.match(path)
+                if match:
+                    matches.append((rule, match))
+            # Most paths match nothing, share one empty result for them
+            matches = tuple(matches)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem(last=False)
+        self.cache[path] = matches
+        return matches
+
+
 class SentryHandler(Handler):
     """
     Diamond handler that check if a metric goes too low or too high
@@ -246,6 +360,8 @@ class SentryHandler(Handler):
         self.raven_logger.addHandler(self.sentry_log_handler)
         self.configure_sentry_errors()
         self.rules = self.compile_rules()
+        self.matcher = RuleMatcher(self.rules,
+                                   int(self.config['cache_size']))
         self.hostname = get_hostname(self.config)
         if not len(self.rules):
             self.log.warning("No rules, this graphite handler is unused")
@@ -258,6 +374,8 @@ class SentryHandler(Handler):
 
         config.update({
             'dsn': '',
+            'cache_size': 'How many metric paths to remember the matching'
+                          ' rules of',
         })
 
         return config
@@ -270,6 +388,7 @@ class SentryHandler(Handler):
 
         config.update({
             'dsn': '',
+            'cache_size': 100000,
         })
 
         return config
@@ -353,8 +472,8 @@ class SentryHandler(Handler):
         @param metric: metric to process
         @rtype None
         """
-        for rule in self.rules:
-            rule.process(metric, self)
+        for rule, match in self.matcher.match(metric.path):
+            rule.process(metric, self, match)
 
     def __repr__(self):
         return "SentryHandler '%s' %d rules" % (
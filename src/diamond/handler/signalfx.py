@@ -23,14 +23,21 @@ Enable this handler
        include_filters = "^diskspace\..*\.byte_avail$", "^loadavg\.01"
        include_filters = "^sockets\.",
                                      ^ note trailing comma to indicate a list
+
+Datapoints are posted over a keep-alive connection, optionally gzip
+compressed, at least every `batch_max_interval` seconds. Failed posts are
+retried `retries` times with backoff; after that the datapoints are kept for
+the next post, up to `max_backlog` of them.
 """
 
 from Handler import Handler
+from httpsender import FlushTimer, HTTPSender
 from diamond.util import get_diamond_version
+import httplib
 import json
 import logging
+import socket
 import time
-import urllib2
 import re
 
 
@@ -43,8 +50,9 @@ class SignalfxHandler(Handler):
         self.batch_size = int(self.config['batch'])
         self.url = self.config['url']
         self.auth_token = self.config['auth_token']
-        self.batch_max_interval = self.config['batch_max_interval']
+        self.batch_max_interval = int(self.config['batch_max_interval'])
         self.request_timeout = int(self.config['request_timeout'])
+        self.max_backlog = int(self.config['max_backlog'])
         self.resetBatchTimeout()
         # If a user leaves off the ending comma, cast to a array for them
         include_filters = self.config['include_filters']
@@ -55,8 +63,24 @@ class SignalfxHandler(Handler):
 
         if self.auth_token == "":
             logging.error("Failed to load Signalfx module")
+            self.enabled = False
             return
 
+        self.sender = HTTPSender(
+            self.url,
+            headers={"Content-type": "application/json",
+                     "X-SF-TOKEN": self.auth_token,
+                     "User-Agent": self.user_agent()},
+            compression=str(self.config['compression']) == 'True',
+            timeout=self.request_timeout,
+            retries=int(self.config['retries']),
+            backoff=float(self.config['backoff']),
+            breaker=self.breaker)
+        # Send datapoints that have waited batch_max_interval even when no
+        # new ones arrive
+        self.timer = FlushTimer(self._flush, self.batch_max_interval,
+                                'SignalfxHandler')
+
     def resetBatchTimeout(self):
         self.batch_max_timestamp = int(time.time() + self.batch_max_interval)
 
@@ -72,6 +96,11 @@ class SignalfxHandler(Handler):
             'auth_token': 'Org API token to use when sending metrics',
             'include_filters': 'Regex pattern to filter which metrics are sent',
             'request_timeout': 'Timeout in seconds to use for requests to signalfx',
+            'compression': 'Gzip request bodies',
+            'retries': 'How many times to retry a failed post',
+            'backoff': 'Seconds to wait before the first retry, doubled for'
+                       ' each further one',
+            'max_backlog': 'How many datapoints to keep while posts fail',
             })
 
         return config
@@ -90,6 +119,10 @@ class SignalfxHandler(Handler):
             'auth_token': '',
             'include_filters': ['^.*'],
             'request_timeout': 60,
+            'compression': False,
+            'retries': 2,
+            'backoff': 0.5,
+            'max_backlog': 10000,
             })
 
         return config
@@ -98,6 +131,7 @@ class SignalfxHandler(Handler):
         """
         Queue a metric.  Flushing queue if batch size reached
         """
+        self.timer.start()
         path = metric.getCollectorPath()
         path += '.'
         path += metric.getMetricPath()
@@ -135,6 +169,7 @@ class SignalfxHandler(Handler):
 
     def flush(self):
         """Flush metrics in queue"""
+        self.timer.start()
         self._send()
 
     def user_agent(self):
@@ -144,6 +179,10 @@ class SignalfxHandler(Handler):
         return "Diamond: %s" % get_diamond_version()
 
     def _send(self):
+        self.resetBatchTimeout()
+        if not self.metrics:
+            return
+
         # Potentially use protobufs in the future
         postDictionary = {}
         for metric in self.metrics:
@@ -152,16 +191,27 @@ class SignalfxHandler(Handler):
                 postDictionary[t] = []
             postDictionary[t].append(self.into_signalfx_point(metric))
 
-        self.metrics = []
         postBody = json.dumps(postDictionary)
         logging.debug("Body is %s", postBody)
-        req = urllib2.Request(self.url, postBody,
-                              {"Content-type": "application/json",
-                               "X-SF-TOKEN": self.auth_token,
-                               "User-Agent": self.user_agent()})
-        self.resetBatchTimeout()
         try:
-            urllib2.urlopen(req, timeout=self.request_timeout)
-        except urllib2.URLError:
-            logging.exception("Unable to post signalfx metrics")
+            status = self.sender.post(postBody)
+        except (httplib.HTTPException, socket.error), e:
+            self._throttle_error("Unable to post signalfx metrics. %s.", e)
+            status = None
+
+        if status is None or status >= 500:
+            if status is not None:
+                self._throttle_error("Unable to post signalfx metrics, "
+                                     "%s returned %d", self.url, status)
+            # Keep the datapoints for the next post
+            if len(self.metrics) > self.max_backlog:
+                self.metrics = self.metrics[-self.max_backlog:]
             return
+
+        if status >= 400:
+            # Posting them again won't help
+            self._throttle_error("Signalfx rejected %d metrics, %s returned "
+                                 "%d", len(self.metrics), self.url, status)
+        else:
+            self._reset_errors()
+        self.metrics = []
@@ -0,0 +1,189 @@
+# coding=utf-8
+
+"""
+An append only, segmented log on disk that handlers can spill data to while
+their sink is unreachable, and replay from at a limited rate once it is back.
+
+Records are opaque byte strings, each written with a 4 byte length header.
+Segments are named by sequence number and the read position is kept in an
+offset file, so spilled data survives a daemon restart. When the log grows
+past its size cap the oldest segment is deleted.
+"""
+
+import errno
+import os
+import struct
+import time
+
+HEADER = struct.Struct('!L')
+SEGMENT_SUFFIX = '.spill'
+OFFSET_FILE = 'offset'
+
+
+class SpillLog(object):
+
+    def __init__(self, path, max_size, segment_size, replay_rate, log):
+        """
+        Open (or create) a spill log in directory path
+
+        max_size and segment_size are in bytes, replay_rate is the maximum
+        number of records per second handed back by read()
+        """
+        self.path = path
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.replay_rate = replay_rate
+        self.log = log
+
+        try:
+            os.makedirs(self.path)
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+
+        self.segments = sorted(
+            int(f[:-len(SEGMENT_SUFFIX)]) for f in os.listdir(self.path)
+            if f.endswith(SEGMENT_SUFFIX))
+        self.size = sum(os.path.getsize(self._segment_path(s))
+                        for s in self.segments)
+
+        # Read position: (segment, offset) of the next unread record
+        self.read_segment, self.read_offset = self._load_offset()
+        if self.segments and self.read_segment not in self.segments:
+            self.read_segment, self.read_offset = self.segments[0], 0
+
+        # Position read() got to, made permanent by commit()
+        self.pending = None
+        self.last_read = time.time()
+        self.writer = None
+
+    def __len__(self):
+        """
+        Bytes waiting on disk, including records already replayed from the
+        oldest segment
+        """
+        return self.size
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, '%016d%s' % (segment, SEGMENT_SUFFIX))
+
+    def _load_offset(self):
+        try:
+            with open(os.path.join(self.path, OFFSET_FILE)) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (IOError, ValueError):
+            return 0, 0
+
+    def _save_offset(self):
+        tmp = os.path.join(self.path, OFFSET_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            f.write('%d %d' % (self.read_segment, self.read_offset))
+        os.rename(tmp, os.path.join(self.path, OFFSET_FILE))
+
+    def _close_writer(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    def _remove_segment(self, segment):
+        if segment == self.segments[-1]:
+            self._close_writer()
+        path = self._segment_path(segment)
+        self.size -= os.path.getsize(path)
+        os.unlink(path)
+        self.segments.remove(segment)
+
+    def append(self, records):
+        """
+        Append a list of records to the newest segment
+        """
+        if not records:
+            return
+
+        if ((not self.segments or self.writer is None or
+             self.writer.tell() >= self.segment_size)):
+            self._close_writer()
+            segment = self.segments[-1] + 1 if self.segments else 0
+            if not self.segments:
+                self.read_segment, self.read_offset = segment, 0
+            self.segments.append(segment)
+            self.writer = open(self._segment_path(segment), 'ab')
+
+        data = ''.join(HEADER.pack(len(r)) + r for r in records)
+        self.writer.write(data)
+        self.writer.flush()
+        self.size += len(data)
+
+        # Enforce the size cap by dropping the oldest segments
+        while self.size > self.max_size and len(self.segments) > 1:
+            segment = self.segments[0]
+            self.log.warning('SpillLog: %s is over %d bytes, dropping '
+                             'oldest segment %d', self.path, self.max_size,
+                             segment)
+            self._remove_segment(segment)
+            self.read_segment, self.read_offset = self.segments[0], 0
+            self.pending = None
+
+    def read(self):
+        """
+        Return the oldest unreplayed records, no more than replay_rate per
+        second since the last read. Call commit() once they are delivered;
+        otherwise the next read returns them again.
+        """
+        now = time.time()
+        # Allow at most a minute's worth of records to build up
+        budget = int(min(now - self.last_read, 60) * self.replay_rate)
+        if budget < 1 or not self.segments:
+            return []
+        self.last_read = now
+
+        records = []
+        segment, offset = self.read_segment, self.read_offset
+        while len(records) < budget:
+            try:
+                f = open(self._segment_path(segment), 'rb')
+            except IOError:
+                break
+            with f:
+                f.seek(offset)
+                while len(records) < budget:
+                    header = f.read(HEADER.size)
+                    if len(header) < HEADER.size:
+                        break
+                    length = HEADER.unpack(header)[0]
+                    record = f.read(length)
+                    if len(record) < length:
+                        # Partially written record, wait for the rest
+                        break
+                    records.append(record)
+                    offset += HEADER.size + length
+
+            if len(records) >= budget or segment == self.segments[-1]:
+                break
+            # Move on to the next segment
+            segment = self.segments[self.segments.index(segment) + 1]
+            offset = 0
+
+        self.pending = (segment, offset)
+        return records
+
+    def commit(self):
+        """
+        Mark the records returned by the last read() as delivered
+        """
+        if self.pending is None:
+            return
+        self.read_segment, self.read_offset = self.pending
+        self.pending = None
+
+        # Fully replayed segments can go
+        while self.segments and self.segments[0] < self.read_segment:
+            self._remove_segment(self.segments[0])
+        if ((len(self.segments) == 1 and
+             self.read_offset >= self.size)):
+            # Everything has been replayed, start over with an empty log
+            self._remove_segment(self.segments[0])
+            self.read_segment, self.read_offset = 0, 0
+
+        self._save_offset()
@@ -7,7 +7,7 @@ It's OK.
 
 #### Dependencies
 
- * [statsd](https://pypi.python.org/pypi/statsd/) v2.0.0 or newer.
+ * [statsd](https://pypi.python.org/pypi/statsd/) v3.0 or newer.
  * A compatible implementation of [statsd](https://github.com/etsy/statsd)
 
 #### Configuration
@@ -19,6 +19,12 @@ Enable this handler
 
 #### Notes
 
+Metrics are buffered and sent `batch` at a time, and at the end of every
+collector run, packed into datagrams of up to `mtu` bytes.
+
+Counters are sent as the change since the last value seen for their path.
+Paths not seen for `counter_ttl` seconds are forgotten, as are the least
+recently seen ones beyond `max_counters`.
 
 The handler file is named an odd stats_d.py because of an import issue with
 having the python library called statsd and this handler's module being called
@@ -29,6 +35,8 @@ of this handler.
 
 from Handler import Handler
 import logging
+import time
+from collections import OrderedDict
 try:
     import statsd
 except ImportError:
@@ -59,8 +67,12 @@ class StatsdHandler(Handler):
         self.host = self.config['host']
         self.port = int(self.config['port'])
         self.batch_size = int(self.config['batch'])
+        self.mtu = int(self.config['mtu'])
+        self.counter_ttl = float(self.config['counter_ttl'])
+        self.max_counters = int(self.config['max_counters'])
         self.metrics = []
-        self.old_values = {}
+        # path -> (raw value, time seen), least recently seen first
+        self.old_values = OrderedDict()
 
         # Connect
         self._connect()
@@ -74,7 +86,13 @@ class StatsdHandler(Handler):
         config.update({
             'host': '',
             'port': '',
-            'batch': '',
+            'batch': 'How many metrics to buffer before sending',
+            'mtu': 'Maximum size of a datagram, in bytes. 1432 suits a LAN,'
+                   ' use 512 across the internet',
+            'counter_ttl': 'Forget the last value of counters not seen for'
+                           ' this many seconds',
+            'max_counters': 'Maximum number of counters to remember the last'
+                            ' value of',
         })
 
         return config
@@ -88,7 +106,10 @@ class StatsdHandler(Handler):
         config.update({
             'host': '',
             'port': 1234,
-            'batch': 1,
+            'batch': 100,
+            'mtu': 1432,
+            'counter_ttl': 3600,
+            'max_counters': 100000,
         })
 
         return config
@@ -109,6 +130,7 @@ class StatsdHandler(Handler):
         """
         if not statsd:
             return
+        now = time.time()
         for metric in self.metrics:
 
             # Split the path into a prefix and a name
@@ -130,9 +152,10 @@ class StatsdHandler(Handler):
                 # To send a counter, we need to just send the delta
                 # but without any time delta changes
                 value = metric.raw_value
-                if metric.path in self.old_values:
-                    value = value - self.old_values[metric.path]
-                self.old_values[metric.path] = metric.raw_value
+                old = self.old_values.pop(metric.path, None)
+                if old is not None:
+                    value = value - old[0]
+                self.old_values[metric.path] = (metric.raw_value, now)
 
                 if hasattr(statsd, 'StatsClient'):
                     self.connection.incr(metric.path, value)
@@ -143,6 +166,19 @@ class StatsdHandler(Handler):
         if hasattr(statsd, 'StatsClient'):
             self.connection.send()
         self.metrics = []
+        self._expire_counters(now)
+
+    def _expire_counters(self, now):
+        """
+        Forget counters not seen for counter_ttl seconds, and the least
+        recently seen ones beyond max_counters
+        """
+        while self.old_values:
+            path, (value, seen) = next(self.old_values.iteritems())
+            if ((now - seen < self.counter_ttl and
+                 len(self.old_values) <= self.max_counters)):
+                break
+            del self.old_values[path]
 
     def flush(self):
         """Flush metrics in queue"""
@@ -158,7 +194,8 @@ class StatsdHandler(Handler):
         if hasattr(statsd, 'StatsClient'):
             self.connection = statsd.StatsClient(
                 host=self.host,
-                port=self.port
+                port=self.port,
+                maxudpsize=self.mtu
             ).pipeline()
         else:
             # Create socket
@@ -50,9 +50,24 @@ This means that the percentile values are not perfectly accurate,
 and are subject to a specifiable error epsilon. This allows us to
 store only a fraction of the samples.
 
+Sending
+-------
+
+Records are buffered and sent `batch` at a time, and at the end of every
+collector run. Over UDP as many records as fit in `mtu` bytes go in each
+datagram; over TCP everything buffered goes out in a single write.
+
+With the default `transport = nonblocking` the writes are queued and sent by
+a thread shared with the other handlers, so a slow statsite does not hold up
+the rest. Records that would take the queue past `high_water` bytes are
+dropped. If the connection fails, what it had not sent is sent again on the
+next one. `transport = blocking` writes straight to the socket instead.
+
 """
 
 from Handler import Handler
+from ioloop import Connection
+from ioloop import QueueFull
 import socket
 
 
@@ -77,6 +92,13 @@ class StatsiteHandler(Handler):
         self.tcpport = int(self.config['tcpport'])
         self.udpport = int(self.config['udpport'])
         self.timeout = int(self.config['timeout'])
+        self.batch_size = int(self.config['batch'])
+        self.mtu = int(self.config['mtu'])
+        self.transport = self.config['transport'].lower()
+        self.high_water = int(self.config['high_water'])
+
+        # Initialize Data
+        self.records = []
 
         # Connect
         self._connect()
@@ -92,6 +114,13 @@ class StatsiteHandler(Handler):
             'tcpport': '',
             'udpport': '',
             'timeout': '',
+            'batch': 'How many records to buffer before sending',
+            'mtu': 'Maximum size of a UDP datagram, in bytes. 1432 suits'
+                   ' a LAN, use 512 across the internet',
+            'transport': 'nonblocking to send from a shared I/O thread, or'
+                         ' blocking to write from the handler',
+            'high_water': 'Most bytes to queue for sending with the'
+                          ' nonblocking transport',
         })
 
         return config
@@ -107,6 +136,10 @@ class StatsiteHandler(Handler):
             'tcpport': 1234,
             'udpport': 1234,
             'timeout': 5,
+            'batch': 100,
+            'mtu': 1432,
+            'transport': 'nonblocking',
+            'high_water': 1048576,
         })
 
         return config
@@ -121,36 +154,75 @@ class StatsiteHandler(Handler):
         """
         Process a metric by sending it to statsite
         """
-        # Just send the data as a string
-        self._send(str(metric))
+        self.records.append('%s:%0.*f|kv\n' % (
+            metric.path, metric.precision, metric.value))
+        if len(self.records) >= self.batch_size:
+            self._send()
 
-    def _send(self, data):
+    def flush(self):
         """
-        Send data to statsite. Data that can not be sent will be queued.
+        Send the buffered records
         """
+        if self.records:
+            self._send()
+
+    def _packets(self):
+        """
+        Return the buffered records joined into as few payloads as possible:
+        one for TCP, datagrams of up to mtu bytes for UDP
+        """
+        if self.udpport <= 0:
+            return [''.join(self.records)]
+
+        packets = []
+        packet = []
+        size = 0
+        for record in self.records:
+            if size + len(record) > self.mtu and packet:
+                packets.append(''.join(packet))
+                packet = []
+                size = 0
+            packet.append(record)
+            size += len(record)
+        if packet:
+            packets.append(''.join(packet))
+        return packets
+
+    def _send(self):
+        """
+        Send the buffered records to statsite. Records that can not be sent
+        after RETRY attempts, or while the circuit breaker is open, are
+        dropped.
+        """
+        packets = self._packets()
+        self.records = []
+
         retry = self.RETRY
         # Attempt to send any data in the queue
-        while retry > 0:
+        while packets and retry > 0:
             # Check socket
             if not self.socket:
-                # Log Error
-                self.log.error("StatsiteHandler: Socket unavailable.")
                 # Attempt to restablish connection
                 self._connect()
-                # Decrement retry
-                retry -= 1
-                # Try again
-                continue
+                if not self.socket:
+                    # Statsite is down, don't wait on it every flush
+                    self.log.debug("StatsiteHandler: Dropping %d packets"
+                                   " while statsite is down.", len(packets))
+                    break
             try:
                 # Send data to socket
-                data = data.split()
-                data = data[0] + ":" + data[1] + "|kv\n"
-                self.socket.sendall(data)
-                # Done
+                self.socket.sendall(packets[0])
+                packets.pop(0)
+            except QueueFull:
+                self.log.error("StatsiteHandler: Dropping %d packets while"
+                               " statsite catches up.", len(packets))
                 break
             except socket.error, e:
                 # Log Error
                 self.log.error("StatsiteHandler: Failed sending data. %s.", e)
+                if isinstance(self.socket, Connection):
+                    # Resend what a failed connection had not sent
+                    packets[:0] = self.socket.take_unsent()
                 # Attempt to restablish connection
                 self._close()
                 # Decrement retry
@@ -162,12 +234,14 @@ class StatsiteHandler(Handler):
         """
         Connect to the statsite server
         """
+        if not self.breaker.allow():
+            return
         # Create socket
         if self.udpport > 0:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.socket = self._new_socket(socket.SOCK_DGRAM)
             self.port = self.udpport
         elif self.tcpport > 0:
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket = self._new_socket(socket.SOCK_STREAM)
             self.port = self.tcpport
         if socket is None:
             # Log Error
@@ -179,18 +253,30 @@ class StatsiteHandler(Handler):
         self.socket.settimeout(self.timeout)
         # Connect to statsite server
         try:
-            self.socket.connect((self.host, self.port))
+            self.socket.connect(self._getaddrinfo(
+                self.host, self.port, socket.AF_INET,
+                self.socket.type)[0][4])
             # Log
             self.log.debug("Established connection to statsite server %s:%d",
                            self.host, self.port)
+            if self.transport != 'nonblocking':
+                # The connection tells the breaker once it is made
+                self.breaker.success()
         except Exception, ex:
             # Log Error
             self.log.error("StatsiteHandler: Failed to connect to %s:%i. %s",
                            self.host, self.port, ex)
+            self.breaker.failure()
             # Close Socket
             self._close()
             return
 
+    def _new_socket(self, socktype):
+        if self.transport == 'nonblocking':
+            return Connection(socket.AF_INET, socktype, breaker=self.breaker,
+                              high_water=self.high_water)
+        return socket.socket(socket.AF_INET, socktype)
+
     def _close(self):
         """
         Close the socket
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import socket
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+import diamond.handler.graphite as graphite
+from diamond.handler.Handler import CircuitBreaker
+from diamond.handler.Handler import Handler
+from diamond.handler.httpsender import HTTPSender
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = patch('diamond.handler.Handler.time.time',
+                        lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_transitions(self):
+        breaker = CircuitBreaker(threshold=2, backoff=1, max_backoff=3,
+                                 jitter=0)
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(breaker.allow())
+
+        # One trial per delay once it is half-open
+        self.now += 1
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(breaker.allow())
+
+        # A failed trial doubles the delay, up to max_backoff
+        breaker.failure()
+        self.now += 1.5
+        self.assertFalse(breaker.allow())
+        self.now += 0.5
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.delay, 3)
+
+        self.now += 3
+        self.assertTrue(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(breaker.delay, 1)
+        self.assertTrue(breaker.allow())
+
+    def test_jitter(self):
+        breaker = CircuitBreaker(backoff=10, jitter=0.5)
+        with patch('diamond.handler.Handler.random.random', lambda: 1.0):
+            breaker.failure()
+        self.assertEqual(breaker.retry_at, self.now + 5)
+
+
+class TestDNSCache(unittest.TestCase):
+
+    def test_getaddrinfo_cached(self):
+        handler = Handler(configobj.ConfigObj({'dns_cache_ttl': 60}))
+        addrinfo = [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                     ('10.0.0.1', 2003))]
+        lookup = Mock(return_value=addrinfo)
+        with patch('socket.getaddrinfo', lookup):
+            with patch('diamond.handler.Handler.time.time', lambda: 0):
+                handler._getaddrinfo('graphite', 2003)
+                self.assertEqual(handler._getaddrinfo('graphite', 2003),
+                                 addrinfo)
+            self.assertEqual(lookup.call_count, 1)
+
+            # Expired, and the lookup fails: keep using the old address
+            lookup.side_effect = socket.gaierror('no name')
+            with patch('diamond.handler.Handler.time.time', lambda: 61):
+                self.assertEqual(handler._getaddrinfo('graphite', 2003),
+                                 addrinfo)
+                self.assertRaises(socket.gaierror, handler._getaddrinfo,
+                                  'other', 2003)
+            self.assertEqual(lookup.call_count, 3)
+
+
+class TestBreakerAdoption(unittest.TestCase):
+
+    def test_graphite_skips_connect_while_open(self):
+        config = configobj.ConfigObj()
+        config['host'] = '127.0.0.1'
+        config['breaker_backoff'] = 60
+        config['transport'] = 'blocking'
+        fake_socket = Mock()
+        fake_socket.return_value.connect.side_effect = socket.error('refused')
+        with patch.object(graphite.socket, 'socket', fake_socket):
+            handler = graphite.GraphiteHandler(config)
+            self.assertEqual(handler.socket, None)
+            self.assertEqual(handler.breaker.state, CircuitBreaker.OPEN)
+
+            # Buffered rather than waiting on a connection that won't come
+            handler._send_data('metric 1 1\n')
+            self.assertEqual(fake_socket.call_count, 1)
+
+    def test_httpsender_fails_fast_while_open(self):
+        breaker = CircuitBreaker()
+        breaker.failure()
+        sender = HTTPSender('http://127.0.0.1:1/', breaker=breaker)
+        sender._request = Mock()
+        self.assertRaises(socket.error, sender.post, 'body')
+        self.assertFalse(sender._request.called)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import BaseHTTPServer
+import threading
+import time
+import urlparse
+
+from test import unittest
+from test import run_only
+from test import run_in_child
+from mock import patch
+
+import configobj
+
+from diamond.handler.cloudwatch import cloudwatchHandler
+from diamond.metric import Metric
+
+try:
+    import boto
+    from boto.ec2.cloudwatch import CloudWatchConnection
+    from boto.regioninfo import RegionInfo
+except ImportError:
+    boto = None
+
+RESPONSE = ('<PutMetricDataResponse '
+            'xmlns="http://monitoring.amazonaws.com/doc/2010-08-01/">'
+            '<ResponseMetadata><RequestId>1</RequestId></ResponseMetadata>'
+            '</PutMetricDataResponse>')
+
+
+def run_only_if_boto_is_available(func):
+    return run_only(func, lambda: boto is not None)
+
+
+class FakeCloudWatch(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Records the parameters of every PutMetricData call, failing the first
+    `failures` of them
+    """
+    calls = []
+    failures = 0
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if FakeCloudWatch.failures:
+            FakeCloudWatch.failures -= 1
+            self.send_response(400)
+            self.end_headers()
+            self.wfile.write('<ErrorResponse/>')
+            return
+        FakeCloudWatch.calls.append(dict(urlparse.parse_qsl(body)))
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestCloudwatchHandler(unittest.TestCase):
+
+    def setUp(self):
+        FakeCloudWatch.calls = []
+        FakeCloudWatch.failures = 0
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                FakeCloudWatch)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+
+        port = self.server.server_address[1]
+        patchers = [
+            patch('boto.utils.get_instance_metadata',
+                  return_value={'instance-id': 'i-12345'}),
+            patch('boto.ec2.cloudwatch.connect_to_region',
+                  side_effect=lambda region: CloudWatchConnection(
+                      aws_access_key_id='key', aws_secret_access_key='secret',
+                      is_secure=False, port=port,
+                      region=RegionInfo(name='local',
+                                        endpoint='127.0.0.1'))),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_handler(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['backoff'] = 0
+        config['Idle'] = {'collector': 'cpu', 'metric': 'total.idle',
+                          'namespace': 'Machine', 'name': 'Idle',
+                          'unit': 'Percent'}
+        config['IdleCount'] = {'collector': 'cpu', 'metric': 'total.idle',
+                               'namespace': 'Other', 'name': 'IdleCount',
+                               'unit': 'Count'}
+        config['Load'] = {'collector': 'loadavg', 'metric': '01',
+                          'namespace': 'Machine', 'name': 'Load01',
+                          'unit': 'None'}
+        config.update(kwargs)
+        return cloudwatchHandler(config)
+
+    def metric(self, path, value):
+        return Metric('servers.host.' + path, value, timestamp=1234567,
+                      host='host')
+
+    @run_only_if_boto_is_available
+    def test_batched_per_namespace(self):
+        handler = self.get_handler()
+
+        for i in range(25):
+            handler.process(self.metric('cpu.total.idle', i))
+        handler.process(self.metric('cpu.total.user', 1))
+        handler.process(self.metric('loadavg.01', 2))
+        handler.flush()
+        handler.queue.join()
+
+        calls = dict((call['Namespace'], []) for call in FakeCloudWatch.calls)
+        for call in FakeCloudWatch.calls:
+            calls[call['Namespace']].append(call)
+            self.assertEqual(call['Action'], 'PutMetricData')
+        # 25 Idle and 1 Load01 datapoints go to Machine, 25 IdleCount to Other
+        self.assertEqual(sorted(calls), ['Machine', 'Other'])
+        self.assertEqual(len(calls['Machine']), 2)
+        self.assertEqual(len(calls['Other']), 2)
+        first = calls['Machine'][0]
+        self.assertEqual(len([k for k in first if k.endswith('.MetricName')]),
+                         20)
+        self.assertEqual(first['MetricData.member.1.MetricName'], 'Idle')
+        self.assertEqual(first['MetricData.member.1.Value'], '0.0')
+        self.assertEqual(first['MetricData.member.1.Unit'], 'Percent')
+        self.assertEqual(
+            first['MetricData.member.1.Dimensions.member.1.Value'],
+            'i-12345')
+        self.assertEqual(calls['Machine'][1]['MetricData.member.6.MetricName'],
+                         'Load01')
+
+    @run_only_if_boto_is_available
+    def test_failed_publish_retried(self):
+        handler = self.get_handler(retries=2)
+        FakeCloudWatch.failures = 2
+
+        handler.process(self.metric('loadavg.01', 2))
+        handler.flush()
+        handler.queue.join()
+
+        self.assertEqual(len(FakeCloudWatch.calls), 1)
+        self.assertEqual(FakeCloudWatch.calls[0]['MetricData.member.1.Value'],
+                         '2.0')
+
+    @run_only_if_boto_is_available
+    def test_sender_started_after_fork(self):
+        # As in the daemon, the handler process is forked after the handler
+        # is created
+        handler = self.get_handler()
+
+        def child():
+            handler.process(self.metric('loadavg.01', 2))
+            handler.flush()
+            deadline = time.time() + 5
+            while handler.queue.unfinished_tasks and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(run_in_child(child), 0)
+
+        self.assertEqual(len(FakeCloudWatch.calls), 1)
+        self.assertEqual(FakeCloudWatch.calls[0]['MetricData.member.1.Value'],
+                         '2.0')
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,151 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import BaseHTTPServer
+import json
+import os
+import SocketServer
+import threading
+
+from test import unittest
+from test import run_only
+from mock import patch
+import configobj
+
+from diamond.handler.datadog import DatadogHandler
+from diamond.metric import Metric
+
+
+def run_only_if_dogapi_is_available(func):
+    try:
+        import dogapi
+    except ImportError:
+        dogapi = None
+    pred = lambda: dogapi is not None
+    return run_only(func, pred)
+
+
+def make_metrics(count, host='host'):
+    return [Metric('servers.%s.cpu.total.idle%d' % (host, i % 2), i,
+                   timestamp=1234567 + i, host=host)
+            for i in range(count)]
+
+
+class SeriesHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Records the series of each request, answering with the next status in
+    `statuses` (202 once they run out)
+    """
+    requests = []
+    statuses = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        SeriesHandler.requests.append((self.path,
+                                       json.loads(body)['series']))
+        status = 202
+        if SeriesHandler.statuses:
+            status = SeriesHandler.statuses.pop(0)
+        if status >= 400:
+            response = json.dumps({'errors': ['rejected']})
+        else:
+            response = json.dumps({'status': 'ok'})
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestDatadogHandler(unittest.TestCase):
+
+    def setUp(self):
+        SeriesHandler.requests = []
+        SeriesHandler.statuses = []
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), SeriesHandler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_config(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['api_key'] = 'key'
+        config['api_host'] = 'http://127.0.0.1:%d' % (
+            self.server.server_address[1])
+        config.update(kwargs)
+        return config
+
+    @run_only_if_dogapi_is_available
+    def test_series_batched(self):
+        handler = DatadogHandler(self.get_config(queue_size=4))
+        for metric in make_metrics(5):
+            handler.process(metric)
+        self.assertEqual(len(SeriesHandler.requests), 1)
+
+        handler.flush()
+        self.assertEqual(len(SeriesHandler.requests), 2)
+        path, series = SeriesHandler.requests[0]
+        self.assertEqual(path, '/api/v1/series?api_key=key')
+        self.assertEqual(sorted(series), [
+            {'metric': 'servers.cpu.total.idle0', 'host': 'host',
+             'type': 'gauge', 'points': [[1234567, 0], [1234569, 2]]},
+            {'metric': 'servers.cpu.total.idle1', 'host': 'host',
+             'type': 'gauge', 'points': [[1234568, 1], [1234570, 3]]},
+        ])
+        self.assertEqual(SeriesHandler.requests[1][1][0]['points'],
+                         [[1234571, 4]])
+        self.assertEqual(len(handler.queue), 0)
+
+    @run_only_if_dogapi_is_available
+    def test_datadog_host_environment(self):
+        config = self.get_config(flush_interval=0)
+        del config['api_host']
+        with patch.dict(os.environ, {'DATADOG_HOST': 'http://127.0.0.1:%d' % (
+                self.server.server_address[1])}):
+            handler = DatadogHandler(config)
+        handler.process(make_metrics(1)[0])
+        self.assertEqual(len(SeriesHandler.requests), 1)
+
+    @run_only_if_dogapi_is_available
+    def test_flush_interval(self):
+        handler = DatadogHandler(self.get_config(flush_interval=0))
+        handler.process(make_metrics(1)[0])
+        self.assertEqual(len(SeriesHandler.requests), 1)
+
+    @run_only_if_dogapi_is_available
+    def test_failed_send_kept(self):
+        handler = DatadogHandler(self.get_config(max_backlog=3))
+        self.server.shutdown()
+        self.server.server_close()
+
+        for metric in make_metrics(5):
+            handler.process(metric)
+        handler.flush()
+        self.assertEqual([m.value for m in handler.queue], [2, 3, 4])
+        self.setUp()
+
+    @run_only_if_dogapi_is_available
+    def test_rejected_send_dropped(self):
+        handler = DatadogHandler(self.get_config())
+        SeriesHandler.statuses = [400]
+        handler.process(make_metrics(1)[0])
+        handler.flush()
+        self.assertEqual(len(SeriesHandler.requests), 1)
+        self.assertEqual(len(handler.queue), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+import diamond.handler.mqtt as mqtt
+import diamond.handler.rabbitmq_pubsub as rabbitmq_pubsub
+import diamond.handler.zmq_pubsub as zmq_pubsub
+from diamond.handler.framing import decode
+from diamond.handler.framing import frames
+from diamond.metric import Metric
+
+
+def make_metrics(count):
+    return [Metric('servers.host.cpu.cpu%d.idle' % i, i * 1.5,
+                   timestamp=1234567, precision=1, host='host')
+            for i in range(count)]
+
+
+def decode_all(payloads):
+    return [metric for payload in payloads for metric in decode(payload)]
+
+
+class TestFraming(unittest.TestCase):
+
+    def test_frames(self):
+        lines = ['a 1 1\n', 'bb 2 2\n', 'c 3 3\n', 'long.path 4 4\n']
+        self.assertEqual(list(frames(lines, 13)),
+                         ['a 1 1\nbb 2 2\n', 'c 3 3\n', 'long.path 4 4\n'])
+        self.assertEqual(list(frames(lines, 1000)), [''.join(lines)])
+        self.assertEqual(list(frames([], 1000)), [])
+
+    def test_decode(self):
+        self.assertEqual(decode('servers.host.cpu.idle -1.5 1234567\n'
+                                'servers.host.cpu.user 2 1234568\n'),
+                         [('servers.host.cpu.idle', -1.5, 1234567),
+                          ('servers.host.cpu.user', 2.0, 1234568)])
+
+    def test_decode_mqtt_topic(self):
+        self.assertEqual(decode('-1.5 1234567', 'servers/host/cpu/idle'),
+                         [('servers.host.cpu.idle', -1.5, 1234567)])
+        self.assertEqual(decode('2', 'servers/host/cpu/user'),
+                         [('servers.host.cpu.user', 2.0, None)])
+        self.assertEqual(decode('2 1234568'), [])
+
+
+class TestZmqHandler(unittest.TestCase):
+
+    def setUp(self):
+        fake_zmq = Mock()
+        patcher = patch.object(zmq_pubsub, 'zmq', fake_zmq)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.socket = fake_zmq.Context.return_value.socket.return_value
+
+    def sent(self):
+        return [call[0][0] for call in self.socket.send.call_args_list]
+
+    def test_single(self):
+        handler = zmq_pubsub.zmqHandler(configobj.ConfigObj())
+        metrics = make_metrics(2)
+        for metric in metrics:
+            handler.process(metric)
+        self.assertEqual(self.sent(), [str(m) for m in metrics])
+
+    def test_batch(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 3
+        config['max_frame_size'] = 80
+        handler = zmq_pubsub.zmqHandler(config)
+        metrics = make_metrics(4)
+        for metric in metrics:
+            handler.process(metric)
+        self.assertEqual(len(self.sent()), 2)
+
+        handler.flush()
+        self.assertEqual(len(self.sent()), 3)
+        self.assertTrue(all(len(frame) <= 80 for frame in self.sent()))
+        self.assertEqual(decode_all(self.sent()),
+                         [(m.path, m.value, m.timestamp) for m in metrics])
+
+
+class TestRmqHandler(unittest.TestCase):
+
+    def setUp(self):
+        fake_pika = Mock()
+        patcher = patch.object(rabbitmq_pubsub, 'pika', fake_pika)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = fake_pika.BlockingConnection.return_value
+        self.connection.is_open = True
+        self.channel = self.connection.channel.return_value
+
+    def get_config(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['rmq_server'] = '127.0.0.1'
+        config.update(kwargs)
+        return config
+
+    def published(self):
+        return [call[1]['body']
+                for call in self.channel.basic_publish.call_args_list]
+
+    def test_single(self):
+        handler = rabbitmq_pubsub.rmqHandler(self.get_config())
+        metric = make_metrics(1)[0]
+        handler.process(metric)
+        self.assertEqual(self.published(), [str(metric)])
+
+    def test_batch(self):
+        handler = rabbitmq_pubsub.rmqHandler(self.get_config(batch=10))
+        metrics = make_metrics(4)
+        for metric in metrics:
+            handler.process(metric)
+        self.assertEqual(self.published(), [])
+
+        handler.flush()
+        self.assertEqual(self.published(), [''.join(map(str, metrics))])
+
+        # Nothing buffered, nothing to publish
+        handler.flush()
+        self.assertEqual(len(self.published()), 1)
+
+
+class TestMQTTHandler(unittest.TestCase):
+
+    def setUp(self):
+        fake_mosquitto = Mock()
+        patcher = patch.object(mqtt, 'mosquitto', fake_mosquitto)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = fake_mosquitto.Mosquitto.return_value
+
+    def published(self):
+        return [call[0] for call in self.client.publish.call_args_list]
+
+    def test_single(self):
+        config = configobj.ConfigObj()
+        config['hostname'] = 'host'
+        handler = mqtt.MQTTHandler(config)
+        handler.process(make_metrics(1)[0])
+        self.assertEqual(self.published(),
+                         [('servers/host/cpu/cpu0/idle', '0.0 1234567', 0)])
+
+    def test_batch(self):
+        config = configobj.ConfigObj()
+        config['hostname'] = 'host'
+        config['prefix'] = 'pre'
+        config['batch'] = 100
+        handler = mqtt.MQTTHandler(config)
+        metrics = make_metrics(3)
+        for metric in metrics:
+            handler.process(metric)
+        handler.flush()
+
+        self.assertEqual(self.published(),
+                         [('pre/diamond/host', ''.join(map(str, metrics)), 0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
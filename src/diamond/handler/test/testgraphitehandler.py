@@ -35,7 +35,7 @@ def fake_bad_connect(self):
 class TestGraphiteHandler(unittest.TestCase):
 
     def setUp(self):
-        self.__connect_method = mod.GraphiteHandler
+        self.__connect_method = mod.GraphiteHandler._connect
         mod.GraphiteHandler._connect = fake_connect
 
     def tearDown(self):
@@ -134,6 +134,56 @@ class TestGraphiteHandler(unittest.TestCase):
         self.assertEqual(sendmock.call_count, len(expected_data))
         self.assertEqual(sendmock.call_args_list, expected_data)
 
+    def test_batch_bytes(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 100
+        config['batch_bytes'] = 30
+        config['max_latency'] = 0
+
+        handler = mod.GraphiteHandler(config)
+
+        patch_sock = patch.object(handler, 'socket', True)
+        sendmock = Mock()
+        patch_send = patch.object(handler, '_send_data', sendmock)
+
+        patch_sock.start()
+        patch_send.start()
+        for i in range(1, 5):
+            handler.process(Metric('metricname%d' % i, 0, timestamp=123))
+        patch_send.stop()
+        patch_sock.stop()
+
+        # Each line is 19 bytes, so every second one goes over 30
+        self.assertEqual(sendmock.call_args_list, [
+            call("metricname1 0 123\nmetricname2 0 123\n"),
+            call("metricname3 0 123\nmetricname4 0 123\n"),
+        ])
+        self.assertEqual(handler.buffered, 0)
+
+    def test_max_latency(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 100
+        config['max_latency'] = 0
+
+        handler = mod.GraphiteHandler(config)
+
+        patch_sock = patch.object(handler, 'socket', True)
+        sendmock = Mock()
+        patch_send = patch.object(handler, '_send_data', sendmock)
+
+        patch_sock.start()
+        patch_send.start()
+        handler._flush_buffered()
+        handler.process(Metric('metricname1', 0, timestamp=123))
+        self.assertEqual(sendmock.call_count, 0)
+        # What the timer calls every max_latency seconds
+        handler._flush_buffered()
+        patch_send.stop()
+        patch_sock.stop()
+
+        self.assertEqual(sendmock.call_args_list,
+                         [call("metricname1 0 123\n")])
+
     def test_backlog(self):
         config = configobj.ConfigObj()
         config['batch'] = 1
@@ -223,6 +273,7 @@ class TestGraphiteHandler(unittest.TestCase):
 
     def test_disconnect_after_flush_disabled__default(self):
         config = configobj.ConfigObj()
+        config['batch'] = 1
         handler = mod.GraphiteHandler(config)
 
         socket_mock = Mock()
@@ -248,6 +299,7 @@ class TestGraphiteHandler(unittest.TestCase):
 
     def test_disconnect_after_flush_enabled(self):
         config = configobj.ConfigObj()
+        config['batch'] = 1
         handler = mod.GraphiteHandler(config)
 
         socket_mock = Mock()
@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import BaseHTTPServer
+import gzip
+import socket
+import SocketServer
+import threading
+import time
+from cStringIO import StringIO
+
+from test import unittest
+from test import run_in_child
+from mock import patch
+
+import configobj
+
+from diamond.handler.httpHandler import HttpPostHandler
+from diamond.handler.httpsender import HTTPSender
+from diamond.handler.signalfx import SignalfxHandler
+from diamond.metric import Metric
+
+
+class RecordingHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Records each request body and the connection it came on, answering with
+    the next status in `statuses` (204 once they run out)
+    """
+    protocol_version = 'HTTP/1.1'
+    requests = []
+    statuses = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+        RecordingHandler.requests.append((self.client_address, self.path,
+                                          body))
+        status = 204
+        if RecordingHandler.statuses:
+            status = RecordingHandler.statuses.pop(0)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadedHTTPServer(SocketServer.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class TestHTTPSender(unittest.TestCase):
+
+    def setUp(self):
+        RecordingHandler.requests = []
+        RecordingHandler.statuses = []
+        self.server = ThreadedHTTPServer(('127.0.0.1', 0), RecordingHandler)
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+        self.url = 'http://127.0.0.1:%d/metrics?key=1' % (
+            self.server.server_address[1])
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connection_reused(self):
+        sender = HTTPSender(self.url, compression=True)
+        for body in ('a', 'b', 'c'):
+            self.assertEqual(sender.post(body), 204)
+        sender.close()
+
+        self.assertEqual([r[2] for r in RecordingHandler.requests],
+                         ['a', 'b', 'c'])
+        self.assertEqual(set(r[0] for r in RecordingHandler.requests),
+                         set([RecordingHandler.requests[0][0]]))
+        self.assertEqual(RecordingHandler.requests[0][1], '/metrics?key=1')
+
+    @patch('time.sleep')
+    def test_server_errors_retried(self, sleep_mock):
+        RecordingHandler.statuses = [503, 500]
+        sender = HTTPSender(self.url, retries=2, backoff=1)
+        self.assertEqual(sender.post('a'), 204)
+        self.assertEqual(len(RecordingHandler.requests), 3)
+        self.assertEqual([c[0][0] for c in sleep_mock.call_args_list],
+                         [1, 2])
+
+        RecordingHandler.statuses = [503, 503]
+        sender.retries = 1
+        self.assertEqual(sender.post('b'), 503)
+
+    @patch('time.sleep')
+    def test_unreachable(self, sleep_mock):
+        self.tearDown()
+        sender = HTTPSender(self.url, retries=1)
+        self.assertRaises(socket.error, sender.post, 'a')
+        self.assertEqual(sleep_mock.call_count, 1)
+        self.setUp()
+
+    @patch('time.sleep')
+    def test_http_post_handler_keeps_metrics(self, sleep_mock):
+        config = configobj.ConfigObj()
+        config['url'] = self.url
+        config['batch'] = 2
+        config['retries'] = 0
+        config['flush_interval'] = 0
+        config['breaker_backoff'] = 0
+        handler = HttpPostHandler(config)
+        metrics = [Metric('servers.host.cpu.idle%d' % i, i,
+                          timestamp=1234567, host='host') for i in range(3)]
+
+        RecordingHandler.statuses = [503]
+        handler.process(metrics[0])
+        handler.process(metrics[1])
+        self.assertEqual(len(handler.metrics), 2)
+
+        handler.process(metrics[2])
+        self.assertEqual(handler.metrics, [])
+        self.assertEqual(RecordingHandler.requests[-1][2],
+                         '\n'.join(str(m) for m in metrics))
+
+    def assert_flushed_after_fork(self, handler, metric):
+        # The handler process is forked after the handlers are made, so the
+        # timer has to start there to post metrics no flush comes for
+        def child():
+            handler._process(metric)
+            deadline = time.time() + 5
+            while handler.metrics and time.time() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(run_in_child(child), 0)
+        self.assertEqual(len(RecordingHandler.requests), 1)
+        return RecordingHandler.requests[0][2]
+
+    def test_http_post_handler_flush_interval_after_fork(self):
+        config = configobj.ConfigObj()
+        config['url'] = self.url
+        config['flush_interval'] = 0.1
+        handler = HttpPostHandler(config)
+        metric = Metric('servers.host.cpu.idle', 1, timestamp=1234567,
+                        host='host')
+
+        self.assertEqual(self.assert_flushed_after_fork(handler, metric),
+                         str(metric))
+
+    def test_signalfx_batch_max_interval_after_fork(self):
+        config = configobj.ConfigObj()
+        config['url'] = self.url
+        config['auth_token'] = 'token'
+        handler = SignalfxHandler(config)
+        # Whole seconds in the config
+        handler.timer.interval = 0.1
+        metric = Metric('servers.host.cpu.idle', 1, timestamp=1234567,
+                        host='host')
+
+        self.assertTrue('"metric": "idle"' in
+                        self.assert_flushed_after_fork(handler, metric))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import gzip
+import socket
+from cStringIO import StringIO
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+from diamond.handler.influxdbHandler import InfluxdbHandler
+from diamond.handler.influxdb9Handler import Influxdb9Handler
+from diamond.handler.influxline import encode
+from diamond.metric import Metric
+
+
+class TestLineProtocol(unittest.TestCase):
+
+    def test_encode(self):
+        self.assertEqual(encode('servers.host.cpu.idle', 5, 1234567),
+                         'servers.host.cpu.idle value=5.0 1234567\n')
+        self.assertEqual(encode('a b,c', 0.25, 1234567, 1000),
+                         'a\\ b\\,c value=0.25 1234567000\n')
+        self.assertEqual(encode('servers.host.cpu.idle', float('nan'), 1),
+                         None)
+
+    def test_encode_integers(self):
+        self.assertEqual(encode('servers.host.cpu.idle', 5, 1234567,
+                                integers=True),
+                         'servers.host.cpu.idle value=5i 1234567\n')
+        self.assertEqual(encode('servers.host.cpu.idle', 0.5, 1234567,
+                                integers=True),
+                         'servers.host.cpu.idle value=0.5 1234567\n')
+
+
+class TestInfluxdbHandler(unittest.TestCase):
+
+    handler_class = InfluxdbHandler
+
+    def get_handler(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['influxdb_version'] = '0.9'
+        config['batch_size'] = 3
+        config.update(kwargs)
+        handler = self.handler_class(config)
+        # Send as soon as there is a full batch
+        handler.batch_timestamp = 0
+        return handler
+
+    def metrics(self, count):
+        return [Metric('servers.host.cpu.idle', i, timestamp=1234560 + i,
+                       host='host') for i in range(count)]
+
+    @patch('httplib.HTTPConnection')
+    def test_every_point_written(self, connection_mock):
+        connection = connection_mock.return_value
+        connection.getresponse.return_value = Mock(status=204)
+        handler = self.get_handler(compression=True)
+
+        for metric in self.metrics(3):
+            handler.process(metric)
+
+        connection_mock.assert_called_once_with('localhost', 8086,
+                                                timeout=15.0)
+        method, path, body, headers = connection.request.call_args[0]
+        self.assertEqual(method, 'POST')
+        self.assertTrue(path.startswith('/write?db=graphite&precision=s'))
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO(body)).read(),
+                         'servers.host.cpu.idle value=0.0 1234560\n'
+                         'servers.host.cpu.idle value=1.0 1234561\n'
+                         'servers.host.cpu.idle value=2.0 1234562\n')
+        self.assertEqual(len(handler.batch), 0)
+
+    @patch('httplib.HTTPConnection')
+    def test_backlog_bounded_while_down(self, connection_mock):
+        connection = connection_mock.return_value
+        connection.request.side_effect = socket.error('down')
+        # Try again as soon as it is back
+        handler = self.get_handler(batch_size=2, cache_size=4,
+                                   breaker_backoff=0)
+
+        for metric in self.metrics(6):
+            handler.batch_timestamp = 0
+            try:
+                handler.process(metric)
+            except socket.error:
+                pass
+        self.assertEqual([line.split()[-1] for line in handler.batch],
+                         ['1234562', '1234563', '1234564', '1234565'])
+
+        connection.request.side_effect = None
+        connection.getresponse.return_value = Mock(status=204)
+        handler._send()
+        self.assertEqual(connection.request.call_args[0][2].count('\n'), 4)
+        self.assertEqual(len(handler.batch), 0)
+
+    @patch('httplib.HTTPConnection')
+    def test_server_error_keeps_points(self, connection_mock):
+        connection = connection_mock.return_value
+        connection.getresponse.return_value = Mock(status=500)
+        handler = self.get_handler(breaker_backoff=0)
+
+        for metric in self.metrics(2):
+            handler.process(metric)
+        handler.batch_timestamp = 0
+        self.assertRaises(Exception, handler.process, self.metrics(3)[2])
+        self.assertEqual(len(handler.batch), 3)
+
+        # Rejected points are not retried
+        connection.getresponse.return_value = Mock(status=400)
+        handler._send()
+        self.assertEqual(len(handler.batch), 0)
+
+
+class TestInfluxdb9Handler(TestInfluxdbHandler):
+
+    handler_class = Influxdb9Handler
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,439 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import select
+import socket
+import threading
+import time
+
+from test import unittest
+from test import run_in_child
+from test import run_only
+from mock import Mock
+from mock import patch
+
+import configobj
+
+from diamond.handler.graphite import GraphiteHandler
+from diamond.handler.Handler import CircuitBreaker
+from diamond.handler.ioloop import Connection
+from diamond.handler.ioloop import EpollPoller
+from diamond.handler.ioloop import IOLoop
+from diamond.handler.ioloop import QueueFull
+from diamond.handler.multigraphite import MultiGraphiteHandler
+from diamond.metric import Metric
+
+
+def run_only_if_epoll_is_available(func):
+    return run_only(func, lambda: hasattr(select, 'epoll'))
+
+
+class Receiver(threading.Thread):
+    """
+    Accepts one connection and reads it until it is closed, chunk bytes at
+    a time, pausing for delay seconds between reads. With a delay of None
+    it never reads at all.
+    """
+
+    def __init__(self, chunk=65536, delay=0, rcvbuf=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.chunk = chunk
+        self.delay = delay
+        self.server = socket.socket()
+        if rcvbuf:
+            self.server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                                   rcvbuf)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(5)
+        self.address = self.server.getsockname()
+        self.received = []
+        self.stopped = threading.Event()
+        self.start()
+
+    def run(self):
+        connection, _ = self.server.accept()
+        if self.delay is None:
+            self.stopped.wait()
+        else:
+            while not self.stopped.is_set():
+                data = connection.recv(self.chunk)
+                if not data:
+                    break
+                self.received.append(data)
+                time.sleep(self.delay)
+        connection.close()
+        self.server.close()
+
+    @property
+    def data(self):
+        return ''.join(self.received)
+
+    def stop(self):
+        self.stopped.set()
+        self.join(5)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    return predicate()
+
+
+def run_until(loop, predicate, timeout=5):
+    deadline = time.time() + timeout
+    # Check again soon after a connection is closed, rather than after the
+    # loop's longest wait
+    with patch('diamond.handler.ioloop.MAX_WAIT', 0.01):
+        while not predicate() and time.time() < deadline:
+            loop.run_once()
+    return predicate()
+
+
+class TestConnection(unittest.TestCase):
+
+    def setUp(self):
+        # A loop of our own that only runs when the test says so
+        self.loop = IOLoop()
+
+    def connect(self, address, socktype=socket.SOCK_STREAM, **kwargs):
+        connection = Connection(socket.AF_INET, socktype, loop=self.loop,
+                                **kwargs)
+        connection.settimeout(5)
+        connection.connect(address)
+        return connection
+
+    def test_writes_coalesced(self):
+        receiver = Receiver()
+        connection = self.connect(receiver.address)
+        lines = ['servers.host.cpu.idle%d %d 1234567\n' % (i, i)
+                 for i in range(1000)]
+        for line in lines:
+            connection.sendall(line)
+
+        sends = []
+
+        def send(data):
+            sends.append(len(data))
+            return connection.sock._sock.send(data)
+        with patch.object(connection.sock, 'send', send):
+            self.assertTrue(run_until(self.loop,
+                                      lambda: not connection.queue))
+        self.assertTrue(len(sends) < 5)
+
+        connection.close()
+        self.assertTrue(run_until(self.loop, lambda: connection.closed))
+        receiver.join(5)
+        self.assertEqual(receiver.data, ''.join(lines))
+
+    def test_datagrams_kept_apart(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.bind(('127.0.0.1', 0))
+        server.settimeout(5)
+        connection = self.connect(server.getsockname(),
+                                  socket.SOCK_DGRAM)
+        connection.sendall('a:1|kv\n')
+        connection.sendall('b:2|kv\n')
+        self.assertTrue(run_until(self.loop, lambda: not connection.queue))
+
+        self.assertEqual([server.recv(4096), server.recv(4096)],
+                         ['a:1|kv\n', 'b:2|kv\n'])
+        connection.close()
+        server.close()
+
+    def test_refused(self):
+        free = socket.socket()
+        free.bind(('127.0.0.1', 0))
+        address = free.getsockname()
+        free.close()
+
+        breaker = CircuitBreaker()
+        try:
+            connection = self.connect(address, breaker=breaker)
+        except socket.error:
+            # Refused straight away, the handler tells the breaker
+            return
+        self.assertTrue(run_until(self.loop,
+                                  lambda: connection.error is not None))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertRaises(socket.error, connection.sendall, 'a 1 1\n')
+
+    def test_high_water(self):
+        receiver = Receiver(delay=None)
+        connection = self.connect(receiver.address, high_water=1000)
+        connection.sendall('x' * 600)
+        self.assertRaises(QueueFull, connection.sendall, 'x' * 600)
+        # A write larger than the mark still goes out on its own
+        self.assertTrue(run_until(self.loop, lambda: not connection.queue))
+        connection.sendall('x' * 2000)
+        connection.close()
+        self.assertTrue(run_until(self.loop, lambda: connection.closed))
+        receiver.stop()
+
+    def test_stalled_sink_times_out(self):
+        receiver = Receiver(delay=None, rcvbuf=4096)
+        breaker = CircuitBreaker()
+        connection = self.connect(receiver.address, breaker=breaker,
+                                  high_water=1 << 30)
+        connection.settimeout(0.2)
+        buffers = [chr(ord('a') + i % 26) * (1 << 20) for i in range(16)]
+        for data in buffers:
+            connection.sendall(data)
+
+        self.assertTrue(run_until(self.loop,
+                                  lambda: connection.error is not None))
+        self.assertTrue(isinstance(connection.error, socket.timeout))
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(connection.queued, 0)
+        # What did not go out is given back whole, to be sent again
+        unsent = connection.take_unsent()
+        self.assertTrue(unsent)
+        self.assertEqual(unsent, buffers[-len(unsent):])
+        self.assertEqual(connection.take_unsent(), [])
+        receiver.stop()
+
+    def test_error_fails_only_its_connection(self):
+        broken_receiver = Receiver(delay=None)
+        receiver = Receiver()
+        broken = self.connect(broken_receiver.address)
+        connection = self.connect(receiver.address)
+        broken.sendall('a 1 1\n')
+        connection.sendall('b 2 2\n')
+
+        with patch.object(broken, 'handle_write',
+                          Mock(side_effect=RuntimeError('boom'))):
+            self.assertTrue(run_until(self.loop,
+                                      lambda: not connection.queue))
+        self.assertTrue(isinstance(broken.error, socket.error))
+        self.assertEqual(broken.take_unsent(), ['a 1 1\n'])
+        self.assertTrue(broken.closed)
+
+        connection.close()
+        self.assertTrue(run_until(self.loop, lambda: connection.closed))
+        receiver.join(5)
+        self.assertEqual(receiver.data, 'b 2 2\n')
+        broken_receiver.stop()
+
+    @patch('diamond.handler.ioloop.MAX_WAIT', 0)
+    def test_loop_survives_errors(self):
+        self.loop.run_once = Mock(side_effect=[RuntimeError('boom'),
+                                               SystemExit])
+        self.assertRaises(SystemExit, self.loop.run)
+        self.assertEqual(self.loop.run_once.call_count, 2)
+
+    def test_dead_loop_replaced(self):
+        self.loop.run = lambda: None
+        self.loop.start()
+        self.loop.join()
+        receiver = Receiver()
+        connection = self.connect(receiver.address)
+
+        connection.sendall('a 1 1\n')
+        self.assertNotEqual(connection.loop, self.loop)
+        self.assertTrue(connection.loop.is_alive())
+        connection.close()
+        receiver.join(5)
+        self.assertEqual(receiver.data, 'a 1 1\n')
+
+    @run_only_if_epoll_is_available
+    def test_closed_fd_reported(self):
+        poller = EpollPoller()
+        closed = socket.socket()
+        fd = closed.fileno()
+        closed.close()
+        self.assertEqual(poller.poll([], [fd], 0), ([fd], [fd]))
+        self.assertEqual(poller.masks, {})
+
+    def test_graphite_keeps_unsent(self):
+        receiver = Receiver(delay=None, rcvbuf=4096)
+        config = configobj.ConfigObj()
+        config['host'] = receiver.address[0]
+        config['port'] = receiver.address[1]
+        config['batch'] = 100
+        config['max_latency'] = 0
+        config['timeout'] = 0.2
+        config['high_water'] = 1 << 30
+        config['breaker_backoff'] = 60
+        handler = GraphiteHandler(config)
+        connection = handler.socket
+        # Long paths, so fewer metrics fill the socket buffers
+        metrics = [Metric('servers.host.%s.cpu%d.idle' % ('x' * 100, i), i,
+                          timestamp=1234567, host='host')
+                   for i in range(25000)]
+        expected = ''.join(str(metric) for metric in metrics)
+
+        for metric in metrics:
+            handler.process(metric)
+        self.assertTrue(wait_for(lambda: connection.error is not None))
+
+        # The next send finds the connection failed, and the breaker keeps
+        # it from reconnecting straight away
+        handler.flush()
+        self.assertEqual(handler.socket, None)
+        kept = ''.join(handler.metrics)
+        self.assertTrue(kept)
+        self.assertTrue(expected.endswith(kept))
+        self.assertEqual(expected[-len(kept) - 1], '\n')
+        self.assertEqual(handler.buffered, len(kept))
+        receiver.stop()
+
+
+class TestSlowReceivers(unittest.TestCase):
+    """
+    Several graphite handlers sharing the I/O thread, some of them sending
+    to receivers that read slowly or not at all
+    """
+
+    def get_handler(self, receiver, high_water):
+        config = configobj.ConfigObj()
+        config['host'] = receiver.address[0]
+        config['port'] = receiver.address[1]
+        config['batch'] = 100
+        config['high_water'] = high_water
+        config['timeout'] = 60
+        return GraphiteHandler(config)
+
+    def test_slow_receivers_do_not_hold_up_others(self):
+        count = 20000
+        stuck = Receiver(delay=None, rcvbuf=4096)
+        slow = Receiver(chunk=1024, delay=0.01, rcvbuf=4096)
+        fast = [Receiver(), Receiver()]
+        receivers = [stuck, slow] + fast
+        # Room for everything on the fast ones, so none is dropped however
+        # far the I/O thread falls behind
+        handlers = ([self.get_handler(stuck, 65536),
+                     self.get_handler(slow, 65536)] +
+                    [self.get_handler(receiver, 64 << 20)
+                     for receiver in fast])
+        self.assertTrue(wait_for(lambda: all(h.socket.connected
+                                             for h in handlers)))
+
+        metrics = [Metric('servers.host.cpu.cpu%d.idle' % i, i,
+                          timestamp=1234567, host='host')
+                   for i in range(count)]
+        expected = ''.join(str(metric) for metric in metrics)
+        # Way more than the socket buffers and high water mark of the slow
+        # receivers take
+        self.assertTrue(len(expected) > 8 * 65536)
+
+        start = time.time()
+        for metric in metrics:
+            for handler in handlers:
+                handler.process(metric)
+        for handler in handlers:
+            handler.flush()
+        elapsed = time.time() - start
+
+        # Blocked on the stuck receiver this would take the 60s timeout
+        self.assertTrue(elapsed < 30, elapsed)
+        for receiver, handler in zip(fast, handlers[2:]):
+            self.assertTrue(wait_for(
+                lambda: len(receiver.data) == len(expected), timeout=20))
+            self.assertEqual(receiver.data, expected)
+        # The slow ones got whole metrics, those that fit under the high
+        # water mark
+        lines = expected.splitlines(True)
+        self.assertTrue(0 < len(slow.data) < len(expected))
+        self.assertTrue(set(slow.data[:slow.data.rindex('\n') + 1]
+                            .splitlines(True)) <= set(lines))
+        self.assertTrue(handlers[0].socket.queued <= 65536 + 4096)
+
+        for handler in handlers:
+            handler._close()
+        for receiver in receivers:
+            receiver.stop()
+
+
+class TestShardRefused(unittest.TestCase):
+
+    def setUp(self):
+        # The handlers' connections on a loop that only runs when the test
+        # says so, to see what is routed while the refusal is pending
+        self.loop = IOLoop()
+        patcher = patch.object(IOLoop, 'instance',
+                               staticmethod(lambda: self.loop))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_refused_host_rerouted(self):
+        receiver = Receiver()
+        free = socket.socket()
+        free.bind(('127.0.0.1', 0))
+        refused = free.getsockname()
+        free.close()
+
+        config = configobj.ConfigObj()
+        config['host'] = ['127.0.0.1:%d:live' % receiver.address[1],
+                          '127.0.0.1:%d:dead' % refused[1]]
+        config['mode'] = 'shard'
+        config['batch'] = 1
+        config['max_latency'] = 0
+        config['breaker_backoff'] = 60
+        handler = MultiGraphiteHandler(config)
+        live = handler.nodes[('127.0.0.1', 'live')]
+        dead = handler.nodes[('127.0.0.1', 'dead')]
+
+        metrics = [Metric('servers.host%d.cpu.idle' % i, i,
+                          timestamp=1234567, host='host%d' % i)
+                   for i in range(200)]
+        owned = [metric for metric in metrics
+                 if handler.ring.get_node(metric.path)[1] == 'dead']
+        self.assertTrue(len(owned) > 2)
+
+        # Refused once connect() has returned
+        self.assertTrue(run_until(self.loop,
+                                  lambda: dead.socket.error is not None and
+                                  live.socket.connected))
+        handler.process(owned[0])
+
+        # Tried again at the next flush, and still connecting
+        dead.breaker.retry_at = 0
+        handler.flush()
+        self.assertTrue(dead.socket is not None)
+        for metric in owned[1:]:
+            handler.process(metric)
+
+        expected = ''.join(str(metric) for metric in owned)
+        self.assertTrue(run_until(self.loop,
+                                  lambda: receiver.data == expected))
+        self.assertEqual(dead.metrics, [])
+        self.assertEqual(dead.breaker.state, CircuitBreaker.OPEN)
+        connection = live.socket
+        live._close()
+        self.assertTrue(run_until(self.loop, lambda: connection.closed))
+        receiver.stop()
+
+
+class TestAfterFork(unittest.TestCase):
+    """
+    The handlers connect in the server process, and send from the handler
+    process forked after that
+    """
+
+    def test_max_latency(self):
+        receiver = Receiver()
+        config = configobj.ConfigObj()
+        config['host'] = receiver.address[0]
+        config['port'] = receiver.address[1]
+        config['max_latency'] = 0.1
+        handler = GraphiteHandler(config)
+        metric = Metric('servers.host.cpu.idle', 1, timestamp=1234567,
+                        host='host')
+
+        def child():
+            # Less than a batch, with no flush to follow
+            handler._process(metric)
+            self.assertTrue(wait_for(
+                lambda: not handler.metrics and handler.socket is not None
+                and not handler.socket.queue))
+        self.assertEqual(run_in_child(child), 0)
+
+        self.assertTrue(wait_for(lambda: receiver.data))
+        self.assertEqual(receiver.data, str(metric))
+        handler._close()
+        receiver.stop()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+from diamond.handler.graphite import GraphiteHandler
+from diamond.handler.graphitepickle import GraphitePickleHandler
+from diamond.handler.hashring import ConsistentHashRing
+from diamond.handler.hashring import parse_destination
+from diamond.handler.multigraphite import MultiGraphiteHandler
+from diamond.handler.multigraphitepickle import MultiGraphitePickleHandler
+from diamond.metric import Metric
+
+# Hosts that refuse connections
+DOWN = set()
+
+
+def fake_connect(self):
+    if self.host in DOWN:
+        self.socket = None
+    else:
+        self.socket = Mock()
+
+
+def make_metrics(count):
+    return [Metric('servers.host%d.cpu.total.idle' % i, i,
+                   timestamp=1234567, host='host%d' % i)
+            for i in range(count)]
+
+
+def sent_paths(handler):
+    return [line.split()[0]
+            for call in handler.socket.sendall.call_args_list
+            for line in call[0][0].splitlines()]
+
+
+@patch.object(GraphiteHandler, '_connect', fake_connect)
+class TestMultiGraphiteHandler(unittest.TestCase):
+
+    def setUp(self):
+        DOWN.clear()
+
+    def get_config(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['host'] = ['10.0.0.1', '10.0.0.2:2013:b', '10.0.0.3']
+        # A send per metric, as the tests count them
+        config['batch'] = 1
+        config['max_latency'] = 0
+        config.update(kwargs)
+        return config
+
+    def test_parse_destination(self):
+        self.assertEqual(parse_destination('10.0.0.1', 2003),
+                         ('10.0.0.1', 2003, None))
+        self.assertEqual(parse_destination('10.0.0.1:2013:a', 2003),
+                         ('10.0.0.1', 2013, 'a'))
+        self.assertEqual(parse_destination('[::1]:2004', 2003),
+                         ('::1', 2004, None))
+
+    def test_ring_matches_carbon(self):
+        # Node order as carbon.hashing.ConsistentHashRing picks it
+        ring = ConsistentHashRing([('127.0.0.1', 'cache0'),
+                                   ('127.0.0.1', 'cache1'),
+                                   ('127.0.0.1', 'cache2')])
+        self.assertEqual(ring.get_node('hosts.worker1.cpu'),
+                         ('127.0.0.1', 'cache2'))
+        self.assertEqual(ring.get_nodes('hosts.worker1.cpu'),
+                         [('127.0.0.1', 'cache2'), ('127.0.0.1', 'cache0'),
+                          ('127.0.0.1', 'cache1')])
+
+    def test_mirror(self):
+        handler = MultiGraphiteHandler(self.get_config())
+        metrics = make_metrics(3)
+        for metric in metrics:
+            handler.process(metric)
+
+        self.assertEqual(len(handler.handlers), 3)
+        for graphite in handler.handlers:
+            self.assertEqual(sent_paths(graphite),
+                             [m.path for m in metrics])
+
+    def test_shard(self):
+        handler = MultiGraphiteHandler(self.get_config(mode='shard'))
+        self.assertEqual([(h.host, h.port) for h in handler.handlers],
+                         [('10.0.0.1', 2003), ('10.0.0.2', 2013),
+                          ('10.0.0.3', 2003)])
+
+        metrics = make_metrics(50)
+        for metric in metrics:
+            handler.process(metric)
+
+        for node, graphite in handler.nodes.items():
+            self.assertEqual(
+                sent_paths(graphite),
+                [m.path for m in metrics
+                 if handler.ring.get_node(m.path) == node])
+            self.assertTrue(sent_paths(graphite))
+
+    def test_replication(self):
+        handler = MultiGraphiteHandler(self.get_config(mode='shard',
+                                                       replication_factor=2))
+        metric = make_metrics(1)[0]
+        handler.process(metric)
+
+        nodes = handler.ring.get_nodes(metric.path)
+        for node in nodes[:2]:
+            self.assertEqual(sent_paths(handler.nodes[node]), [metric.path])
+        self.assertEqual(sent_paths(handler.nodes[nodes[2]]), [])
+
+    def test_failover(self):
+        handler = MultiGraphiteHandler(self.get_config(mode='shard'))
+        metric = make_metrics(1)[0]
+        first, second, third = [handler.nodes[node] for node in
+                                handler.ring.get_nodes(metric.path)]
+
+        # The owner goes away
+        DOWN.add(first.host)
+        first.socket.sendall.side_effect = Exception('connection reset')
+        handler.process(metric)
+        self.assertTrue(first in handler.down)
+
+        handler.process(metric)
+        self.assertEqual(sent_paths(second), [metric.path])
+
+        # Everything is down, the owner keeps it until it is back
+        DOWN.update([second.host, third.host])
+        for graphite in (second, third):
+            graphite.socket.sendall.side_effect = Exception('timed out')
+        handler.flush()
+        handler.process(metric)
+        # Along with the one it failed to send when it went away
+        self.assertEqual(first.metrics, [str(metric)] * 2)
+
+        DOWN.clear()
+        handler.flush()
+        self.assertEqual(handler.down, set())
+        self.assertEqual(sent_paths(first), [metric.path] * 2)
+
+    def test_pickle(self):
+        handler = MultiGraphitePickleHandler(self.get_config(mode='shard'))
+        self.assertTrue(all(isinstance(h, GraphitePickleHandler)
+                            for h in handler.handlers))
+
+        metric = make_metrics(1)[0]
+        handler.process(metric)
+        owner = handler.nodes[handler.ring.get_node(metric.path)]
+        for graphite in handler.handlers:
+            self.assertEqual(graphite.socket.sendall.called,
+                             graphite is owner)
+
+
+if __name__ == "__main__":
+    unittest.main()
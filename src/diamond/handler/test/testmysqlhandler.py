@@ -0,0 +1,155 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import sqlite3
+
+from test import unittest
+from mock import patch
+
+import configobj
+
+from diamond.handler.mysql import MySQLHandler
+from diamond.metric import Metric
+
+
+class SQLiteCursor(object):
+    """
+    MySQLdb style cursor over sqlite, which uses ? for parameters
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursor = conn.db.cursor()
+
+    def executemany(self, statement, rows):
+        self.conn.executemany_calls += 1
+        if self.conn.mysqldb.fail:
+            raise sqlite3.OperationalError('server has gone away')
+        self.cursor.executemany(statement.replace('%s', '?'), rows)
+
+    def close(self):
+        self.cursor.close()
+
+
+class SQLiteConnection(object):
+
+    def __init__(self, mysqldb):
+        self.mysqldb = mysqldb
+        self.db = mysqldb.db
+        self.commits = 0
+        self.executemany_calls = 0
+
+    def cursor(self):
+        return SQLiteCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    def close(self):
+        pass
+
+
+class FakeMySQLdb(object):
+
+    def __init__(self):
+        self.db = sqlite3.connect(':memory:')
+        self.db.execute('CREATE TABLE metrics (metric TEXT, time INTEGER, '
+                        'value REAL)')
+        self.connections = []
+        self.fail = False
+
+    def Connect(self, **kwargs):
+        self.connections.append(SQLiteConnection(self))
+        return self.connections[-1]
+
+    def rows(self):
+        return self.db.execute(
+            'SELECT metric, time, value FROM metrics').fetchall()
+
+
+class TestMySQLHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.mysqldb = FakeMySQLdb()
+        patcher = patch('diamond.handler.mysql.MySQLdb', self.mysqldb)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_handler(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['hostname'] = 'localhost'
+        config['port'] = '3306'
+        config['username'] = 'diamond'
+        config['password'] = 'diamond'
+        config['database'] = 'diamond'
+        config['table'] = 'metrics'
+        config['col_time'] = 'time'
+        config['col_metric'] = 'metric'
+        config['col_value'] = 'value'
+        config.update(kwargs)
+        return MySQLHandler(config)
+
+    def metrics(self, count):
+        return [Metric('servers.host.cpu.idle%d' % i, i, timestamp=1234567,
+                       host='host') for i in range(count)]
+
+    def test_rows_inserted_in_batches(self):
+        handler = self.get_handler(batch=3)
+
+        for metric in self.metrics(7):
+            handler.process(metric)
+
+        conn = self.mysqldb.connections[0]
+        self.assertEqual(conn.executemany_calls, 2)
+        self.assertEqual(conn.commits, 2)
+        self.assertEqual(len(self.mysqldb.rows()), 6)
+        self.assertEqual(self.mysqldb.rows()[0],
+                         (u'servers.host.cpu.idle0', 1234567, 0.0))
+        self.assertEqual(len(handler.rows), 1)
+
+    def test_flush_interval(self):
+        handler = self.get_handler(batch=100, flush_interval=10)
+
+        with patch('time.time', return_value=handler.last_flush + 5):
+            handler.process(self.metrics(1)[0])
+            handler.flush()
+        self.assertEqual(self.mysqldb.rows(), [])
+
+        with patch('time.time', return_value=handler.last_flush + 10):
+            handler.flush()
+        self.assertEqual(len(self.mysqldb.rows()), 1)
+        self.assertEqual(self.mysqldb.connections[0].commits, 1)
+
+    def test_rows_kept_on_failure(self):
+        handler = self.get_handler(batch=2, max_backlog=3,
+                                   breaker_backoff=60)
+        self.mysqldb.fail = True
+
+        for metric in self.metrics(4):
+            handler.process(metric)
+        self.assertEqual([row[0] for row in handler.rows],
+                         ['servers.host.cpu.idle1', 'servers.host.cpu.idle2',
+                          'servers.host.cpu.idle3'])
+        # No reconnect per metric while MySQL is down
+        self.assertEqual(len(self.mysqldb.connections), 1)
+        self.assertEqual(self.mysqldb.connections[0].executemany_calls, 1)
+
+        # Reconnected on the next insert once it is due
+        self.mysqldb.fail = False
+        handler.flush_interval = 0
+        handler.flush()
+        self.assertEqual(len(self.mysqldb.rows()), 0)
+        handler.breaker.retry_at = 0
+        handler.flush()
+        self.assertEqual(len(self.mysqldb.connections), 2)
+        self.assertEqual(len(self.mysqldb.rows()), 3)
+        self.assertEqual(handler.rows, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import Queue
+
+from test import unittest
+from mock import Mock
+
+import configobj
+
+from diamond.handler.queue import QueueHandler
+from diamond.metric import Metric
+
+
+class TestQueueHandler(unittest.TestCase):
+
+    def test_batches_until_flush(self):
+        queue = Queue.Queue()
+        handler = QueueHandler(config=configobj.ConfigObj(), queue=queue,
+                               should_exit=Mock(), batch_size=2)
+
+        for i in range(3):
+            handler.process(Metric('metricname%d' % i, i, timestamp=123))
+
+        self.assertEqual(queue.qsize(), 1)
+        batch, flush = queue.get()
+        self.assertEqual([m.path for m in batch],
+                         ['metricname0', 'metricname1'])
+        self.assertFalse(flush)
+
+        handler.flush()
+        batch, flush = queue.get()
+        self.assertEqual([m.path for m in batch], ['metricname2'])
+        self.assertTrue(flush)
+
+    def test_queue_full(self):
+        should_exit = Mock()
+        handler = QueueHandler(config=configobj.ConfigObj(),
+                               queue=Queue.Queue(maxsize=1),
+                               should_exit=should_exit, batch_size=1)
+
+        handler.process(Metric('metricname1', 0, timestamp=123))
+        self.assertEqual(should_exit.set.call_count, 0)
+
+        handler.process(Metric('metricname2', 0, timestamp=123))
+        self.assertEqual(should_exit.set.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
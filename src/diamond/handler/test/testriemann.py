@@ -2,6 +2,12 @@
 # coding=utf-8
 ##########################################################################
 
+import SocketServer
+import socket
+import struct
+import threading
+import time
+
 from test import unittest
 from test import run_only
 import configobj
@@ -9,6 +15,11 @@ import configobj
 from diamond.handler.riemann import RiemannHandler
 from diamond.metric import Metric
 
+try:
+    import bernhard
+except ImportError:
+    bernhard = None
+
 
 def run_only_if_bernhard_is_available(func):
     try:
@@ -19,8 +30,78 @@ def run_only_if_bernhard_is_available(func):
     return run_only(func, pred)
 
 
+def make_metrics(count):
+    return [Metric('servers.host%d.cpu.total.idle%d' % (i, i), i,
+                   timestamp=1234567, host='host%d' % i)
+            for i in range(count)]
+
+
+class RiemannServer(SocketServer.BaseRequestHandler):
+    """
+    Records the events of each message and acknowledges it
+    """
+    messages = []
+
+    def handle(self):
+        while True:
+            header = self.request.recv(4, socket.MSG_WAITALL)
+            if len(header) < 4:
+                return
+            length = struct.unpack('!I', header)[0]
+            message = bernhard.pb.Msg.FromString(
+                self.request.recv(length, socket.MSG_WAITALL))
+            RiemannServer.messages.append(list(message.events))
+
+            response = bernhard.pb.Msg()
+            response.ok = True
+            data = response.SerializeToString()
+            self.request.sendall(struct.pack('!I', len(data)) + data)
+
+
+class RiemannUDPServer(SocketServer.BaseRequestHandler):
+    sizes = []
+
+    def handle(self):
+        data = self.request[0]
+        RiemannUDPServer.sizes.append(len(data))
+        RiemannServer.messages.append(
+            list(bernhard.pb.Msg.FromString(data).events))
+
+
+class ThreadedTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+
+
 class TestRiemannHandler(unittest.TestCase):
 
+    def setUp(self):
+        RiemannServer.messages = []
+        RiemannUDPServer.sizes = []
+        self.server = ThreadedTCPServer(('127.0.0.1', 0), RiemannServer)
+        self.port = self.server.server_address[1]
+        thread = threading.Thread(target=self.server.serve_forever,
+                                  kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_config(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['host'] = '127.0.0.1'
+        config['port'] = self.port
+        config.update(kwargs)
+        return config
+
+    def free_port(self):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
     @run_only_if_bernhard_is_available
     def test_metric_to_riemann_event(self):
         config = configobj.ConfigObj()
@@ -42,3 +123,68 @@ class TestRiemannHandler(unittest.TestCase):
             'metric': 0.0,
             'ttl': None
         })
+
+    @run_only_if_bernhard_is_available
+    def test_events_batched(self):
+        handler = RiemannHandler(self.get_config(batch=3))
+        for metric in make_metrics(4):
+            handler.process(metric)
+        self.assertEqual([len(m) for m in RiemannServer.messages], [3])
+
+        handler.flush()
+        self.assertEqual([len(m) for m in RiemannServer.messages], [3, 1])
+        event = RiemannServer.messages[1][0]
+        self.assertEqual((event.host, event.service, event.time,
+                          event.metric_f, event.HasField('ttl')),
+                         ('host3', 'servers.cpu.total.idle3', 1234567, 3.0,
+                          False))
+        handler._close()
+
+    @run_only_if_bernhard_is_available
+    def test_events_kept_while_down(self):
+        handler = RiemannHandler(self.get_config(port=self.free_port(),
+                                                 max_backlog=3,
+                                                 breaker_backoff=0))
+        for metric in make_metrics(4):
+            handler.process(metric)
+        handler.flush()
+        self.assertEqual([e.service for e in handler.events],
+                         ['servers.cpu.total.idle1',
+                          'servers.cpu.total.idle2',
+                          'servers.cpu.total.idle3'])
+
+        handler.port = handler.client.port = self.port
+        handler.flush()
+        self.assertEqual(len(handler.events), 0)
+        self.assertEqual([len(m) for m in RiemannServer.messages], [3])
+        handler._close()
+
+    @run_only_if_bernhard_is_available
+    def test_udp_messages_fit_a_datagram(self):
+        server = SocketServer.UDPServer(('127.0.0.1', 0), RiemannUDPServer)
+        thread = threading.Thread(target=server.serve_forever,
+                                  kwargs={'poll_interval': 0.01})
+        thread.daemon = True
+        thread.start()
+
+        handler = RiemannHandler(self.get_config(
+            port=server.server_address[1], transport='udp',
+            max_udp_size=200))
+        for metric in make_metrics(10):
+            handler.process(metric)
+        handler.flush()
+
+        deadline = time.time() + 5
+        while (sum(len(m) for m in RiemannServer.messages) < 10 and
+               time.time() < deadline):
+            time.sleep(0.01)
+        server.shutdown()
+        server.server_close()
+        sizes = [len(m) for m in RiemannServer.messages]
+        self.assertEqual(sum(sizes), 10)
+        self.assertTrue(len(sizes) > 1)
+        self.assertTrue(max(RiemannUDPServer.sizes) <= 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
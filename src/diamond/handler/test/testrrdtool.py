@@ -0,0 +1,161 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from test import unittest
+from mock import patch
+
+import configobj
+
+from diamond.handler.rrdtool import RRDHandler
+from diamond.metric import Metric
+
+
+class RRDCachedStub(threading.Thread):
+    """
+    Accepts one connection on a unix socket, records what is sent and
+    answers BATCH requests with the given errors
+    """
+
+    def __init__(self, path, errors=()):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.errors = errors
+        self.commands = []
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(path)
+        self.server.listen(1)
+
+    def run(self):
+        conn, _ = self.server.accept()
+        reader = conn.makefile('rb')
+        for line in reader:
+            line = line.rstrip('\n')
+            self.commands.append(line)
+            if line == 'BATCH':
+                conn.sendall(
+                    "0 Go ahead.  End with dot '.' on its own line.\n")
+            elif line == '.':
+                conn.sendall('%d errors\n' % len(self.errors))
+                for number, message in self.errors:
+                    conn.sendall('%d %s\n' % (number, message))
+        conn.close()
+        self.server.close()
+
+
+class TestRRDHandler(unittest.TestCase):
+
+    def setUp(self):
+        self.basedir = tempfile.mkdtemp()
+        self.now = int(time.time())
+        # Don't run rrdtool create
+        patcher = patch('subprocess.check_call')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.basedir)
+
+    def get_handler(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['basedir'] = self.basedir
+        config.update(kwargs)
+        return RRDHandler(config)
+
+    def metric(self, path, value, offset=0):
+        return Metric('servers.host.cpu.' + path, value,
+                      timestamp=self.now + offset, host='host')
+
+    def filename(self, name):
+        return os.path.join(self.basedir, 'host', 'cpu', name + '.rrd')
+
+    @patch('subprocess.call')
+    def test_updates_batched_across_intervals(self, call_mock):
+        call_mock.return_value = 0
+        handler = self.get_handler(batch=3)
+
+        for i in range(2):
+            handler.process(self.metric('total.idle', i, i * 10))
+            handler.flush()
+        self.assertFalse(call_mock.called)
+
+        # A late arrival is written in time order, a repeat is dropped
+        handler.process(self.metric('total.idle', 5, 5))
+        handler.process(self.metric('total.idle', 1, 10))
+        handler.flush()
+        call_mock.assert_called_once_with(
+            ['rrdupdate', self.filename('total_idle'), '--',
+             '%d:0' % self.now, '%d:5' % (self.now + 5),
+             '%d:1' % (self.now + 10)], close_fds=True)
+
+    @patch('subprocess.call')
+    def test_flush_interval(self, call_mock):
+        call_mock.return_value = 0
+        handler = self.get_handler(batch=10, flush_interval=60)
+
+        handler.process(self.metric('total.idle', 1, -30))
+        handler.flush()
+        self.assertFalse(call_mock.called)
+
+        handler.process(self.metric('total.user', 2, -90))
+        handler.flush()
+        call_mock.assert_called_once_with(
+            ['rrdupdate', self.filename('total_user'), '--',
+             '%d:2' % (self.now - 90)], close_fds=True)
+
+    def test_rrdcached_batch(self):
+        path = os.path.join(self.basedir, 'rrdcached.sock')
+        stub = RRDCachedStub(path, errors=[(2, 'No such file')])
+        stub.start()
+        handler = self.get_handler(batch=1, rrdcached='unix:' + path)
+
+        handler.process(self.metric('total.idle', 1))
+        handler.process(self.metric('total.user', 2))
+        handler.process(self.metric('total.idle', 3, 10))
+        with patch.object(handler.log, 'warning') as warning_mock:
+            handler.flush()
+        handler._close()
+        stub.join(5)
+
+        idle = 'UPDATE %s %d:1 %d:3' % (self.filename('total_idle'),
+                                        self.now, self.now + 10)
+        user = 'UPDATE %s %d:2' % (self.filename('total_user'), self.now)
+        self.assertEqual(stub.commands[0], 'BATCH')
+        self.assertEqual(sorted(stub.commands[1:3]), sorted([idle, user]))
+        self.assertEqual(stub.commands[3:], ['.'])
+        rejected = stub.commands[2].split()[1]
+        warning_mock.assert_called_once_with(
+            'RRDHandler: rrdcached rejected update of %s: %s', rejected,
+            'No such file')
+
+    def test_rrdcached_down_keeps_updates(self):
+        path = os.path.join(self.basedir, 'rrdcached.sock')
+        handler = self.get_handler(batch=1, rrdcached=path,
+                                   breaker_backoff=0)
+
+        handler.process(self.metric('total.idle', 1))
+        handler.flush()
+        handler.process(self.metric('total.idle', 2, 10))
+
+        stub = RRDCachedStub(path)
+        stub.start()
+        handler.flush()
+        handler._close()
+        stub.join(5)
+
+        self.assertEqual(stub.commands, [
+            'BATCH',
+            'UPDATE %s %d:1 %d:2' % (self.filename('total_idle'),
+                                     self.now, self.now + 10),
+            '.'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+from test import unittest
+
+from diamond.handler.sentry import literal_suffix, Rule, RuleMatcher
+
+
+class TestRuleMatcher(unittest.TestCase):
+
+    def test_literal_suffix(self):
+        self.assertEqual(literal_suffix('loadavg.15'), '15')
+        self.assertEqual(literal_suffix(r'memory\.MemFree'), 'memory.MemFree')
+        self.assertEqual(literal_suffix(r'cpu\.cpu[0-9]+\.user'), '.user')
+        self.assertEqual(literal_suffix(r'network\.\w+'), '')
+        self.assertEqual(literal_suffix('idle|user'), '')
+        self.assertEqual(literal_suffix('(?i)user'), '')
+        self.assertEqual(literal_suffix('users?'), '')
+
+    def test_matches_same_rules_as_each_regexp(self):
+        rules = [Rule('load', 'loadavg.15', max=8),
+                 Rule('memory', r'memory\.MemFree', min=1),
+                 Rule('user', r'cpu\.cpu[0-9]+\.user', max=90),
+                 Rule('any user', r'.*user', max=95),
+                 Rule('either', 'idle|user', max=99),
+                 Rule('network', r'network\.\w+', max=100)]
+        matcher = RuleMatcher(rules, cache_size=2)
+
+        paths = ['servers.host.loadavg.15', 'servers.host.loadavg_15',
+                 'servers.host.loadavg.05', 'servers.host.memory.MemFree',
+                 'servers.host.cpu.cpu0.user', 'servers.host.cpu.total.user',
+                 'servers.host.cpu.cpu1.idle', 'servers.host.network.eth0',
+                 'servers.host.diskspace.root.byte_free']
+        # Twice, to go through the cache as well
+        for path in paths + paths:
+            expected = [(rule.name, rule.regexp.match(path).groups())
+                        for rule in rules if rule.regexp.match(path)]
+            self.assertEqual([(rule.name, match.groups())
+                              for rule, match in matcher.match(path)],
+                             expected, path)
+
+    def test_cache_bounded(self):
+        matcher = RuleMatcher([Rule('load', 'loadavg.15', max=8)],
+                              cache_size=2)
+        for path in ('a.loadavg.15', 'b.loadavg.15', 'a.loadavg.15',
+                     'c.loadavg.15'):
+            matcher.match(path)
+        self.assertEqual(matcher.cache.keys(),
+                         ['a.loadavg.15', 'c.loadavg.15'])
+
+
+if __name__ == "__main__":
+    unittest.main()
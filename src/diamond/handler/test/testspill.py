@@ -0,0 +1,140 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import os
+import shutil
+import tempfile
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+import diamond.handler.graphite as graphite
+import diamond.handler.multigraphite as multigraphite
+from diamond.handler.spill import SpillLog
+from diamond.metric import Metric
+
+
+class TestSpillLog(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def get_spill(self, max_size=1024 * 1024, segment_size=64,
+                  replay_rate=1000000):
+        spill = SpillLog(self.path, max_size, segment_size, replay_rate,
+                         Mock())
+        spill.last_read -= 1
+        return spill
+
+    def test_replay_in_order_across_segments(self):
+        spill = self.get_spill()
+        records = ['record%02d' % i for i in range(20)]
+        for record in records:
+            spill.append([record])
+
+        self.assertTrue(len(spill.segments) > 1)
+        self.assertEqual(spill.read(), records)
+        spill.commit()
+        self.assertEqual(len(spill), 0)
+        self.assertEqual(spill.segments, [])
+
+    def test_read_without_commit_is_repeated(self):
+        spill = self.get_spill()
+        spill.append(['a', 'b'])
+
+        self.assertEqual(spill.read(), ['a', 'b'])
+        spill.last_read -= 1
+        self.assertEqual(spill.read(), ['a', 'b'])
+
+    def test_survives_restart(self):
+        spill = self.get_spill(replay_rate=2)
+        spill.append(['a', 'b', 'c'])
+        self.assertEqual(spill.read(), ['a', 'b'])
+        spill.commit()
+        spill._close_writer()
+
+        spill = self.get_spill()
+        spill.append(['d'])
+        self.assertEqual(spill.read(), ['c', 'd'])
+
+    def test_size_cap_drops_oldest_segment(self):
+        spill = self.get_spill(max_size=100, segment_size=40)
+        for i in range(10):
+            spill.append(['record%02d' % i])
+
+        self.assertTrue(len(spill) <= 100)
+        records = spill.read()
+        self.assertEqual(records[-1], 'record09')
+        self.assertNotIn('record00', records)
+
+    def test_replay_rate(self):
+        spill = self.get_spill(replay_rate=3)
+        spill.append(['record%02d' % i for i in range(10)])
+
+        self.assertEqual(len(spill.read()), 3)
+        self.assertEqual(spill.read(), [])
+
+
+class TestGraphiteHandlerSpill(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.connect = patch.object(graphite.GraphiteHandler, '_connect')
+        self.connect.start()
+
+    def tearDown(self):
+        self.connect.stop()
+        shutil.rmtree(self.path)
+
+    def test_backlog_is_spilled_and_replayed(self):
+        config = configobj.ConfigObj()
+        config['batch'] = 1
+        config['max_backlog_multiplier'] = 4
+        config['trim_backlog_multiplier'] = 3
+        config['spill_path'] = self.path
+
+        handler = graphite.GraphiteHandler(config)
+        self.assertTrue(os.path.isdir(
+            os.path.join(self.path, 'GraphiteHandler-localhost-2003')))
+
+        # Graphite is down
+        for i in range(8):
+            handler.process(Metric('metricname%d' % i, 0, timestamp=123))
+        self.assertEqual(len(handler.metrics), 3)
+
+        # Graphite is back
+        handler.spill.last_read -= 1
+        send_mock = Mock(return_value=True)
+        with patch.object(handler, 'socket', Mock()):
+            with patch.object(handler, '_send_data', send_mock):
+                handler.flush()
+
+        self.assertEqual(send_mock.call_count, 2)
+        self.assertEqual(
+            send_mock.call_args_list[1][0][0],
+            ''.join('metricname%d 0 123\n' % i for i in range(5)))
+        self.assertEqual(len(handler.spill), 0)
+
+    def test_log_per_destination(self):
+        config = configobj.ConfigObj()
+        config['host'] = ['10.0.0.1:2003:a', '10.0.0.1:2103:b', '10.0.0.2']
+        config['mode'] = 'shard'
+        config['spill_path'] = self.path
+
+        handler = multigraphite.MultiGraphiteHandler(config)
+        self.assertEqual(
+            sorted(child.spill.path for child in handler.handlers),
+            [os.path.join(self.path, name) for name in (
+                'GraphiteHandler-10.0.0.1-2003',
+                'GraphiteHandler-10.0.0.1-2103',
+                'GraphiteHandler-10.0.0.2-2003')])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -90,3 +90,53 @@ class TestStatsdHandler(unittest.TestCase):
         handler.process(metric2)
         handler.connection.incr.assert_called_with(*expected_data2)
         handler.connection.send.assert_called_with()
+
+    @run_only_if_statsd_is_available
+    @patch('statsd.StatsClient')
+    def test_batched_with_mtu(self, mock_client):
+        config = configobj.ConfigObj()
+        config['host'] = 'localhost'
+        config['port'] = '9999'
+        config['batch'] = 2
+        config['mtu'] = 512
+
+        handler = StatsdHandler(config)
+        mock_client.assert_called_with(host='localhost', port=9999,
+                                       maxudpsize=512)
+
+        handler.process(Metric('servers.host.cpu.total.idle', 1,
+                               timestamp=1234567, host='host',
+                               metric_type='GAUGE'))
+        self.assertFalse(handler.connection.send.called)
+        handler.process(Metric('servers.host.cpu.total.user', 2,
+                               timestamp=1234567, host='host',
+                               metric_type='GAUGE'))
+        self.assertEqual(handler.connection.gauge.call_count, 2)
+        handler.connection.send.assert_called_once_with()
+
+    @run_only_if_statsd_is_available
+    @patch('statsd.StatsClient')
+    def test_counters_expire(self, mock_client):
+        config = configobj.ConfigObj()
+        config['host'] = 'localhost'
+        config['port'] = '9999'
+        config['batch'] = 1
+        config['counter_ttl'] = 60
+        config['max_counters'] = 2
+
+        handler = StatsdHandler(config)
+        with patch('time.time', return_value=1000):
+            for name in ('a', 'b', 'c'):
+                handler.process(Metric('servers.host.' + name, 1,
+                                       raw_value=1, timestamp=1234567,
+                                       host='host', metric_type='COUNTER'))
+        self.assertEqual(handler.old_values.keys(),
+                         ['servers.host.b', 'servers.host.c'])
+
+        with patch('time.time', return_value=1030):
+            handler.process(Metric('servers.host.b', 1, raw_value=5,
+                                   timestamp=1234567, host='host',
+                                   metric_type='COUNTER'))
+        with patch('time.time', return_value=1070):
+            handler.flush()
+        self.assertEqual(handler.old_values.keys(), ['servers.host.b'])
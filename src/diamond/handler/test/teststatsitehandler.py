@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import socket
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+from diamond.handler.ioloop import Connection
+from diamond.handler.statsite import StatsiteHandler
+from diamond.metric import Metric
+
+
+class TestStatsiteHandler(unittest.TestCase):
+
+    def get_handler(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['host'] = 'localhost'
+        # The writes are checked on the mocked socket
+        config['transport'] = 'blocking'
+        config.update(kwargs)
+        return StatsiteHandler(config)
+
+    def metrics(self, count):
+        return [Metric('servers.host.cpu.idle%d' % i, i, precision=1,
+                       timestamp=1234567, host='host')
+                for i in range(count)]
+
+    @patch('socket.socket')
+    def test_udp_packed_to_mtu(self, socket_mock):
+        # Each record is 27 bytes
+        handler = self.get_handler(batch=10, mtu=60)
+
+        for metric in self.metrics(5):
+            handler.process(metric)
+        self.assertFalse(handler.socket.sendall.called)
+
+        handler.flush()
+        self.assertEqual(
+            [c[0][0] for c in handler.socket.sendall.call_args_list],
+            ['servers.host.cpu.idle0:0.0|kv\n'
+             'servers.host.cpu.idle1:1.0|kv\n',
+             'servers.host.cpu.idle2:2.0|kv\n'
+             'servers.host.cpu.idle3:3.0|kv\n',
+             'servers.host.cpu.idle4:4.0|kv\n'])
+        self.assertEqual(handler.records, [])
+
+    @patch('socket.socket')
+    def test_tcp_single_write(self, socket_mock):
+        handler = self.get_handler(batch=3, udpport=0, mtu=60)
+
+        for metric in self.metrics(3):
+            handler.process(metric)
+        handler.socket.sendall.assert_called_once_with(
+            'servers.host.cpu.idle0:0.0|kv\n'
+            'servers.host.cpu.idle1:1.0|kv\n'
+            'servers.host.cpu.idle2:2.0|kv\n')
+
+    def test_reconnect_when_back(self):
+        # Bound but not listening, so connecting is refused
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        handler = self.get_handler(
+            host='127.0.0.1', udpport=0, tcpport=server.getsockname()[1],
+            batch=1, breaker_backoff=60)
+        handler.process(self.metrics(1)[0])
+        self.assertEqual(handler.socket, None)
+
+        server.listen(1)
+        server.settimeout(5)
+        # Due to be tried again
+        handler.breaker.retry_at = 0
+        handler.process(self.metrics(2)[1])
+        connection, _ = server.accept()
+        self.assertEqual(handler.breaker.state, 'closed')
+        self.assertEqual(connection.recv(4096),
+                         'servers.host.cpu.idle1:1.0|kv\n')
+        handler._close()
+        connection.close()
+        server.close()
+
+    @patch.object(Connection, 'connect', Mock())
+    def test_unsent_resent(self):
+        handler = self.get_handler(transport='nonblocking', batch=10)
+        sendall = Mock(side_effect=[socket.error('reset'), None, None])
+        # Queued on the connection before it failed
+        handler.socket.unsent = ['servers.host.cpu.user:1.0|kv\n']
+
+        for metric in self.metrics(1):
+            handler.process(metric)
+        with patch.object(Connection, 'sendall', sendall):
+            handler.flush()
+        self.assertEqual([c[0][0] for c in sendall.call_args_list],
+                         ['servers.host.cpu.idle0:0.0|kv\n',
+                          'servers.host.cpu.user:1.0|kv\n',
+                          'servers.host.cpu.idle0:0.0|kv\n'])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+import gzip
+import json
+import socket
+from cStringIO import StringIO
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+
+from diamond.handler.ioloop import Connection
+from diamond.handler.tsdb import TSDBHandler
+from diamond.metric import Metric
+
+
+def make_metrics(count):
+    return [Metric('servers.host.cpu.total.idle%d' % i, i,
+                   timestamp=1234567, host='host')
+            for i in range(count)]
+
+
+class TestTSDBHandler(unittest.TestCase):
+
+    def get_config(self, **kwargs):
+        config = configobj.ConfigObj()
+        config['host'] = 'localhost'
+        config['port'] = '4242'
+        # The writes are checked on the mocked socket
+        config['transport'] = 'blocking'
+        config.update(kwargs)
+        return config
+
+    @patch('socket.socket')
+    def test_lines_sent_in_one_write(self, socket_mock):
+        handler = TSDBHandler(self.get_config(batch=10))
+
+        for metric in make_metrics(3):
+            handler.process(metric)
+        self.assertFalse(handler.socket.sendall.called)
+
+        handler.flush()
+        handler.socket.sendall.assert_called_once_with(
+            'put cpu.total.idle0 1234567 0 hostname=host\n'
+            'put cpu.total.idle1 1234567 1 hostname=host\n'
+            'put cpu.total.idle2 1234567 2 hostname=host\n')
+        self.assertEqual(handler.metrics, [])
+
+    @patch('socket.socket')
+    def test_backlog_kept_while_down(self, socket_mock):
+        handler = TSDBHandler(self.get_config(batch=2, max_backlog=3))
+        socket_mock.return_value.sendall.side_effect = socket.error('down')
+
+        for metric in make_metrics(5):
+            handler.process(metric)
+        self.assertEqual([m.split()[0] for m in handler.metrics],
+                         ['cpu.total.idle2', 'cpu.total.idle3',
+                          'cpu.total.idle4'])
+
+        socket_mock.return_value.sendall.side_effect = None
+        handler.flush()
+        self.assertEqual(handler.metrics, [])
+
+    def test_reconnect_when_back(self):
+        # Bound but not listening, so connecting is refused
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        handler = TSDBHandler(self.get_config(
+            host='127.0.0.1', port=server.getsockname()[1], batch=1,
+            breaker_backoff=60))
+        handler.process(make_metrics(1)[0])
+        self.assertEqual(handler.socket, None)
+        self.assertEqual(len(handler.metrics), 1)
+
+        server.listen(1)
+        server.settimeout(5)
+        # Due to be tried again
+        handler.breaker.retry_at = 0
+        handler.flush()
+        connection, _ = server.accept()
+        self.assertEqual(handler.breaker.state, 'closed')
+        self.assertEqual(handler.metrics, [])
+        self.assertEqual(connection.recv(4096),
+                         'put cpu.total.idle0 1234567 0 hostname=host\n')
+        handler._close()
+        connection.close()
+        server.close()
+
+    @patch.object(Connection, 'connect', Mock())
+    @patch.object(Connection, 'sendall', Mock(side_effect=socket.error))
+    def test_unsent_lines_kept(self):
+        handler = TSDBHandler(self.get_config(transport='nonblocking',
+                                              batch=10))
+        # Queued on the connection before it failed
+        handler.socket.unsent = [
+            'put cpu.total.user 1234567 1 hostname=host\n']
+
+        for metric in make_metrics(2):
+            handler.process(metric)
+        handler.flush()
+        self.assertEqual([m.split()[0] for m in handler.metrics],
+                         ['cpu.total.user', 'cpu.total.idle0',
+                          'cpu.total.idle1'])
+
+    @patch('httplib.HTTPConnection')
+    def test_http_bulk_put(self, connection_mock):
+        handler = TSDBHandler(self.get_config(mode='http', batch=100,
+                                              compression=True,
+                                              max_request_size=250))
+        connection = connection_mock.return_value
+        connection.getresponse.return_value = Mock(status=204)
+
+        for metric in make_metrics(5):
+            handler.process(metric)
+        handler.flush()
+
+        # One connection, the datapoints split over several requests
+        self.assertEqual(connection_mock.call_count, 1)
+        points = []
+        for call in connection.request.call_args_list:
+            method, path, body, headers = call[0]
+            self.assertEqual((method, path), ('POST', '/api/put'))
+            self.assertEqual(headers['Content-Encoding'], 'gzip')
+            body = gzip.GzipFile(fileobj=StringIO(body)).read()
+            self.assertTrue(len(body) <= 250)
+            points.extend(json.loads(body))
+        self.assertTrue(connection.request.call_count > 1)
+        self.assertEqual(len(points), 5)
+        self.assertEqual(points[0], {
+            'metric': 'cpu.total.idle0',
+            'timestamp': 1234567,
+            'value': 0,
+            'tags': {'hostname': 'host'},
+        })
+        self.assertEqual(handler.metrics, [])
+
+    @patch('httplib.HTTPConnection')
+    def test_http_server_error_keeps_metrics(self, connection_mock):
+        handler = TSDBHandler(self.get_config(mode='http',
+                                              breaker_backoff=0))
+        connection = connection_mock.return_value
+        connection.getresponse.return_value = Mock(status=503)
+
+        for metric in make_metrics(2):
+            handler.process(metric)
+        handler.flush()
+        self.assertEqual(len(handler.metrics), 2)
+
+        connection.getresponse.return_value = Mock(status=204)
+        handler.flush()
+        self.assertEqual(handler.metrics, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
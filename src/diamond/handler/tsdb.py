@@ -34,15 +34,39 @@ yourself.
 `    handlers = diamond.handler.tsdb.TSDBHandler
 `
 
+Metrics are buffered and written to TSDB `batch` at a time, and at the end of
+every collector run. While TSDB is unreachable up to `max_backlog` metrics are
+kept and sent once it is back, after that the oldest are dropped.
+
+With `mode = http` metrics are sent to the `/api/put` endpoint as JSON over a
+keep-alive connection instead of as telnet style `put` lines, split into
+requests of at most `max_request_size` bytes and optionally gzip compressed.
+
+In telnet mode the default `transport = nonblocking` queues the lines on a
+connection written out by a thread shared with the other handlers, so a slow
+TSDB does not hold up the rest. While more than `high_water` bytes are
+waiting to go out metrics stay in the backlog, and if the connection fails
+the lines it had not sent go back in the backlog. `transport = blocking`
+writes straight to the socket instead.
+
 """
 
 from Handler import Handler
+from httpsender import HTTPSender
+from ioloop import Connection
+from ioloop import QueueFull
+import httplib
 import socket
 
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
 
 class TSDBHandler(Handler):
     """
-    Implements the abstract Handler class, sending data to graphite
+    Implements the abstract Handler class, sending data to OpenTSDB
     """
     RETRY = 3
 
@@ -55,6 +79,8 @@ class TSDBHandler(Handler):
 
         # Initialize Data
         self.socket = None
+        self.http = None
+        self.metrics = []
 
         # Initialize Options
         self.host = self.config['host']
@@ -62,9 +88,27 @@ class TSDBHandler(Handler):
         self.timeout = int(self.config['timeout'])
         self.metric_format = str(self.config['format'])
         self.tags = str(self.config['tags'])
+        self.batch_size = int(self.config['batch'])
+        self.max_backlog = int(self.config['max_backlog'])
+        self.mode = self.config['mode'].lower()
+        self.http_path = self.config['http_path']
+        self.compression = str(self.config['compression']).lower() in (
+            'true', 'yes', '1')
+        self.max_request_size = int(self.config['max_request_size'])
+        self.transport = self.config['transport'].lower()
+        self.high_water = int(self.config['high_water'])
 
         # Connect
-        self._connect()
+        if self.mode == 'http':
+            # Backlogged metrics are sent again on the next flush, so don't
+            # hold up the handler retrying
+            self.http = HTTPSender(
+                'http://%s:%d%s' % (self.host, self.port, self.http_path),
+                headers={'Content-Type': 'application/json'},
+                compression=self.compression, timeout=self.timeout,
+                retries=0, breaker=self.breaker)
+        else:
+            self._connect()
 
     def get_default_config_help(self):
         """
@@ -78,6 +122,16 @@ class TSDBHandler(Handler):
             'timeout': '',
             'format': '',
             'tags': '',
+            'batch': 'How many metrics to store before sending them to TSDB',
+            'max_backlog': 'How many metrics to keep while TSDB is down',
+            'mode': 'telnet to send put lines, http to use /api/put',
+            'http_path': 'Path of the put endpoint in http mode',
+            'compression': 'Gzip request bodies in http mode',
+            'max_request_size': 'Largest request body in http mode, in bytes',
+            'transport': 'nonblocking to send from a shared I/O thread, or'
+                         ' blocking to write from the handler',
+            'high_water': 'Most bytes to queue for sending with the'
+                          ' nonblocking transport',
         })
 
         return config
@@ -95,6 +149,14 @@ class TSDBHandler(Handler):
             'format': '{Collector}.{Metric} {timestamp} {value} hostname={host}'
                       '{tags}',
             'tags': '',
+            'batch': 500,
+            'max_backlog': 50000,
+            'mode': 'telnet',
+            'http_path': '/api/put',
+            'compression': False,
+            'max_request_size': 65536,
+            'transport': 'nonblocking',
+            'high_water': 1048576,
         })
 
         return config
@@ -107,7 +169,7 @@ class TSDBHandler(Handler):
 
     def process(self, metric):
         """
-        Process a metric by sending it to TSDB
+        Process a metric by queueing it to be sent to TSDB
         """
 
         metric_str = self.metric_format.format(
@@ -119,31 +181,60 @@ class TSDBHandler(Handler):
             value=metric.value,
             tags=self.tags
         )
-        # Just send the data as a string
-        self._send("put " + str(metric_str) + "\n")
+        self.metrics.append(str(metric_str))
+        if len(self.metrics) >= self.batch_size:
+            self._send()
+
+    def flush(self):
+        """Flush metrics in queue"""
+        self._send()
+
+    def _send(self):
+        """
+        Send the queued metrics to TSDB. Metrics that can not be sent are
+        kept for the next attempt, up to max_backlog of them.
+        """
+        if not self.metrics:
+            return
+
+        if self.mode == 'http':
+            self.metrics = self._send_http(self.metrics)
+        else:
+            metrics, self.metrics = self.metrics, []
+            if not self._send_lines(metrics):
+                # Kept after anything a failed connection gave back
+                self.metrics.extend(metrics)
 
-    def _send(self, data):
+        if len(self.metrics) > self.max_backlog:
+            self._throttle_error('TSDBHandler: Backlog full, dropping %d '
+                                 'oldest metrics',
+                                 len(self.metrics) - self.max_backlog)
+            self.metrics = self.metrics[-self.max_backlog:]
+
+    def _send_lines(self, metrics):
         """
-        Send data to TSDB. Data that can not be sent will be queued.
+        Send metrics as put lines in a single write. Returns whether they
+        were sent.
         """
+        data = ''.join(['put %s\n' % m for m in metrics])
         retry = self.RETRY
         # Attempt to send any data in the queue
         while retry > 0:
             # Check socket
             if not self.socket:
-                # Log Error
-                self.log.error("TSDBHandler: Socket unavailable.")
                 # Attempt to restablish connection
                 self._connect()
-                # Decrement retry
-                retry -= 1
-                # Try again
-                continue
+                if not self.socket:
+                    # Keep the metrics until TSDB is due to be tried again
+                    return False
             try:
                 # Send data to socket
                 self.socket.sendall(data)
                 # Done
-                break
+                return True
+            except QueueFull:
+                # Still sending earlier metrics, keep these for later
+                return False
             except socket.error, e:
                 # Log Error
                 self.log.error("TSDBHandler: Failed sending data. %s.", e)
@@ -153,13 +244,92 @@ class TSDBHandler(Handler):
                 retry -= 1
                 # try again
                 continue
+        return False
+
+    def _datapoint(self, metric_str):
+        """
+        Turn a formatted metric into an /api/put datapoint
+        """
+        parts = metric_str.split()
+        tags = dict(tag.split('=', 1) for tag in parts[3:] if '=' in tag)
+        return {
+            'metric': parts[0],
+            'timestamp': int(parts[1]),
+            'value': float(parts[2]),
+            'tags': tags,
+        }
+
+    def _send_http(self, metrics):
+        """
+        Post metrics to /api/put in requests of at most max_request_size
+        bytes. Returns the metrics that could not be sent.
+        """
+        start = 0
+        while start < len(metrics):
+            # Fill a request body up to max_request_size
+            points = []
+            size = 2
+            end = start
+            while end < len(metrics):
+                point = json.dumps(self._datapoint(metrics[end]))
+                if points and size + len(point) + 1 > self.max_request_size:
+                    break
+                points.append(point)
+                size += len(point) + 1
+                end += 1
+
+            if not self._post('[' + ','.join(points) + ']'):
+                return metrics[start:]
+            start = end
+
+        return []
+
+    def _post(self, body):
+        """
+        Post a request body to TSDB, reusing the connection. Returns False
+        if it should be tried again later.
+        """
+        try:
+            status = self.http.post(body)
+        except (httplib.HTTPException, socket.error), e:
+            self._throttle_error('TSDBHandler: Failed sending data. %s.', e)
+            return False
+
+        if status >= 500:
+            self._throttle_error('TSDBHandler: %s returned %d',
+                                 self.http_path, status)
+            return False
+        if status >= 400:
+            # TSDB rejected (some of) the datapoints, sending them again
+            # won't help
+            self._throttle_error('TSDBHandler: %s returned %d, dropping '
+                                 'batch', self.http_path, status)
+        else:
+            self._reset_errors()
+        return True
 
     def _connect(self):
         """
-        Connect to the TSDB server
+        Connect to the TSDB server, unless it was found down and is not due
+        to be tried again yet
         """
+        if not self.breaker.allow():
+            return
+        try:
+            address = self._getaddrinfo(self.host, self.port, socket.AF_INET,
+                                        socket.SOCK_STREAM)[0][4]
+        except socket.gaierror, ex:
+            self._throttle_error("TSDBHandler: Error looking up %s. %s",
+                                 self.host, ex)
+            self.breaker.failure()
+            return
         # Create socket
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if self.transport == 'nonblocking':
+            self.socket = Connection(socket.AF_INET, socket.SOCK_STREAM,
+                                     breaker=self.breaker,
+                                     high_water=self.high_water)
+        else:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         if socket is None:
             # Log Error
             self.log.error("TSDBHandler: Unable to create socket.")
@@ -170,22 +340,33 @@ class TSDBHandler(Handler):
         self.socket.settimeout(self.timeout)
         # Connect to graphite server
         try:
-            self.socket.connect((self.host, self.port))
+            self.socket.connect(address)
             # Log
             self.log.debug("Established connection to TSDB server %s:%d",
                            self.host, self.port)
+            if self.transport != 'nonblocking':
+                # The connection tells the breaker once it is made
+                self.breaker.success()
         except Exception, ex:
             # Log Error
-            self.log.error("TSDBHandler: Failed to connect to %s:%i. %s",
-                           self.host, self.port, ex)
+            self._throttle_error("TSDBHandler: Failed to connect to %s:%i. %s",
+                                 self.host, self.port, ex)
+            self.breaker.failure()
             # Close Socket
             self._close()
             return
 
     def _close(self):
         """
-        Close the socket
+        Close the socket and the http connection. Put lines a failed
+        connection had not sent go back in the backlog.
         """
         if self.socket is not None:
+            if isinstance(self.socket, Connection):
+                data = ''.join(self.socket.take_unsent())
+                self.metrics[:0] = [line[len('put '):]
+                                    for line in data.splitlines()]
             self.socket.close()
         self.socket = None
+        if self.http is not None:
+            self.http.close()
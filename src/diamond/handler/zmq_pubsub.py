@@ -2,9 +2,15 @@
 
 """
 Output the collected values to a Zer0MQ pub/sub channel
+
+Each metric is published as its own message unless `batch` is above 1. Then
+metrics are buffered and published `batch` at a time, and at the end of
+every collector run, as messages of up to `max_frame_size` bytes with one
+line per metric. diamond.handler.framing.decode() reads both.
 """
 
 from Handler import Handler
+from framing import frames
 
 try:
     import zmq
@@ -38,6 +44,9 @@ class zmqHandler (Handler):
 
         # Initialize Options
         self.port = int(self.config['port'])
+        self.batch_size = int(self.config['batch'])
+        self.max_frame_size = int(self.config['max_frame_size'])
+        self.lines = []
 
         # Create ZMQ pub socket and bind
         self._bind()
@@ -50,6 +59,10 @@ class zmqHandler (Handler):
 
         config.update({
             'port': '',
+            'batch': 'How many metrics to publish in one go. 1 publishes'
+                     ' each metric as its own message',
+            'max_frame_size': 'The largest message to publish in batch mode,'
+                              ' in bytes',
         })
 
         return config
@@ -62,6 +75,8 @@ class zmqHandler (Handler):
 
         config.update({
             'port': 1234,
+            'batch': 1,
+            'max_frame_size': 65536,
         })
 
         return config
@@ -88,5 +103,27 @@ class zmqHandler (Handler):
         """
         if not zmq:
             return
-        # Send the data as ......
-        self.socket.send("%s" % str(metric))
+        if self.batch_size <= 1:
+            # Send the data as ......
+            self.socket.send("%s" % str(metric))
+            return
+
+        self.lines.append(str(metric))
+        if len(self.lines) >= self.batch_size:
+            self._publish()
+
+    def flush(self):
+        """
+          Publish the buffered metrics
+        """
+        if not zmq:
+            return
+        self._publish()
+
+    def _publish(self):
+        """
+          Publish the buffered metrics in as few messages as fit
+        """
+        for frame in frames(self.lines, self.max_frame_size):
+            self.socket.send(frame)
+        self.lines = []
@@ -3,8 +3,14 @@
 import time
 import re
 import logging
+import math
+import struct
+from array import array
 from error import DiamondException
 
+# The graphite line format for each precision, built once per precision
+LINE_FORMATS = {}
+
 
 class Metric(object):
     # This saves a significant amount of memory per object. This only matters
@@ -13,7 +19,7 @@ class Metric(object):
     # handlers to flush.
     __slots__ = [
         'path', 'value', 'raw_value', 'timestamp', 'precision',
-        'host', 'metric_type', 'ttl'
+        'host', 'metric_type', 'ttl', '_parts'
         ]
 
     def __init__(self, path, value, raw_value=None, timestamp=None, precision=0,
@@ -69,6 +75,9 @@ class Metric(object):
         self.host = host
         self.metric_type = metric_type
         self.ttl = ttl
+        # Path prefix, collector path and metric path, parsed from path when
+        # a handler first asks for them and shared by every handler after it
+        self._parts = None
 
     def __repr__(self):
         """
@@ -79,20 +88,25 @@ class Metric(object):
             log.warn('Metric %s does not have a valid precision', self.path)
             self.precision = 0
 
-        # Set the format string
-        fstring = "%%s %%0.%if %%i\n" % self.precision
+        try:
+            fstring = LINE_FORMATS[self.precision]
+        except KeyError:
+            fstring = LINE_FORMATS[self.precision] = (
+                "%%s %%0.%if %%i\n" % self.precision)
 
         # Return formated string
         return fstring % (self.path, self.value, self.timestamp)
 
     def __getstate__(self):
+        # The parsed path parts are cheaper to recompute than to pickle
         return dict(
             (slot, getattr(self, slot))
             for slot in self.__slots__
-            if hasattr(self, slot)
+            if slot != '_parts' and hasattr(self, slot)
         )
 
     def __setstate__(self, state):
+        self._parts = None
         for slot, value in state.items():
             setattr(self, slot, value)
 
@@ -115,19 +129,38 @@ class Metric(object):
             raise DiamondException(
                 "Metric could not be parsed from string: %s." % string)
 
+    def _path_parts(self):
+        """
+        Return the cached [path, host, prefix, collector path, metric path]
+        list, starting a new one if the path or host changed since it was
+        filled in. Each part is None until its getter first computes it.
+        """
+        parts = self._parts
+        if parts is None or parts[0] is not self.path or \
+                parts[1] is not self.host:
+            parts = self._parts = [self.path, self.host, None, None, None]
+        return parts
+
     def getPathPrefix(self):
         """
             Returns the path prefix path
             servers.host.cpu.total.idle
             return "servers"
         """
+        parts = self._path_parts()
+        if parts[2] is not None:
+            return parts[2]
+
         # If we don't have a host name, assume it's just the first part of the
         # metric path
         if self.host is None:
-            return self.path.split('.')[0]
+            prefix = self.path.split('.')[0]
+        else:
+            offset = self.path.index(self.host) - 1
+            prefix = self.path[0:offset]
 
-        offset = self.path.index(self.host) - 1
-        return self.path[0:offset]
+        parts[2] = prefix
+        return prefix
 
     def getCollectorPath(self):
         """
@@ -135,15 +168,22 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "cpu"
         """
+        parts = self._path_parts()
+        if parts[3] is not None:
+            return parts[3]
+
         # If we don't have a host name, assume it's just the third part of the
         # metric path
         if self.host is None:
-            return self.path.split('.')[2]
+            collector = self.path.split('.')[2]
+        else:
+            offset = self.path.index(self.host)
+            offset += len(self.host) + 1
+            endoffset = self.path.index('.', offset)
+            collector = self.path[offset:endoffset]
 
-        offset = self.path.index(self.host)
-        offset += len(self.host) + 1
-        endoffset = self.path.index('.', offset)
-        return self.path[offset:endoffset]
+        parts[3] = collector
+        return collector
 
     def getMetricPath(self):
         """
@@ -151,14 +191,232 @@ class Metric(object):
             servers.host.cpu.total.idle
             return "total.idle"
         """
+        parts = self._path_parts()
+        if parts[4] is not None:
+            return parts[4]
+
         # If we don't have a host name, assume it's just the fourth+ part of the
         # metric path
         if self.host is None:
-            path = self.path.split('.')[3:]
-            return '.'.join(path)
+            path = '.'.join(self.path.split('.')[3:])
+        else:
+            offset = (len(self.getPathPrefix()) + len(self.host) +
+                      len(self.getCollectorPath()) + 3)
+            path = self.path[offset:]
+
+        parts[4] = path
+        return path
+
+
+class MetricBatch(object):
+    """
+    A batch of metrics stored as parallel arrays instead of one Metric object
+    per datapoint, so it can be pickled as a single string when moving
+    between processes.
+
+    Paths are split at their last dot and the part before it is interned, so
+    paths sharing a parent (servers.host.cpu.cpu0) only store it once. Hosts
+    are interned the same way. Values, raw values and TTLs are stored as
+    doubles, so integers are only kept exactly up to 2 ** 53. Unicode paths
+    and hosts, from collectors parsing JSON, are stored as UTF-8 and come
+    back as unicode.
+
+    Iterating over a batch creates the Metric objects as they are needed.
+    """
+    __slots__ = [
+        'prefixes', 'hosts', 'names', 'prefix_ids', 'host_ids', 'values',
+        'raw_values', 'timestamps', 'precisions', 'flags', 'ttls',
+        '_prefix_index', '_host_index',
+        ]
+
+    # Bits in flags
+    GAUGE = 1
+    VALUE_INT = 2
+    RAW_VALUE = 4
+    RAW_VALUE_INT = 8
+
+    HEADER = struct.Struct('!IIIII')
+    COLUMNS = (('prefix_ids', 'I'), ('host_ids', 'I'), ('values', 'd'),
+               ('raw_values', 'd'), ('timestamps', 'l'), ('precisions', 'b'),
+               ('flags', 'B'), ('ttls', 'd'))
+
+    def __init__(self, metrics=None):
+        """
+        Create a new, optionally pre-filled, MetricBatch
+        """
+        self.prefixes = []
+        self._prefix_index = {}
+        self.hosts = []
+        self._host_index = {}
+        self.names = []
+        for column, typecode in self.COLUMNS:
+            setattr(self, column, array(typecode))
+
+        if metrics is not None:
+            self.extend(metrics)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _intern(self, value, values, index):
+        try:
+            return index[value]
+        except KeyError:
+            index[value] = len(values)
+            values.append(value)
+            return index[value]
+
+    def append(self, metric):
+        """
+        Add a Metric to the batch
+        """
+        prefix, _, name = metric.path.rpartition('.')
+        self.prefix_ids.append(
+            self._intern(prefix, self.prefixes, self._prefix_index))
+        self.names.append(name)
+        self.host_ids.append(
+            self._intern(metric.host or '', self.hosts, self._host_index))
 
-        prefix = '.'.join([self.getPathPrefix(), self.host,
-                           self.getCollectorPath()])
+        flags = 0
+        if metric.metric_type == 'GAUGE':
+            flags |= self.GAUGE
+        if isinstance(metric.value, (int, long)):
+            flags |= self.VALUE_INT
+        self.values.append(metric.value)
 
-        offset = len(prefix) + 1
-        return self.path[offset:]
+        raw_value = metric.raw_value
+        if raw_value is not None:
+            flags |= self.RAW_VALUE
+            if isinstance(raw_value, (int, long)):
+                flags |= self.RAW_VALUE_INT
+            self.raw_values.append(float(raw_value))
+        else:
+            self.raw_values.append(0.0)
+
+        self.flags.append(flags)
+        self.timestamps.append(metric.timestamp)
+        if isinstance(metric.precision, (int, long)):
+            self.precisions.append(metric.precision)
+        else:
+            self.precisions.append(0)
+        if metric.ttl is None:
+            self.ttls.append(float('nan'))
+        else:
+            self.ttls.append(metric.ttl)
+
+    def extend(self, metrics):
+        """
+        Add a list of Metrics to the batch
+        """
+        for metric in metrics:
+            self.append(metric)
+
+    def __iter__(self):
+        """
+        Yield each metric in the batch as a Metric
+        """
+        prefixes = self.prefixes
+        hosts = self.hosts
+        for i in xrange(len(self.names)):
+            flags = self.flags[i]
+
+            metric = Metric.__new__(Metric)
+            metric._parts = None
+            prefix = prefixes[self.prefix_ids[i]]
+            if prefix:
+                metric.path = prefix + '.' + self.names[i]
+            else:
+                metric.path = self.names[i]
+
+            value = self.values[i]
+            if flags & self.VALUE_INT:
+                value = int(value)
+            metric.value = value
+
+            if flags & self.RAW_VALUE:
+                raw_value = self.raw_values[i]
+                if flags & self.RAW_VALUE_INT:
+                    raw_value = int(raw_value)
+                metric.raw_value = raw_value
+            else:
+                metric.raw_value = None
+
+            metric.timestamp = self.timestamps[i]
+            metric.precision = self.precisions[i]
+            metric.host = hosts[self.host_ids[i]] or None
+            if flags & self.GAUGE:
+                metric.metric_type = 'GAUGE'
+            else:
+                metric.metric_type = 'COUNTER'
+            ttl = self.ttls[i]
+            if math.isnan(ttl):
+                metric.ttl = None
+            else:
+                metric.ttl = ttl
+
+            yield metric
+
+    def serialize(self):
+        """
+        Return the whole batch as a single string
+        """
+        strings = self.prefixes + self.hosts + self.names
+        # Indices of the strings to decode again when loaded
+        unicode_ids = array('I', [i for i, string in enumerate(strings)
+                                  if isinstance(string, unicode)])
+        for i in unicode_ids:
+            strings[i] = strings[i].encode('utf-8')
+        strings = '\n'.join(strings)
+        return ''.join(
+            [self.HEADER.pack(len(self.names), len(self.prefixes),
+                              len(self.hosts), len(unicode_ids),
+                              len(strings)),
+             strings, unicode_ids.tostring()] +
+            [getattr(self, column).tostring()
+             for column, typecode in self.COLUMNS])
+
+    @classmethod
+    def deserialize(cls, data):
+        """
+        Create a MetricBatch from a string returned by serialize
+        """
+        batch = cls()
+        batch._load(data)
+        return batch
+
+    def _load(self, data):
+        (count, nprefixes, nhosts, nunicode,
+         length) = self.HEADER.unpack_from(data)
+        offset = self.HEADER.size
+
+        if count:
+            strings = data[offset:offset + length].split('\n')
+        else:
+            strings = []
+        offset += length
+        unicode_ids = array('I')
+        size = unicode_ids.itemsize * nunicode
+        unicode_ids.fromstring(data[offset:offset + size])
+        offset += size
+        for i in unicode_ids:
+            strings[i] = strings[i].decode('utf-8')
+        self.prefixes = strings[:nprefixes]
+        self.hosts = strings[nprefixes:nprefixes + nhosts]
+        self.names = strings[nprefixes + nhosts:]
+        self._prefix_index = dict(
+            (prefix, i) for i, prefix in enumerate(self.prefixes))
+        self._host_index = dict(
+            (host, i) for i, host in enumerate(self.hosts))
+
+        for column, typecode in self.COLUMNS:
+            values = array(typecode)
+            size = values.itemsize * count
+            values.fromstring(data[offset:offset + size])
+            offset += size
+            setattr(self, column, values)
+
+    def __getstate__(self):
+        return self.serialize()
+
+    def __setstate__(self, state):
+        self._load(state)
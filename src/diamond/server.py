@@ -7,11 +7,6 @@ import signal
 import sys
 import time
 
-try:
-    from setproctitle import getproctitle, setproctitle
-except ImportError:
-    setproctitle = None
-
 # Path Fix
 sys.path.append(
     os.path.abspath(
@@ -50,17 +45,7 @@ class Server(object):
         self.handler_queue = []
         self.modules = {}
         self.metric_queue = None
-
-        # We do this weird process title swap around to get the sync manager
-        # title correct for ps
-        if setproctitle:
-            oldproctitle = getproctitle()
-            setproctitle('%s - SyncManager' % getproctitle())
-        self.manager = multiprocessing.Manager()
-        if setproctitle:
-            setproctitle(oldproctitle)
-        self.metric_queue = self.manager.Queue(maxsize=16384)
-        self.metric_queue_full = self.manager.Event()
+        self.metric_queue_full = multiprocessing.Event()
 
     def run(self):
         """
@@ -75,13 +60,19 @@ class Server(object):
         collectors = load_collectors(self.config['server']['collectors_path'])
         metric_queue_size = int(self.config['server'].get('metric_queue_size',
                                                           16384))
-        self.metric_queue = self.manager.Queue(maxsize=metric_queue_size)
+        metric_batch_size = int(self.config['server'].get('metric_batch_size',
+                                                          256))
+        # Collectors send their metrics as batches over a pipe backed queue,
+        # so each queue entry holds up to metric_batch_size metrics
+        self.metric_queue = multiprocessing.Queue(maxsize=metric_queue_size)
         self.log.debug('metric_queue_size: %d', metric_queue_size)
+        self.log.debug('metric_batch_size: %d', metric_batch_size)
 
         #######################################################################
         # Handlers
         #
-        # TODO: Eventually move each handler to it's own process space?
+        # All handlers share one process, each on its own thread fed from a
+        # bounded buffer (see diamond.utils.worker)
         #######################################################################
 
         if 'handlers_path' in self.config['server']:
@@ -115,7 +106,9 @@ class Server(object):
         )
 
         self.handler_queue = QueueHandler(
-            config=self.config, queue=self.metric_queue, log=self.log, should_exit=self.metric_queue_full)
+            config=self.config, queue=self.metric_queue, log=self.log,
+            should_exit=self.metric_queue_full,
+            batch_size=metric_batch_size)
 
         handlers_process = multiprocessing.Process(
             name="Handlers",
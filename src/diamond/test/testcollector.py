@@ -3,7 +3,11 @@
 ##########################################################################
 
 from test import unittest
+from mock import Mock
 import configobj
+import signal
+import threading
+import time
 
 from diamond.collector import Collector
 
@@ -32,3 +36,178 @@ class BaseCollectorTest(unittest.TestCase):
         }
         c = Collector(config, [])
         self.assertEquals('custom.localhost', c.get_hostname())
+
+    def test_MetricPathCacheResetOnConfigLoad(self):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = {
+            'hostname': 'custom.localhost',
+        }
+        c = Collector(config, [])
+        self.assertEquals('servers.custom.localhost.Collector.cpu.idle',
+                          c.get_metric_path('cpu.idle'))
+        self.assertEquals('instances.vm1.Collector.cpu.idle',
+                          c.get_metric_path('cpu.idle', instance='vm1'))
+
+        config['collectors']['default']['hostname'] = 'other.localhost'
+        config['collectors']['default']['path_suffix'] = 'suffix'
+        c.load_config(override_config=config)
+        self.assertEquals(
+            'servers.other.localhost.suffix.Collector.cpu.idle',
+            c.get_metric_path('cpu.idle'))
+
+    def test_PublishManyHandsOneBatchToHandlers(self):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = {
+            'hostname': 'custom.localhost',
+            'metrics_blacklist': '^cpu\\.skip',
+        }
+        handler = Mock()
+        c = Collector(config, [handler])
+
+        c.publish_many({'cpu.idle': 1, 'cpu.user': 2, 'cpu.skip': 3})
+        self.assertEquals(handler._process_batch.call_count, 1)
+        self.assertEquals(handler._process.call_count, 0)
+        metrics = handler._process_batch.call_args[0][0]
+        self.assertEquals(
+            sorted((m.path, m.value, m.metric_type) for m in metrics),
+            [('servers.custom.localhost.Collector.cpu.idle', 1, 'GAUGE'),
+             ('servers.custom.localhost.Collector.cpu.user', 2, 'GAUGE')])
+
+        c.publish_counters({'cpu.total': 10})
+        c.publish_counters({'cpu.total': 20}, time_delta=False)
+        metric = handler._process_batch.call_args[0][0][0]
+        self.assertEquals((metric.value, metric.raw_value, metric.metric_type),
+                          (10, 20, 'COUNTER'))
+
+    def test_CollectInstancesConcurrently(self):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = {
+            'hostname': 'custom.localhost',
+            'max_concurrency': 4,
+            'instance_timeout': 0.3,
+        }
+        handler = Mock()
+        c = Collector(config, [handler])
+        hung = threading.Event()
+
+        def collect(name, delay):
+            if name == 'broken':
+                raise ValueError('broken')
+            if name == 'hung':
+                hung.wait(5)
+            time.sleep(delay)
+            c.publish(name, 1)
+
+        start = time.time()
+        c.collect_instances(collect, [('slow', 0.1), ('hung', 0),
+                                      ('broken', 0), ('fast', 0)])
+        hung.set()
+
+        # The instances ran side by side and the hung one was given up on
+        self.assertTrue(time.time() - start < 1)
+        self.assertEquals(handler._process.call_count, 0)
+        self.assertEquals(
+            [call[0][0][0].path
+             for call in handler._process_batch.call_args_list],
+            ['servers.custom.localhost.Collector.fast',
+             'servers.custom.localhost.Collector.slow'])
+
+    def test_CollectInstancesPublishedBeforeAlarm(self):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = {
+            'hostname': 'custom.localhost',
+            'max_concurrency': 3,
+            'instance_timeout': 10,
+        }
+        handler = Mock()
+        c = Collector(config, [handler])
+        hung = threading.Event()
+
+        def collect(name):
+            if name == 'hung':
+                hung.wait(5)
+            elif name == 'late':
+                # Published only if fast's metrics were handed over first
+                for i in range(30):
+                    if handler._process_batch.called:
+                        break
+                    time.sleep(0.01)
+                else:
+                    return
+            c.publish(name, 1)
+
+        previous = signal.signal(signal.SIGALRM, lambda signum, frame: None)
+        try:
+            # collector_process gives the run half a second
+            signal.setitimer(signal.ITIMER_REAL, 0.5)
+            start = time.time()
+            c.collect_instances(collect, [('hung',), ('fast',), ('late',)])
+            self.assertTrue(time.time() - start < 0.5)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+            hung.set()
+
+        self.assertEquals(
+            [call[0][0][0].path
+             for call in handler._process_batch.call_args_list],
+            ['servers.custom.localhost.Collector.fast',
+             'servers.custom.localhost.Collector.late'])
+
+    def test_CollectInstancesTimeoutPerInstance(self):
+        config = configobj.ConfigObj()
+        config['server'] = {}
+        config['server']['collectors_config_path'] = ''
+        config['collectors'] = {}
+        config['collectors']['default'] = {
+            'hostname': 'custom.localhost',
+            'max_concurrency': 2,
+            'instance_timeout': 0.2,
+        }
+        handler = Mock()
+        c = Collector(config, [handler])
+        hung = threading.Event()
+        calls = []
+
+        def collect(name):
+            calls.append(name)
+            if name == 'hung':
+                hung.wait(5)
+            else:
+                time.sleep(0.1)
+            c.publish(name, 1)
+
+        def published():
+            paths = [call[0][0][0].path.split('.')[-1]
+                     for call in handler._process_batch.call_args_list]
+            handler._process_batch.reset_mock()
+            return paths
+
+        instances = [('hung',), ('a',), ('b',), ('c',)]
+        # a, b and c share one thread slot for 0.3 seconds, each within
+        # its own timeout
+        c.collect_instances(collect, instances)
+        self.assertEquals(published(), ['a', 'b', 'c'])
+
+        # The hung instance is still running, so it is not polled again and
+        # what it publishes late is dropped
+        c.collect_instances(collect, instances)
+        hung.set()
+        c.instance_threads['hung'].join(5)
+        self.assertEquals(published(), ['a', 'b', 'c'])
+        self.assertEquals(calls.count('hung'), 1)
+
+        c.collect_instances(collect, instances)
+        self.assertEquals(published(), ['hung', 'a', 'b', 'c'])
@@ -2,9 +2,12 @@
 # coding=utf-8
 ##########################################################################
 
+import cPickle as pickle
+
 from test import unittest
 
 from diamond.metric import Metric
+from diamond.metric import MetricBatch
 
 
 class TestMetric(unittest.TestCase):
@@ -84,6 +87,26 @@ class TestMetric(unittest.TestCase):
         message = 'Actual %s, expected %s' % (actual_value, expected_value)
         self.assertEqual(actual_value, expected_value, message)
 
+    def test_path_parts_cached(self):
+        metric = Metric('servers.com.example.www.cpu.total.idle',
+                        0,
+                        host='com.example.www')
+        self.assertEqual(metric.getMetricPath(), 'total.idle')
+        self.assertEqual(metric._parts[2:], ['servers', 'cpu', 'total.idle'])
+        self.assertTrue(metric.getCollectorPath() is metric._parts[3])
+
+        # Changing the path starts over
+        metric.path = 'servers.com.example.www.memory.free'
+        self.assertEqual(metric.getPathPrefix(), 'servers')
+        self.assertEqual(metric.getCollectorPath(), 'memory')
+        self.assertEqual(metric.getMetricPath(), 'free')
+
+        loaded = pickle.loads(pickle.dumps(metric, -1))
+        self.assertEqual(loaded._parts, None)
+        self.assertEqual(loaded.getMetricPath(), 'free')
+        self.assertEqual(list(MetricBatch([metric]))[0].getCollectorPath(),
+                         'memory')
+
     def test_parse(self):
         metric = Metric('test.parse', 0)
 
@@ -111,3 +134,47 @@ class TestMetric(unittest.TestCase):
                 message = 'Actual %s, expected %s' % (actual_value,
                                                       expected_value)
                 self.assertEqual(actual_value, expected_value, message)
+
+    def test_batch_roundtrip(self):
+        metrics = [
+            Metric('servers.com.example.www.cpu.total.idle', 12.5,
+                   raw_value=100, timestamp=1234567, precision=1,
+                   host='com.example.www', metric_type='GAUGE', ttl=600),
+            Metric('servers.com.example.www.cpu.total.user', 3,
+                   timestamp=1234567, host='com.example.www',
+                   metric_type='COUNTER'),
+            Metric('nohost', 2 ** 40, raw_value=1.5, timestamp=1234568),
+        ]
+
+        batch = MetricBatch(metrics)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(len(batch.prefixes), 2)
+        self.assertEqual(len(batch.hosts), 2)
+
+        for data in (MetricBatch.deserialize(batch.serialize()),
+                     pickle.loads(pickle.dumps(batch, -1))):
+            loaded = list(data)
+            self.assertEqual([m.__getstate__() for m in loaded],
+                             [m.__getstate__() for m in metrics])
+            self.assertEqual([str(m) for m in loaded],
+                             [str(m) for m in metrics])
+            self.assertTrue(isinstance(loaded[1].value, int))
+
+    def test_batch_unicode_paths(self):
+        metrics = [
+            Metric(u'servers.host.elasticsearch.indices.caf\xe9.docs', 1,
+                   timestamp=1234567, host=u'host'),
+            Metric(u'servers.host.elasticsearch.indices.caf\xe9.size', 2,
+                   timestamp=1234567, host=u'host'),
+            Metric('servers.host.cpu.total.idle', 3, timestamp=1234567,
+                   host='host'),
+        ]
+
+        batch = MetricBatch(metrics)
+        for data in (MetricBatch.deserialize(batch.serialize()),
+                     pickle.loads(pickle.dumps(batch, -1))):
+            loaded = list(data)
+            self.assertEqual([(m.path, m.host) for m in loaded],
+                             [(m.path, m.host) for m in metrics])
+            self.assertEqual([type(m.path) for m in loaded],
+                             [unicode, unicode, str])
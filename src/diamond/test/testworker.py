@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# coding=utf-8
+##########################################################################
+
+from test import unittest
+from mock import Mock
+from mock import patch
+
+import configobj
+import time
+
+from diamond.handler.null import NullHandler
+from diamond.metric import Metric
+from diamond.utils.worker import HandlerWorker
+
+
+def get_worker(buffer_size, overflow_policy):
+    config = configobj.ConfigObj()
+    config['buffer_size'] = buffer_size
+    config['overflow_policy'] = overflow_policy
+    handler = NullHandler(config)
+    handler._throttle_error = Mock()
+    return HandlerWorker(handler, Mock())
+
+
+def buffered(worker):
+    return [m and m.path for m in list(worker.buffer.queue)]
+
+
+class HandlerWorkerTest(unittest.TestCase):
+
+    def test_drop_oldest(self):
+        worker = get_worker(2, 'drop_oldest')
+        for i in range(4):
+            worker.put(Metric('metric%d' % i, i, timestamp=123))
+
+        self.assertEqual(buffered(worker), ['metric2', 'metric3'])
+        self.assertEqual(worker.dropped, 2)
+
+    def test_drop_newest(self):
+        worker = get_worker(2, 'drop_newest')
+        for i in range(4):
+            worker.put(Metric('metric%d' % i, i, timestamp=123))
+        worker.put(None)
+
+        self.assertEqual(buffered(worker), ['metric0', 'metric1'])
+        self.assertEqual(worker.dropped, 2)
+
+    def test_flush_is_not_counted_as_dropped(self):
+        worker = get_worker(1, 'drop_oldest')
+        worker.put(None)
+        worker.put(Metric('metric0', 0, timestamp=123))
+
+        self.assertEqual(buffered(worker), ['metric0'])
+        self.assertEqual(worker.dropped, 0)
+
+    def test_flush_kept_when_full(self):
+        for policy in ('drop_oldest', 'drop_newest'):
+            worker = get_worker(2, policy)
+            worker.handler._process_batch = Mock()
+            worker.handler._flush = Mock()
+            for i in range(2):
+                worker.put(Metric('metric%d' % i, i, timestamp=123))
+            worker.put(None)
+            worker.put(Metric('metric2', 2, timestamp=123))
+
+            worker.start()
+            for i in range(50):
+                if worker.handler._flush.called:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(worker.handler._flush.call_count, 1)
+            self.assertEqual(worker.dropped, 1)
+
+    @patch('diamond.utils.worker.BATCH_SIZE', 2)
+    def test_flush_after_metrics_ahead(self):
+        # Flush marker queued, and left out of a full buffer
+        for buffer_size in (6, 5):
+            worker = get_worker(buffer_size, 'drop_newest')
+            events = []
+            worker.handler._process_batch = lambda metrics: events.append(
+                [m.path for m in metrics])
+            worker.handler._flush = lambda: events.append('flush')
+            for i in range(5):
+                worker.put(Metric('metric%d' % i, i, timestamp=123))
+            worker.put(None)
+
+            worker.start()
+            for i in range(50):
+                if 'flush' in events:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(events, [['metric0', 'metric1'],
+                                      ['metric2', 'metric3'],
+                                      ['metric4'], 'flush'])
+            self.assertEqual(worker.dropped, 0)
+
+    def test_unknown_policy(self):
+        self.assertRaises(Exception, get_worker, 2, 'drop_everything')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -7,6 +7,7 @@ import os
 import random
 import sys
 import signal
+import Queue
 
 try:
     from setproctitle import getproctitle, setproctitle
@@ -17,6 +18,8 @@ from diamond.utils.signals import signal_to_exception
 from diamond.utils.signals import SIGALRMException
 from diamond.utils.signals import SIGHUPException
 
+from diamond.utils.worker import HandlerWorker
+
 
 def collector_process(collector, metric_queue, log):
     """
@@ -100,17 +103,37 @@ def collector_process(collector, metric_queue, log):
             break
 
 
-def handler_process(handlers, metric_queue, log):
+def handler_process(handlers, metric_queue, log, max_drain=64):
     proc = multiprocessing.current_process()
     if setproctitle:
         setproctitle('%s - %s' % (getproctitle(), proc.name))
 
     log.debug('Starting process %s', proc.name)
 
+    # Each handler runs on its own thread with its own bounded buffer
+    workers = []
+    for handler in handlers:
+        worker = HandlerWorker(handler, log)
+        worker.start()
+        workers.append(worker)
+
     while(True):
-        metric = metric_queue.get(block=True, timeout=None)
-        for handler in handlers:
-            if metric is not None:
-                handler._process(metric)
-            else:
-                handler._flush()
+        # Wait for a batch, then drain whatever else is already waiting so
+        # the handlers are only flushed once for all of it
+        batches = [metric_queue.get(block=True, timeout=None)]
+        try:
+            while len(batches) < max_drain:
+                batches.append(metric_queue.get(block=False))
+        except Queue.Empty:
+            pass
+
+        flush = False
+        for batch, batch_flush in batches:
+            for metric in batch:
+                for worker in workers:
+                    worker.put(metric)
+            flush = flush or batch_flush
+
+        if flush:
+            for worker in workers:
+                worker.put(None)
@@ -0,0 +1,121 @@
+# coding=utf-8
+
+"""
+Runs a handler on its own thread, fed from a bounded buffer, so a slow or
+hung sink only backs up its own buffer instead of every other handler.
+"""
+
+import Queue
+import threading
+
+from diamond.error import DiamondException
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+# Maximum number of buffered metrics handed to a handler at once
+BATCH_SIZE = 1024
+
+
+class HandlerWorker(threading.Thread):
+    """
+    Consumes metrics for a single handler from a bounded buffer. A None in the
+    buffer asks the handler to flush. When there is no room for it, the flush
+    is run once the worker has handed over everything that was buffered ahead
+    of it, so a flush is not lost when the buffer is full.
+    """
+
+    def __init__(self, handler, log):
+        threading.Thread.__init__(self, name=handler.__class__.__name__)
+        self.daemon = True
+
+        self.handler = handler
+        self.log = log
+
+        buffer_size = int(handler.config['buffer_size'])
+        self.overflow_policy = handler.config['overflow_policy'].lower()
+        if self.overflow_policy not in OVERFLOW_POLICIES:
+            raise DiamondException('%s: unknown overflow_policy %r' % (
+                self.name, self.overflow_policy))
+
+        self.buffer = Queue.Queue(maxsize=buffer_size)
+        self.dropped = 0
+        # Metrics left to hand over before the flush of a None that did not
+        # make it into the buffer, or None
+        self.flush_after = None
+        self.flush_lock = threading.Lock()
+
+    def put(self, metric):
+        """
+        Add a metric, or None for a flush, to the buffer applying the
+        handler's overflow policy when it is full
+        """
+        if self.overflow_policy == 'block':
+            self.buffer.put(metric, block=True)
+            return
+
+        try:
+            self.buffer.put(metric, block=False)
+            return
+        except Queue.Full:
+            pass
+
+        if metric is None:
+            self._defer_flush()
+            return
+
+        if self.overflow_policy == 'drop_oldest':
+            try:
+                if self.buffer.get(block=False) is None:
+                    self._defer_flush()
+                else:
+                    self._drop()
+            except Queue.Empty:
+                pass
+            try:
+                self.buffer.put(metric, block=False)
+                return
+            except Queue.Full:
+                pass
+
+        self._drop()
+
+    def _defer_flush(self):
+        with self.flush_lock:
+            # At most a full buffer was queued ahead of the flush
+            self.flush_after = self.buffer.maxsize
+
+    def _drop(self):
+        self.dropped += 1
+        self.handler._throttle_error(
+            '%s: buffer full, %d metrics dropped so far',
+            self.name, self.dropped)
+
+    def run(self):
+        while True:
+            # Hand everything already buffered, up to the next flush, to the
+            # handler as one batch
+            metrics = []
+            drained = False
+            metric = self.buffer.get(block=True)
+            while metric is not None:
+                metrics.append(metric)
+                if len(metrics) >= BATCH_SIZE:
+                    break
+                try:
+                    metric = self.buffer.get(block=False)
+                except Queue.Empty:
+                    drained = True
+                    break
+
+            if metrics:
+                self.handler._process_batch(metrics)
+
+            flush = metric is None
+            with self.flush_lock:
+                if self.flush_after is not None:
+                    self.flush_after -= len(metrics)
+                    if self.flush_after <= 0 or drained:
+                        self.flush_after = None
+                        flush = True
+            if flush:
+                self.handler._flush()
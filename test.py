@@ -47,6 +47,38 @@ def run_only(func, predicate):
         return f
 
 
+def get_published_calls(mock):
+    """
+    Returns the calls made to a mocked publish method, with calls to
+    publish_many / publish_counters split into one call per metric
+    """
+    calls = []
+    for c in mock.call_args_list:
+        if c[0] and isinstance(c[0][0], dict):
+            for name, value in c[0][0].iteritems():
+                calls.append(((name, value), c[1]))
+        else:
+            calls.append(c)
+    return calls
+
+
+def run_in_child(function):
+    """
+    Calls function in a forked child process and waits for it to exit, for
+    tests of what survives the fork into the handler process. Returns the
+    exit status, non-zero if function raised.
+    """
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            function()
+            status = 0
+        finally:
+            os._exit(status)
+    return os.waitpid(pid, 0)[1]
+
+
 def get_collector_config(key, value):
     config = configobj.ConfigObj()
     config['server'] = {}
@@ -137,11 +169,13 @@ class CollectorTestCase(unittest.TestCase):
     def assertPublished(self, mock, key, value, expected_value=1):
         if type(mock) is list:
             for m in mock:
-                calls = (filter(lambda x: x[0][0] == key, m.call_args_list))
+                calls = (filter(lambda x: x[0][0] == key,
+                                get_published_calls(m)))
                 if len(calls) > 0:
                     break
         else:
-            calls = filter(lambda x: x[0][0] == key, mock.call_args_list)
+            calls = filter(lambda x: x[0][0] == key,
+                           get_published_calls(mock))
 
         actual_value = len(calls)
         message = '%s: actual number of calls %d, expected %d' % (